@@ -0,0 +1,88 @@
+"""
+Micro-benchmarks of the extraction layer against a full html.parser tree,
+using the fixture pages in tests/fixtures. Those are hand-written stand-ins
+shaped like replayed pages, not recorded captures, so the timings compare
+the two approaches and do not predict the speed up on real archive pages
+
+    python benchmarks/bench_extract.py [--number N]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from playstvrecovery.extract import (  # noqa: E402
+    find_ld_json_videos,
+    find_user_id,
+    find_video_items,
+    find_video_sources,
+)
+
+fixtures_path = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixtures_path, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def tree_user_id(page: str) -> str:
+    soup = BeautifulSoup(page, "html.parser")
+    return soup.find("button", {"title": "Add Friend"}).attrs["data-obj-id"]
+
+
+def tree_ld_json_videos(page: str) -> list[dict]:
+    soup = BeautifulSoup(page, "html.parser")
+    return [
+        json.loads(x.string)
+        for x in soup.find_all("script", type="application/ld+json")
+    ][0]["video"]
+
+
+def tree_video_sources(page: str) -> list[dict]:
+    soup = BeautifulSoup(page, "html.parser")
+    return [x.attrs for x in soup.find("video").find_all("source")]
+
+
+def tree_video_items(body: str) -> list[tuple[str, str]]:
+    soup = BeautifulSoup(body, "html.parser")
+    return [
+        (x.attrs["data-feed-id"], x.find("a", {"class": "title"}).text)
+        for x in soup.find_all("li", {"class": "video-item"})
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=50)
+    args = parser.parse_args()
+
+    profile = read_fixture("profile.html")
+    embed = read_fixture("embed.html")
+    module_body = json.loads(read_fixture("module.json"))["body"]
+
+    cases = [
+        ("user id", profile, tree_user_id, find_user_id),
+        ("ld+json videos", profile, tree_ld_json_videos, find_ld_json_videos),
+        ("video sources", embed, tree_video_sources, find_video_sources),
+        ("video items", module_body, tree_video_items, find_video_items),
+    ]
+
+    print(f"{'page shape':<16}{'tree ms':>10}{'fast ms':>10}{'speedup':>10}")
+    for name, page, tree, fast in cases:
+        assert tree(page) == fast(page), f"{name} results differ"
+        tree_time = timeit.timeit(lambda: tree(page), number=args.number)
+        fast_time = timeit.timeit(lambda: fast(page), number=args.number)
+        print(
+            f"{name:<16}{tree_time / args.number * 1000:>10.3f}"
+            f"{fast_time / args.number * 1000:>10.3f}{tree_time / fast_time:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
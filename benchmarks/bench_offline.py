@@ -0,0 +1,325 @@
+"""
+Throughput and latency of every stage of a recovery (pagination,
+availability, parsing and downloads) against the local stand-in of
+benchmarks/fakeserver.py, so runs are repeatable and need no network.
+Every run is appended to --results (benchmarks/results.jsonl, kept out of
+git as its timings belong to one machine) with the version and commit it
+measured, and compared with the last run of the same settings
+
+    python benchmarks/bench_offline.py [--videos 200] [--latency-ms 20]
+        [--bandwidth-mbps 0] [--throttle 0] [--workers 4] [--segments 1]
+        [--raw] [--label NAME] [--results FILE] [--no-record]
+"""
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import io
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from threading import Lock
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from playstvrecovery.extract import (  # noqa: E402
+    find_ld_json_videos,
+    find_user_id,
+    find_video_items,
+    find_video_sources,
+)
+from playstvrecovery import cli, playstv, session, wayback  # noqa: E402
+from fakeserver import FakeArchive  # noqa: E402
+
+root_path = os.path.join(os.path.dirname(__file__), "..")
+RESULTS_PATH: str = os.path.join(os.path.dirname(__file__), "results.jsonl")
+# Settings a run is compared on, runs differing in any of them are not
+COMPARED_SETTINGS: tuple[str, ...] = (
+    "videos",
+    "payload_kb",
+    "latency_ms",
+    "bandwidth_mbps",
+    "throttle",
+    "missing",
+    "workers",
+    "lookup_workers",
+    "segments",
+    "raw",
+)
+
+
+class LatencyRecorder:
+    """
+    Time to response headers of every request, grouped by the stage that
+    sent it
+    """
+
+    def __init__(self) -> None:
+        self.stage: str = str()
+        self.latencies: dict[str, list[float]] = {}
+        self.throttled: dict[str, int] = {}
+        self.__lock__: Lock = Lock()
+
+    def __call__(self, response, *args, **kwargs) -> None:
+        with self.__lock__:
+            self.latencies.setdefault(self.stage, []).append(
+                response.elapsed.total_seconds()
+            )
+            if response.status_code == 429:
+                self.throttled[self.stage] = self.throttled.get(self.stage, 0) + 1
+
+    def summary(self, stage: str) -> dict:
+        latencies = sorted(self.latencies.get(stage, []))
+        return {
+            "requests": len(latencies),
+            "throttled": self.throttled.get(stage, 0),
+            "p50_ms": percentile(latencies, 0.5) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+        }
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, math.ceil(share * len(values)) - 1)]
+
+
+def run_stage(recorder: LatencyRecorder, stage: str, run) -> tuple[float, object]:
+    """
+    Run a stage with its console output silenced, returns (seconds, result)
+    """
+    recorder.stage = stage
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = run()
+    return time.perf_counter() - started, result
+
+
+def bench_parsing(archive: FakeArchive, number: int) -> dict:
+    """
+    Pages per second of the extractors over the pages the stand-in serves
+    """
+    pages = [
+        ("profile", archive.profile_page(), parse_profile),
+        ("module", archive.module_page(archive.video_ids[0]), parse_module),
+        ("embed", archive.embed_page(archive.video_ids[0], raw=True), parse_embed),
+    ]
+    results = {}
+    for name, page, parse in pages:
+        seconds = timeit.timeit(lambda: parse(page), number=number)
+        results[f"{name}_per_s"] = number / seconds
+        results[f"{name}_ms"] = seconds / number * 1000
+    return results
+
+
+def parse_profile(page: str) -> None:
+    find_user_id(page)
+    find_ld_json_videos(page)
+
+
+def parse_module(page: str) -> None:
+    find_video_items(json.loads(page)["body"])
+
+
+def parse_embed(page: str) -> None:
+    find_video_sources(page)
+
+
+def run(args: argparse.Namespace) -> dict:
+    archive = FakeArchive(
+        videos=args.videos,
+        payload_size=args.payload_kb * 1024,
+        latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth_mbps * 1e6 / 8 or None,
+        throttle=args.throttle,
+        missing=args.missing,
+    )
+    base_url = archive.start()
+    wayback.set_base_url(base_url)
+    cli.configure_run(
+        pool_size=max(args.workers * args.segments, args.lookup_workers) + 2,
+        timeout=30,
+        user_agent=session.DEFAULT_USER_AGENT,
+        cache_dir=None,
+        cache_size=0,
+        rate=args.rate,
+        max_retries=args.max_retries,
+        raw=args.raw,
+        segments=args.segments,
+    )
+    playstv.set_progress_enabled(False)
+    recorder = LatencyRecorder()
+    session.get_session().hooks["response"].append(recorder)
+
+    stages: dict[str, dict] = {}
+    try:
+        seconds, user_profile = run_stage(
+            recorder, "profile", lambda: playstv.get_profile(archive.username)
+        )
+        if user_profile is None:
+            raise RuntimeError("The stand-in profile was not found")
+
+        def discover() -> None:
+            user_profile.get_user_id()
+            user_profile.get_initial_videos()
+
+        seconds += run_stage(recorder, "profile", discover)[0]
+        stages["profile"] = {"seconds": seconds, **recorder.summary("profile")}
+
+        seconds, _ = run_stage(recorder, "pagination", user_profile.get_more_videos)
+        summary = recorder.summary("pagination")
+        stages["pagination"] = {
+            "seconds": seconds,
+            "videos": len(user_profile.videos),
+            "pages_per_s": summary["requests"] / seconds,
+            **summary,
+        }
+
+        seconds, _ = run_stage(
+            recorder,
+            "availability",
+            lambda: user_profile.check_video_availability(args.lookup_workers),
+        )
+        summary = recorder.summary("availability")
+        stages["availability"] = {
+            "seconds": seconds,
+            "valid": len(user_profile.videos.valid),
+            "lookups_per_s": len(user_profile.videos) / seconds,
+            **summary,
+        }
+
+        stages["parsing"] = bench_parsing(archive, args.parse_number)
+
+        with tempfile.TemporaryDirectory() as output_path:
+            seconds, _ = run_stage(
+                recorder,
+                "downloads",
+                lambda: user_profile.download_videos(output_path, args.workers),
+            )
+            downloaded = sum(
+                os.path.getsize(os.path.join(output_path, x))
+                for x in os.listdir(output_path)
+                if x.endswith(".mp4")
+            )
+        succeeded = len([x for x in user_profile.videos if x.download_succeeded])
+        stages["downloads"] = {
+            "seconds": seconds,
+            "clips": succeeded,
+            "clips_per_s": succeeded / seconds,
+            "mb_per_s": downloaded / seconds / 1e6,
+            **recorder.summary("downloads"),
+        }
+    finally:
+        archive.stop()
+
+    stages["server"] = {"requests": archive.requests, "throttled": archive.throttled}
+    return stages
+
+
+def read_version() -> str:
+    with open(os.path.join(root_path, "playstvrecovery", "__init__.py")) as file:
+        match = re.search(r'__version__ = "([^"]+)"', file.read())
+    return match.group(1) if match is not None else "unknown"
+
+
+def read_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=root_path,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_result(path: str, settings: dict) -> dict | None:
+    """
+    Last recorded run with the same settings
+    """
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue
+            if all(
+                result.get("settings", {}).get(x) == settings.get(x)
+                for x in COMPARED_SETTINGS
+            ):
+                previous = result
+    return previous
+
+
+def print_report(result: dict, previous: dict | None) -> None:
+    if previous is not None:
+        print(
+            f"Compared with {previous['version']} "
+            f"({previous.get('commit') or 'unknown commit'}, {previous['time']})"
+        )
+    print(f"{'stage':<14}{'metric':<16}{'value':>12}{'change':>10}")
+    for stage, metrics in result["stages"].items():
+        if stage == "server":
+            continue
+        for metric, value in metrics.items():
+            change = ""
+            before = ((previous or {}).get("stages", {}).get(stage) or {}).get(metric)
+            if isinstance(before, (int, float)) and before:
+                change = f"{(value - before) / before:+.0%}"
+            print(f"{stage:<14}{metric:<16}{value:>12.2f}{change:>10}")
+    server = result["stages"]["server"]
+    print(f"Server requests: {server['requests']}, throttled: {server['throttled']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--videos", type=int, default=200)
+    parser.add_argument("--payload-kb", type=int, default=1024)
+    parser.add_argument("--latency-ms", type=float, default=20)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0)
+    parser.add_argument("--throttle", type=float, default=0)
+    parser.add_argument("--missing", type=float, default=0.1)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--lookup-workers", type=int, default=8)
+    parser.add_argument("--segments", type=int, default=1)
+    parser.add_argument("--raw", action="store_true")
+    # The client's own rate limit is lifted so the stand-in sets the pace
+    parser.add_argument("--rate", type=float, default=1000)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--parse-number", type=int, default=200)
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--results", default=RESULTS_PATH)
+    parser.add_argument("--no-record", action="store_true")
+    args = parser.parse_args()
+
+    settings = {
+        x: getattr(args, x) for x in COMPARED_SETTINGS + ("rate", "parse_number")
+    }
+    result = {
+        "version": read_version(),
+        "commit": read_commit(),
+        "label": args.label,
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "settings": settings,
+        "stages": run(args),
+    }
+
+    print_report(result, previous_result(args.results, settings))
+    if not args.no_record:
+        with open(args.results, "a", encoding="utf-8") as file:
+            file.write(json.dumps(result) + "\n")
+        print(f"Recorded in {args.results}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Bytes and parse time per page of the rewritten Wayback replay against the
+raw ("id_") capture, using the fixture pages in tests/fixtures. Those are
+hand-written, the replayed ones with a padded toolbar, not recorded
+captures, so the savings shown do not carry over to real archive pages
+
+    python benchmarks/bench_raw_mode.py [--number N]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from playstvrecovery.extract import (  # noqa: E402
+    find_ld_json_videos,
+    find_user_id,
+    find_video_items,
+    find_video_sources,
+)
+
+fixtures_path = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixtures_path, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def parse_profile(page: str) -> None:
+    find_user_id(page)
+    find_ld_json_videos(page)
+
+
+def parse_module(page: str) -> None:
+    find_video_items(json.loads(page)["body"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    cases = [
+        ("profile", "profile.html", "profile_raw.html", parse_profile),
+        ("ws/module", "module.json", "module_raw.json", parse_module),
+        ("embed", "embed.html", "embed_raw.html", find_video_sources),
+    ]
+
+    print(
+        f"{'page':<12}{'replay B':>10}{'raw B':>10}{'saved':>8}"
+        f"{'replay ms':>11}{'raw ms':>9}{'saved':>8}"
+    )
+    for name, replay_name, raw_name, parse in cases:
+        replay, raw = read_fixture(replay_name), read_fixture(raw_name)
+        replay_bytes, raw_bytes = len(replay.encode()), len(raw.encode())
+        replay_time = timeit.timeit(lambda: parse(replay), number=args.number)
+        raw_time = timeit.timeit(lambda: parse(raw), number=args.number)
+        print(
+            f"{name:<12}{replay_bytes:>10}{raw_bytes:>10}"
+            f"{1 - raw_bytes / replay_bytes:>8.0%}"
+            f"{replay_time / args.number * 1000:>11.3f}"
+            f"{raw_time / args.number * 1000:>9.3f}"
+            f"{1 - raw_time / replay_time:>8.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Wall time from launch to exit of the command line, for --help and for an
+invocation rejected by argument validation, neither of which should load
+the networking or parsing dependencies. Exits with 1 when the median of
+either is over its budget, --importtime lists the slowest imports
+
+    python benchmarks/bench_startup.py [--repeat 10] [--help-budget-ms 400]
+        [--validation-budget-ms 400] [--importtime 15]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+root_path = os.path.join(os.path.dirname(__file__), "..")
+
+COMMANDS: dict[str, list[str]] = {
+    "help": ["--help"],
+    "validation": ["recover", "--output-path", ".", "--user", "someone", "--workers=0"],
+}
+# Exit code of every command, click exits with 2 on a usage error
+EXIT_CODES: dict[str, int] = {"help": 0, "validation": 2}
+
+
+def launch(arguments: list[str], *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *options, "-m", "playstvrecovery", *arguments],
+        cwd=root_path,
+        capture_output=True,
+        text=True,
+    )
+
+
+def time_command(name: str, repeat: int) -> list[float]:
+    """
+    Milliseconds of every run of a command
+    """
+    timings: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = launch(COMMANDS[name])
+        timings.append((time.perf_counter() - started) * 1000)
+        if completed.returncode != EXIT_CODES[name]:
+            raise RuntimeError(
+                f"{name} exited with {completed.returncode}:\n{completed.stderr}"
+            )
+    return timings
+
+
+def time_interpreter(repeat: int) -> float:
+    """
+    Median milliseconds of a bare interpreter, the floor of every command
+    """
+    timings: list[float] = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def slowest_imports(name: str, top: int) -> list[tuple[int, str]]:
+    """
+    (cumulative microseconds, module) of the top-level imports of a command
+    """
+    stderr = launch(COMMANDS[name], "-X", "importtime").stderr
+    imports: list[tuple[int, str]] = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)", line)
+        if match is not None and not match.group(2):
+            imports.append((int(match.group(1)), match.group(3)))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--help-budget-ms", type=float, default=400)
+    parser.add_argument("--validation-budget-ms", type=float, default=400)
+    parser.add_argument("--importtime", type=int, default=0)
+    args = parser.parse_args()
+
+    budgets = {"help": args.help_budget_ms, "validation": args.validation_budget_ms}
+    print(f"Bare interpreter: {time_interpreter(args.repeat):.0f} ms")
+    print(f"{'command':<12}{'median ms':>10}{'best ms':>10}{'budget ms':>11}")
+    over_budget: list[str] = []
+    for name, budget in budgets.items():
+        timings = time_command(name, args.repeat)
+        median = statistics.median(timings)
+        print(f"{name:<12}{median:>10.0f}{min(timings):>10.0f}{budget:>11.0f}")
+        if median > budget:
+            over_budget.append(name)
+
+    if args.importtime:
+        for name in budgets:
+            print(f"\nSlowest imports of {name}")
+            for microseconds, module in slowest_imports(name, args.importtime):
+                print(f"  {microseconds / 1000:>8.1f} ms  {module}")
+
+    if over_budget:
+        print(f"\nOver budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
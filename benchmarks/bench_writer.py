@@ -0,0 +1,95 @@
+"""
+MB/s of writing a downloaded body to disk with the PartFile writer against
+the former loop (1 MiB iter_content chunks written to a Python file object).
+PartFile syncs the file before renaming it, the former loop is measured
+with and without a sync to tell the copying apart from the flush. The body
+comes from memory so only the write path is measured, point --dir at the
+file system downloads go to
+
+    python benchmarks/bench_writer.py [--size-mb 256] [--dir DIR] [--repeat 3]
+"""
+import argparse
+from io import BytesIO
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from playstvrecovery.writer import DEFAULT_BUFFER_SIZE, PartFile  # noqa: E402
+
+OLD_CHUNK_SIZE = 1024 * 1024
+
+
+class MemoryResponse:
+    """
+    Response shaped stand in serving a body from memory
+    """
+
+    def __init__(self, body: bytes) -> None:
+        self.raw = BytesIO(body)
+        self.headers = {"Content-Length": str(len(body))}
+
+    def iter_content(self, chunk_size: int):
+        while chunk := self.raw.read(chunk_size):
+            yield chunk
+
+
+def old_loop(body: bytes, part_path: str, file_path: str, sync: bool) -> None:
+    response = MemoryResponse(body)
+    with open(part_path, "wb") as file:
+        for chunk in response.iter_content(chunk_size=OLD_CHUNK_SIZE):
+            if chunk:
+                file.write(chunk)
+        if sync:
+            file.flush()
+            os.fsync(file.fileno())
+    os.replace(part_path, file_path)
+
+
+def part_file(body: bytes, part_path: str, file_path: str, buffer_size: int) -> None:
+    with PartFile(part_path, size=len(body), buffer_size=buffer_size) as writer:
+        writer.stream(MemoryResponse(body), 0)
+        writer.commit(file_path)
+
+
+def measure(write, body: bytes, directory: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        file_path = os.path.join(directory, "bench.mp4")
+        started = time.perf_counter()
+        write(body, file_path + ".part", file_path)
+        best = min(best, time.perf_counter() - started)
+        os.remove(file_path)
+    return len(body) / best / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--dir", default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    body = os.urandom(args.size_mb * 1024 * 1024)
+    cases = [
+        ("former loop", lambda b, p, f: old_loop(b, p, f, sync=False)),
+        ("former loop + fsync", lambda b, p, f: old_loop(b, p, f, sync=True)),
+    ] + [
+        (
+            f"PartFile {size // 1024} KiB",
+            lambda b, p, f, size=size: part_file(b, p, f, size),
+        )
+        for size in (OLD_CHUNK_SIZE, DEFAULT_BUFFER_SIZE, 4 * DEFAULT_BUFFER_SIZE)
+    ]
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        print(f"{args.size_mb} MiB into {directory}, best of {args.repeat}")
+        print(f"{'writer':<30}{'MB/s':>10}")
+        for name, write in cases:
+            print(f"{name:<30}{measure(write, body, directory, args.repeat):>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Local stand-in for the Wayback Machine and the Plays.tv CDN, serving a
+synthetic profile built from the recorded pages in tests/fixtures: the
+profile page, its ws/module pages, embed pages, Availability API and CDX
+answers and MP4 payloads with byte range support. Latency, bandwidth and
+429 responses are injected on demand
+
+    python benchmarks/fakeserver.py [--videos 200] [--latency-ms 50] [--port 8080]
+"""
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+from threading import Lock, Thread
+import time
+from urllib.parse import parse_qs, urlparse
+
+fixtures_path = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures")
+
+# Capture timestamp of every page served, the day the profiles were archived
+CAPTURE_TIMESTAMP: str = "20191210170000"
+CDN_URL: str = "https://d0playscdntv-a.akamaihd.net"
+RESOLUTIONS: tuple[int, ...] = (720, 480, 1080)
+# Videos listed on the profile page itself, the rest come from ws/module
+INITIAL_VIDEOS: int = 20
+PAGE_SIZE: int = 20
+PAYLOAD_BLOCK_SIZE: int = 64 * 1024
+
+__ld_json_pattern__ = re.compile(
+    r'(<script type="application/ld\+json">)(.*?)(</script>)', re.DOTALL
+)
+__user_id_pattern__ = re.compile(r'data-obj-id="[^"]*"')
+__video_pattern__ = re.compile(r"<video\b.*?</video>", re.DOTALL)
+__video_item_pattern__ = re.compile(r'<li class="video-item".*?</li>', re.DOTALL)
+__feed_id_pattern__ = re.compile(r'data-feed-id="([^"]*)"')
+__title_pattern__ = re.compile(r'(class="title"[^>]*>)[^<]*')
+__archive_path_pattern__ = re.compile(r"^/web/(\d{1,14})([a-z]{2}_)?/(.+)$")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixtures_path, name), encoding="utf-8") as file:
+        return file.read()
+
+
+class FakeArchive:
+    """
+    Content and fault settings of the stand-in. Every response waits
+    latency seconds, bodies are sent at most bandwidth bytes per second
+    each and a share of requests (throttle) is answered with a 429. A
+    share of the videos (missing) has no archived embed page
+    """
+
+    def __init__(
+        self,
+        username: str = "someone",
+        videos: int = 200,
+        payload_size: int = 1024 * 1024,
+        latency: float = 0.0,
+        bandwidth: float | None = None,
+        throttle: float = 0.0,
+        retry_after: float = 0.0,
+        missing: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.username: str = username
+        self.payload_size: int = payload_size
+        self.latency: float = latency
+        self.bandwidth: float | None = bandwidth
+        self.throttle: float = throttle
+        self.retry_after: float = retry_after
+        self.base_url: str = str()
+        self.user_id: str = hashlib.md5(username.encode("utf-8")).hexdigest()
+        self.video_ids: list[str] = [
+            hashlib.sha1(f"{username}/{x}".encode("utf-8")).hexdigest()[:16]
+            for x in range(videos)
+        ]
+        self.__ids__: set[str] = set(self.video_ids)
+        self.requests: dict[str, int] = {}
+        self.throttled: int = 0
+        self.bytes_sent: int = 0
+
+        self.__random__: random.Random = random.Random(seed)
+        self.__missing__: set[str] = {
+            x for x in self.video_ids if self.__random__.random() < missing
+        }
+        self.__payload_block__: bytes = self.__random__.randbytes(PAYLOAD_BLOCK_SIZE)
+        self.__profile_template__: str = read_fixture("profile_raw.html")
+        self.__embed_template__: str = read_fixture("embed_raw.html")
+        self.__item_template__: str = __video_item_pattern__.search(
+            json.loads(read_fixture("module_raw.json"))["body"]
+        ).group(0)
+        self.__item_id__: str = __feed_id_pattern__.search(
+            self.__item_template__
+        ).group(1)
+        self.__server__: FakeServer | None = None
+        self.__lock__: Lock = Lock()
+
+    @property
+    def archived_ids(self) -> list[str]:
+        return [x for x in self.video_ids if x not in self.__missing__]
+
+    def is_archived(self, video_id: str) -> bool:
+        return video_id in self.__ids__ and video_id not in self.__missing__
+
+    def start(self, port: int = 0) -> str:
+        """
+        Serve on a background thread, returns the base url
+        """
+        self.__server__ = FakeServer(("127.0.0.1", port), RequestHandler)
+        self.__server__.archive = self
+        self.base_url = f"http://127.0.0.1:{self.__server__.server_address[1]}"
+        Thread(target=self.__server__.serve_forever, daemon=True).start()
+        return self.base_url
+
+    def stop(self) -> None:
+        if self.__server__ is not None:
+            self.__server__.shutdown()
+            self.__server__.server_close()
+            self.__server__ = None
+
+    def count(self, route: str, sent: int = 0) -> None:
+        with self.__lock__:
+            self.requests[route] = self.requests.get(route, 0) + 1
+            self.bytes_sent += sent
+
+    def should_throttle(self) -> bool:
+        with self.__lock__:
+            throttled = self.__random__.random() < self.throttle
+            self.throttled += throttled
+            return throttled
+
+    def archive_url(self, original: str, flag: str = "") -> str:
+        return f"{self.base_url}/web/{CAPTURE_TIMESTAMP}{flag}/{original}"
+
+    def title(self, index: int) -> str:
+        return f"{self.username} - Clip {index}"
+
+    def profile_page(self) -> str:
+        ld_json = {
+            "@context": "http://schema.org",
+            "@type": "Person",
+            "name": self.username,
+            "video": [
+                {
+                    "@type": "VideoObject",
+                    "name": self.title(index),
+                    "embedURL": f"https://plays.tv/embeds/{video_id}",
+                }
+                for index, video_id in enumerate(self.video_ids[:INITIAL_VIDEOS])
+            ],
+        }
+        page = __ld_json_pattern__.sub(
+            lambda x: x.group(1) + json.dumps(ld_json) + x.group(3),
+            self.__profile_template__,
+            count=1,
+        )
+        return __user_id_pattern__.sub(f'data-obj-id="{self.user_id}"', page, count=1)
+
+    def module_page(self, last_id: str) -> str:
+        """
+        ws/module answer listing the page of videos after last_id, with an
+        empty body once every video was listed
+        """
+        try:
+            start = self.video_ids.index(last_id) + 1
+        except ValueError:
+            start = len(self.video_ids)
+        items = [
+            __title_pattern__.sub(
+                lambda x: x.group(1) + self.title(index),
+                self.__item_template__.replace(self.__item_id__, video_id),
+            )
+            for index, video_id in enumerate(
+                self.video_ids[start : start + PAGE_SIZE], start=start
+            )
+        ]
+        body = f"<ul>{''.join(items)}</ul>" if items else ""
+        return json.dumps({"body": body, "status": "ok", "state": {}})
+
+    def embed_page(self, video_id: str, raw: bool) -> str:
+        sources = []
+        for resolution in RESOLUTIONS:
+            original = f"{CDN_URL}/video/{video_id}/processed/{resolution}.mp4"
+            # Raw captures keep the protocol relative CDN url, the replay
+            # rewrites it into the archive
+            src = original[len("https:") :] if raw else self.archive_url(original)
+            sources.append(
+                f'<source src="{src}" type="video/mp4" res="{resolution}"/>'
+            )
+        video = (
+            '<video class="video-js" controls preload="none">'
+            f"{''.join(sources)}</video>"
+        )
+        return __video_pattern__.sub(video, self.__embed_template__, count=1)
+
+    def payload_size_of(self, resolution: int) -> int:
+        return max(1, self.payload_size * resolution // max(RESOLUTIONS))
+
+    def payload(self, start: int, end: int):
+        """
+        Yield the bytes start to end (inclusive) of a synthetic payload
+        """
+        block = memoryview(self.__payload_block__)
+        offset = start
+        while offset <= end:
+            index = offset % PAYLOAD_BLOCK_SIZE
+            chunk = block[index : index + end - offset + 1]
+            yield chunk
+            offset += len(chunk)
+
+    def availability(self, url: str) -> dict:
+        video_id = url.rstrip("/").split("/")[-1]
+        if "/embeds/" in url and video_id in self.__missing__:
+            return {"url": url, "archived_snapshots": {}}
+        return {
+            "url": url,
+            "archived_snapshots": {
+                "closest": {
+                    "available": True,
+                    "status": "200",
+                    "timestamp": CAPTURE_TIMESTAMP,
+                    "url": self.archive_url(url),
+                }
+            },
+        }
+
+    def cdx(self, url: str) -> list[list[str]]:
+        rows = [["original", "timestamp"]]
+        if url.startswith("plays.tv/embeds"):
+            rows += [
+                [f"https://plays.tv/embeds/{x}", CAPTURE_TIMESTAMP]
+                for x in self.archived_ids
+            ]
+        else:
+            rows.append([f"https://{url}", CAPTURE_TIMESTAMP])
+        return rows
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    archive: FakeArchive
+
+    def handle_error(self, request, client_address) -> None:
+        # Clients closing kept alive connections are expected, not errors
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real servers, so the client's pool is exercised
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def archive(self) -> FakeArchive:
+        return self.server.archive
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_HEAD(self) -> None:
+        self.handle_request(send_body=False)
+
+    def do_GET(self) -> None:
+        self.handle_request(send_body=True)
+
+    def handle_request(self, send_body: bool) -> None:
+        archive = self.archive
+        if archive.latency:
+            time.sleep(archive.latency)
+        if archive.should_throttle():
+            self.send_text(
+                429,
+                "Too Many Requests",
+                "text/plain",
+                send_body,
+                "throttled",
+                {"Retry-After": f"{archive.retry_after:g}"},
+            )
+            return
+
+        parsed = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        if parsed.path == "/wayback/available":
+            body = json.dumps(archive.availability(query.get("url", "")))
+            self.send_text(200, body, "application/json", send_body, "availability")
+            return
+        if parsed.path == "/cdx/search/cdx":
+            body = json.dumps(archive.cdx(query.get("url", "")))
+            self.send_text(200, body, "application/json", send_body, "cdx")
+            return
+
+        match = __archive_path_pattern__.match(self.path)
+        if match is None:
+            self.send_text(404, "Not Found", "text/plain", send_body, "not found")
+            return
+        raw = match.group(2) is not None
+        original = match.group(3)
+        original_path = urlparse(original).path
+
+        if "/ws/module" in original_path:
+            module_query = parse_qs(urlparse(original).query)
+            last_id = module_query.get("last_id", [""])[0]
+            body = archive.module_page(last_id)
+            self.send_text(200, body, "application/json", send_body, "module")
+        elif original_path.startswith("/u/"):
+            self.send_text(
+                200, archive.profile_page(), "text/html", send_body, "profile"
+            )
+        elif original_path.startswith("/embeds/"):
+            video_id = original_path.rstrip("/").split("/")[-1]
+            if not archive.is_archived(video_id):
+                self.send_text(404, "Not Found", "text/plain", send_body, "embed")
+                return
+            body = archive.embed_page(video_id, raw)
+            self.send_text(200, body, "text/html", send_body, "embed")
+        elif original_path.endswith(".mp4"):
+            resolution = int(os.path.basename(original_path).split(".")[0])
+            self.send_payload(archive.payload_size_of(resolution), send_body)
+        else:
+            self.send_text(404, "Not Found", "text/plain", send_body, "not found")
+
+    def send_text(
+        self,
+        status: int,
+        text: str,
+        content_type: str,
+        send_body: bool,
+        route: str,
+        headers: dict[str, str] | None = None,
+    ) -> None:
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if send_body:
+            self.send_chunks([body])
+        self.archive.count(route, len(body) if send_body else 0)
+
+    def send_payload(self, size: int, send_body: bool) -> None:
+        start, end = 0, size - 1
+        range_match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if range_match is not None:
+            start = int(range_match.group(1))
+            if range_match.group(2):
+                end = min(end, int(range_match.group(2)))
+            if start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                self.archive.count("payload")
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        sent = 0
+        if send_body:
+            sent = self.send_chunks(self.archive.payload(start, end))
+        self.archive.count("payload", sent)
+
+    def send_chunks(self, chunks) -> int:
+        """
+        Write chunks no faster than the bandwidth setting allows
+        """
+        bandwidth = self.archive.bandwidth
+        started = time.monotonic()
+        sent = 0
+        try:
+            for chunk in chunks:
+                self.wfile.write(chunk)
+                sent += len(chunk)
+                if bandwidth:
+                    ahead = sent / bandwidth - (time.monotonic() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+        return sent
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--username", default="someone")
+    parser.add_argument("--videos", type=int, default=200)
+    parser.add_argument("--payload-kb", type=int, default=1024)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--bandwidth-mbps", type=float, default=0)
+    parser.add_argument("--throttle", type=float, default=0)
+    parser.add_argument("--missing", type=float, default=0)
+    args = parser.parse_args()
+
+    archive = FakeArchive(
+        username=args.username,
+        videos=args.videos,
+        payload_size=args.payload_kb * 1024,
+        latency=args.latency_ms / 1000,
+        bandwidth=args.bandwidth_mbps * 1e6 / 8 or None,
+        throttle=args.throttle,
+        missing=args.missing,
+    )
+    base_url = archive.start(args.port)
+    print(f"Serving {args.username} ({args.videos} videos) on {base_url}")
+    print(f"Profile: {archive.archive_url(f'https://plays.tv/u/{args.username}')}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        archive.stop()
+
+
+if __name__ == "__main__":
+    main()
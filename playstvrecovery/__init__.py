@@ -2,8 +2,9 @@
 
 __version__ = "0.4.2"
 
-import cli
-
 
 def main():
-    cli.main()
+    # Imported on call, so reading __version__ loads none of the dependencies
+    from .cli import main
+
+    main()
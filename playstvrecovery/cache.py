@@ -0,0 +1,130 @@
+import os
+import sqlite3
+import time
+from threading import Lock
+
+
+DEFAULT_CACHE_SIZE: int = 512 * 1024 * 1024
+CACHE_FILE_NAME: str = "responses.sqlite"
+
+
+class CachedResponse:
+    def __init__(
+        self, url: str, status_code: int, content: bytes, encoding: str | None
+    ) -> None:
+        self.url: str = url
+        self.status_code: int = status_code
+        self.content: bytes = content
+        self.encoding: str | None = encoding
+
+    @property
+    def negative(self) -> bool:
+        return self.status_code == 404
+
+
+class ResponseCache:
+    """
+    SQLite backed response cache keyed by URL with size based LRU eviction.
+    Negative entries (404) store no body and record that the archive has
+    nothing for a URL
+    """
+
+    def __init__(self, path: str, max_size: int = DEFAULT_CACHE_SIZE) -> None:
+        if os.path.isdir(path):
+            path = os.path.join(path, CACHE_FILE_NAME)
+        self.path: str = path
+        self.max_size: int = max_size
+        self.hits: int = 0
+        self.misses: int = 0
+        self.__lock__: Lock = Lock()
+        self.__connection__ = sqlite3.connect(path, check_same_thread=False)
+        self.__connection__.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                status_code INTEGER NOT NULL,
+                content BLOB NOT NULL,
+                encoding TEXT,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self.__connection__.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+        )
+        self.__connection__.commit()
+        self.__size__: int = self.__connection__.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self.__lock__:
+            return self.__connection__.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        return self.__size__
+
+    def get(self, url: str) -> CachedResponse | None:
+        with self.__lock__:
+            row = self.__connection__.execute(
+                "SELECT status_code, content, encoding FROM responses WHERE url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.__connection__.execute(
+                "UPDATE responses SET last_access = ? WHERE url = ?",
+                (time.time(), url),
+            )
+            self.__connection__.commit()
+        return CachedResponse(url, row[0], row[1], row[2])
+
+    def put(
+        self,
+        url: str,
+        status_code: int,
+        content: bytes,
+        encoding: str | None = None,
+    ) -> None:
+        size = len(url) + len(content)
+        with self.__lock__:
+            previous = self.__connection__.execute(
+                "SELECT size FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            self.__connection__.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (url, status_code, content, encoding, size, time.time()),
+            )
+            self.__size__ += size - (previous[0] if previous else 0)
+            self.__evict__()
+            self.__connection__.commit()
+
+    def put_negative(self, url: str) -> None:
+        self.put(url, 404, b"")
+
+    def close(self) -> None:
+        with self.__lock__:
+            self.__connection__.close()
+
+    def __evict__(self) -> None:
+        # Drop least recently used entries in batches until under budget
+        while self.__size__ > self.max_size:
+            rows = self.__connection__.execute(
+                "SELECT url, size FROM responses ORDER BY last_access LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.__size__ = 0
+                return
+            for url, size in rows:
+                self.__connection__.execute(
+                    "DELETE FROM responses WHERE url = ?", (url,)
+                )
+                self.__size__ -= size
+                if self.__size__ <= self.max_size:
+                    return
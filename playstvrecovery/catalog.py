@@ -0,0 +1,151 @@
+from threading import Lock
+from typing import TYPE_CHECKING, Iterable, Iterator, overload
+
+if TYPE_CHECKING:
+    from .playstv import Video
+
+
+VIEW_VALID: str = "valid"
+VIEW_PENDING: str = "pending"
+VIEW_DOWNLOADED: str = "downloaded"
+VIEW_FAILED: str = "failed"
+
+
+class VideoCatalog:
+    """
+    Ordered collection of a profile's videos with an id index. Videos report
+    changes of valid/download_succeeded back to their catalog, which keeps
+    the status views up to date without rescanning. Views are listed in
+    catalog order, sorting only their own videos:
+
+    valid       archived videos
+    pending     archived videos not downloaded yet (includes failed ones)
+    downloaded  successfully downloaded videos
+    failed      videos whose last download failed
+    """
+
+    def __init__(self, videos: Iterable["Video"] = ()) -> None:
+        self.__videos__: list["Video"] = []
+        self.__index__: dict[str, "Video"] = {}
+        # Position of every video id in __videos__
+        self.__positions__: dict[str, int] = {}
+        self.__views__: dict[str, dict[str, "Video"]] = {
+            VIEW_VALID: {},
+            VIEW_PENDING: {},
+            VIEW_DOWNLOADED: {},
+            VIEW_FAILED: {},
+        }
+        self.__lock__: Lock = Lock()
+        self.extend(videos)
+
+    def __len__(self) -> int:
+        return len(self.__videos__)
+
+    def __iter__(self) -> Iterator["Video"]:
+        return iter(self.__videos__)
+
+    def __bool__(self) -> bool:
+        return bool(self.__videos__)
+
+    @overload
+    def __getitem__(self, index: int) -> "Video":
+        ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list["Video"]:
+        ...
+
+    def __getitem__(self, index):
+        return self.__videos__[index]
+
+    def __contains__(self, item: "str | Video") -> bool:
+        video_id = item if isinstance(item, str) else item.id
+        return video_id in self.__index__
+
+    def __iadd__(self, videos: Iterable["Video"]) -> "VideoCatalog":
+        self.extend(videos)
+        return self
+
+    def get(self, video_id: str) -> "Video | None":
+        return self.__index__.get(video_id)
+
+    def ids(self) -> set[str]:
+        return set(self.__index__)
+
+    def append(self, video: "Video") -> bool:
+        """
+        Add a video, returns False when its id is already in the catalog
+        """
+        with self.__lock__:
+            if video.id in self.__index__:
+                return False
+            self.__positions__[video.id] = len(self.__videos__)
+            self.__videos__.append(video)
+            self.__index__[video.id] = video
+        video.__catalog__ = self
+        self.update(video)
+        return True
+
+    def extend(self, videos: Iterable["Video"]) -> list["Video"]:
+        """
+        Add videos, returns the ones that were new
+        """
+        return [video for video in videos if self.append(video)]
+
+    def clear(self) -> None:
+        with self.__lock__:
+            for video in self.__videos__:
+                video.__catalog__ = None
+            self.__videos__.clear()
+            self.__index__.clear()
+            self.__positions__.clear()
+            for view in self.__views__.values():
+                view.clear()
+
+    def update(self, video: "Video") -> None:
+        """
+        Move a video to the views matching its current status
+        """
+        memberships = {
+            VIEW_VALID: video.valid,
+            VIEW_PENDING: video.valid and not video.download_succeeded,
+            VIEW_DOWNLOADED: bool(video.download_succeeded),
+            VIEW_FAILED: video.download_succeeded is False,
+        }
+        with self.__lock__:
+            if self.__index__.get(video.id) is not video:
+                return
+            for name, member in memberships.items():
+                if member:
+                    self.__views__[name][video.id] = video
+                else:
+                    self.__views__[name].pop(video.id, None)
+
+    def view(self, name: str) -> list["Video"]:
+        """
+        Videos of a view in catalog order, not in the order their status
+        changed, which concurrent lookups and downloads make random
+        """
+        with self.__lock__:
+            return sorted(
+                self.__views__[name].values(), key=lambda x: self.__positions__[x.id]
+            )
+
+    def count(self, name: str) -> int:
+        return len(self.__views__[name])
+
+    @property
+    def valid(self) -> list["Video"]:
+        return self.view(VIEW_VALID)
+
+    @property
+    def pending(self) -> list["Video"]:
+        return self.view(VIEW_PENDING)
+
+    @property
+    def downloaded(self) -> list["Video"]:
+        return self.view(VIEW_DOWNLOADED)
+
+    @property
+    def failed(self) -> list["Video"]:
+        return self.view(VIEW_FAILED)
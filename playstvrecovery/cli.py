@@ -1,46 +1,879 @@
+import atexit
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+import json
 from pathlib import Path
+import sys
+from threading import Lock
+import time
 from typing import Annotated, Optional
 import typer
 
-import playstv
+from . import (
+    cache,
+    download,
+    manifest,
+    metrics,
+    pipeline,
+    playstv,
+    profiling,
+    ratelimit,
+    scheduler,
+    session,
+    sources,
+    state,
+    store,
+    wayback,
+    writer,
+)
+from .catalog import VIEW_DOWNLOADED, VIEW_FAILED, VIEW_VALID
 
 app = typer.Typer()
 
+# Users recovered at the same time in batch mode, their lookups and
+# downloads share one worker pool of each kind
+DEFAULT_CONCURRENT_USERS: int = 4
+SUMMARY_FILE_NAME: str = "summary.json"
+BATCH_SUMMARY_FILE_NAME: str = "batch-summary.json"
+
+# Options shared by the commands
+OutputPathOption = Annotated[Path, typer.Option()]
+WorkersOption = Annotated[
+    int, typer.Option(min=1, help="Number of videos downloaded concurrently")
+]
+SegmentsOption = Annotated[
+    int,
+    typer.Option(min=1, help="Ranges of a large video fetched at the same time"),
+]
+BufferSizeOption = Annotated[
+    int,
+    typer.Option(min=64, help="Read and write buffer per download stream in KiB"),
+]
+MaxBandwidthOption = Annotated[
+    Optional[float],
+    typer.Option(min=0, help="Download bandwidth shared by all streams in MiB/s"),
+]
+BandwidthFileOption = Annotated[
+    Optional[Path],
+    typer.Option(
+        help="File holding the bandwidth limit in MiB/s, re-read while running"
+    ),
+]
+LookupWorkersOption = Annotated[
+    int, typer.Option(min=1, help="Number of availability lookups in flight")
+]
+BulkResolveOption = Annotated[
+    bool,
+    typer.Option(help="Resolve embed snapshots with a single CDX prefix query"),
+]
+PoolSizeOption = Annotated[
+    int, typer.Option(min=1, help="Connections kept alive per host")
+]
+TimeoutOption = Annotated[
+    float, typer.Option(min=1, help="Request timeout in seconds")
+]
+UserAgentOption = Annotated[str, typer.Option()]
+CacheDirOption = Annotated[
+    Optional[Path],
+    typer.Option(help="Directory for the on-disk archive.org response cache"),
+]
+CacheSizeOption = Annotated[
+    int, typer.Option(min=1, help="Maximum response cache size in MiB")
+]
+RateOption = Annotated[
+    float, typer.Option(min=0.1, help="Initial requests per second to archive.org")
+]
+MaxRetriesOption = Annotated[
+    int, typer.Option(min=0, help="Retries for throttled or failed requests")
+]
+RawOption = Annotated[
+    bool,
+    typer.Option(help="Fetch original captures without the Wayback toolbar"),
+]
+MaxResolutionOption = Annotated[
+    Optional[int],
+    typer.Option(min=1, help="Highest source resolution to download, e.g. 720"),
+]
+PreferOption = Annotated[
+    str,
+    typer.Option(
+        help='Download the "largest" or the "smallest" source of a video',
+        callback=lambda value: check_choice(value, sources.PREFERENCES),
+    ),
+]
+ProbeSizeOption = Annotated[
+    bool,
+    typer.Option(help="Size sources with HEAD requests and choose by size"),
+]
+ManifestOption = Annotated[
+    Path, typer.Option("--manifest", help="JSONL manifest of the videos to download")
+]
+ResumeOption = Annotated[
+    bool, typer.Option(help="Skip stages finished by an earlier run")
+]
+MetricsFileOption = Annotated[
+    Optional[Path],
+    typer.Option(help="Write request, byte and stage metrics as JSON on exit"),
+]
+PrometheusFileOption = Annotated[
+    Optional[Path],
+    typer.Option(help="Write the same metrics as a Prometheus textfile on exit"),
+]
+LogFileOption = Annotated[
+    Optional[Path], typer.Option(help="Append every log message as a JSON line")
+]
+ProfileOption = Annotated[
+    bool,
+    typer.Option(
+        "--profile",
+        help="Profile CPU time and memory of every stage, reports are written "
+        "next to the output",
+    ),
+]
+ProfileTopOption = Annotated[
+    int, typer.Option(min=1, help="Hot functions listed per stage when profiling")
+]
+StoreOption = Annotated[
+    bool,
+    typer.Option(
+        "--store/--no-store",
+        help="Store every video once by content and hard link it into the user "
+        "directories",
+    ),
+]
+
+__snapshot_index__: wayback.SnapshotIndex | None = None
+__snapshot_index_lock__: Lock = Lock()
+# Set once the bulk query failed, later users go straight to per video lookups
+__snapshot_index_failed__: bool = False
+
+
+@app.callback(invoke_without_command=True)
+def default(
+    ctx: typer.Context,
+    output_path: Annotated[
+        Optional[Path], typer.Option(help="Output directory of --user")
+    ] = None,
+    user: Annotated[
+        Optional[str],
+        typer.Option(help="Recover a single user, same as the recover command"),
+    ] = None,
+):
+    """
+    Recover deleted Plays.tv clips from the Wayback Machine
+    """
+    if ctx.invoked_subcommand is not None:
+        return
+    # The form from before there were commands, playstvrec --user --output-path
+    if user is None and output_path is None:
+        typer.echo(ctx.get_help())
+        raise typer.Exit()
+    if user is None or output_path is None:
+        raise typer.BadParameter("--user and --output-path have to be given together")
+    ctx.invoke(recover, output_path=output_path, user=user)
+
 
 @app.command()
-def main(
-    output_path: Annotated[Optional[Path], typer.Option()],
+def recover(
+    output_path: OutputPathOption,
     user: Annotated[str, typer.Option()],
+    workers: WorkersOption = playstv.DEFAULT_DOWNLOAD_WORKERS,
+    segments: SegmentsOption = download.DEFAULT_SEGMENTS,
+    buffer_size: BufferSizeOption = writer.DEFAULT_BUFFER_SIZE // 1024,
+    max_bandwidth: MaxBandwidthOption = None,
+    bandwidth_file: BandwidthFileOption = None,
+    lookup_workers: LookupWorkersOption = playstv.DEFAULT_LOOKUP_WORKERS,
+    bulk_resolve: BulkResolveOption = False,
+    pool_size: PoolSizeOption = session.DEFAULT_POOL_SIZE,
+    timeout: TimeoutOption = session.DEFAULT_TIMEOUT,
+    user_agent: UserAgentOption = session.DEFAULT_USER_AGENT,
+    cache_dir: CacheDirOption = None,
+    cache_size: CacheSizeOption = cache.DEFAULT_CACHE_SIZE // (1024 * 1024),
+    rate: RateOption = ratelimit.DEFAULT_RATE,
+    max_retries: MaxRetriesOption = session.DEFAULT_MAX_RETRIES,
+    raw: RawOption = False,
+    max_resolution: MaxResolutionOption = None,
+    prefer: PreferOption = sources.PREFER_LARGEST,
+    probe_size: ProbeSizeOption = False,
+    metrics_file: MetricsFileOption = None,
+    prometheus_file: PrometheusFileOption = None,
+    log_file: LogFileOption = None,
+    profile: ProfileOption = False,
+    profile_top: ProfileTopOption = profiling.DEFAULT_TOP,
+    use_store: StoreOption = True,
+    stream: Annotated[
+        bool,
+        typer.Option(help="Download videos while discovery is still running"),
+    ] = False,
+    resume: ResumeOption = True,
 ):
+    """
+    Recover the videos of a single user
+    """
     if not output_path.is_dir():
         playstv.structured_error("initialization", "Specified path is not a directory")
         return
 
-    # Create UserProfile instance if archive is available
-    user_profile = playstv.get_profile(user)
+    configure_run(
+        pool_size=max(pool_size, workers * segments, lookup_workers),
+        timeout=timeout,
+        user_agent=user_agent,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        rate=rate,
+        max_retries=max_retries,
+        raw=raw,
+        source_policy=sources.SourcePolicy(prefer, max_resolution, probe_size),
+        segments=segments,
+        buffer_size=buffer_size,
+        max_bandwidth=max_bandwidth,
+        bandwidth_file=bandwidth_file,
+        monitor_bandwidth=True,
+        metrics_file=metrics_file,
+        prometheus_file=prometheus_file,
+        log_file=log_file,
+        profile_dir=profile_path(output_path) if profile else None,
+        profile_top=profile_top,
+        store_dir=output_path / store.STORE_DIR_NAME if use_store else None,
+    )
+
+    recover_user(
+        user,
+        output_path,
+        workers=workers,
+        lookup_workers=lookup_workers,
+        bulk_resolve=bulk_resolve,
+        stream=stream,
+        resume=resume,
+    )
+
+
+@app.command()
+def batch(
+    output_path: OutputPathOption,
+    users_file: Annotated[
+        Path, typer.Option(help='File with one username per line, "-" for stdin')
+    ],
+    concurrent_users: Annotated[
+        int, typer.Option(min=1, help="Number of users recovered at the same time")
+    ] = DEFAULT_CONCURRENT_USERS,
+    workers: WorkersOption = playstv.DEFAULT_DOWNLOAD_WORKERS,
+    segments: SegmentsOption = download.DEFAULT_SEGMENTS,
+    buffer_size: BufferSizeOption = writer.DEFAULT_BUFFER_SIZE // 1024,
+    max_bandwidth: MaxBandwidthOption = None,
+    bandwidth_file: BandwidthFileOption = None,
+    lookup_workers: LookupWorkersOption = playstv.DEFAULT_LOOKUP_WORKERS,
+    bulk_resolve: BulkResolveOption = False,
+    pool_size: PoolSizeOption = session.DEFAULT_POOL_SIZE,
+    timeout: TimeoutOption = session.DEFAULT_TIMEOUT,
+    user_agent: UserAgentOption = session.DEFAULT_USER_AGENT,
+    cache_dir: CacheDirOption = None,
+    cache_size: CacheSizeOption = cache.DEFAULT_CACHE_SIZE // (1024 * 1024),
+    rate: RateOption = ratelimit.DEFAULT_RATE,
+    max_retries: MaxRetriesOption = session.DEFAULT_MAX_RETRIES,
+    raw: RawOption = False,
+    max_resolution: MaxResolutionOption = None,
+    prefer: PreferOption = sources.PREFER_LARGEST,
+    probe_size: ProbeSizeOption = False,
+    metrics_file: MetricsFileOption = None,
+    prometheus_file: PrometheusFileOption = None,
+    log_file: LogFileOption = None,
+    profile: ProfileOption = False,
+    profile_top: ProfileTopOption = profiling.DEFAULT_TOP,
+    use_store: StoreOption = True,
+    resume: ResumeOption = True,
+):
+    """
+    Recover many users into one sub directory each
+
+    The users share the session, rate limiter and worker pools
+    """
+    if not output_path.is_dir():
+        playstv.structured_error("initialization", "Specified path is not a directory")
+        return
+
+    usernames = read_usernames(users_file)
+    if not usernames:
+        playstv.structured_error("initialization", "No usernames to recover")
+        return
+
+    configure_run(
+        pool_size=max(pool_size, workers * segments, lookup_workers),
+        timeout=timeout,
+        user_agent=user_agent,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        rate=rate,
+        max_retries=max_retries,
+        raw=raw,
+        source_policy=sources.SourcePolicy(prefer, max_resolution, probe_size),
+        segments=segments,
+        buffer_size=buffer_size,
+        max_bandwidth=max_bandwidth,
+        bandwidth_file=bandwidth_file,
+        monitor_bandwidth=True,
+        metrics_file=metrics_file,
+        prometheus_file=prometheus_file,
+        log_file=log_file,
+        profile_dir=profile_path(output_path) if profile else None,
+        profile_top=profile_top,
+        store_dir=output_path / store.STORE_DIR_NAME if use_store else None,
+    )
+
+    # Interleaved output of several users does not fit in progress bars
+    playstv.set_progress_enabled(False)
+    lookup_scheduler = scheduler.FairScheduler(lookup_workers)
+    download_scheduler = scheduler.FairScheduler(workers)
+    summaries: list[dict] = []
+
+    playstv.structured_info(
+        "batch", f"Recovering {len(usernames)} users ({concurrent_users} at a time)"
+    )
+
+    # Users not started yet are dropped on Ctrl-C, the running ones finish
+    futures: dict[Future, str] = {}
+    with playstv.worker_pool(None, concurrent_users, futures) as users:
+        futures.update(
+            (
+                users.submit(
+                    recover_user,
+                    username,
+                    output_path / username,
+                    workers=workers,
+                    lookup_workers=lookup_workers,
+                    bulk_resolve=bulk_resolve,
+                    resume=resume,
+                    lookup_executor=lookup_scheduler.for_key(username),
+                    download_executor=download_scheduler.for_key(username),
+                ),
+                username,
+            )
+            for username in usernames
+        )
+        for future in as_completed(futures):
+            username = futures[future]
+            try:
+                summary = future.result()
+            except Exception as ex:
+                playstv.structured_error("batch", f"Recovery of {username} failed")
+                summary = {"user": username, "status": "error", "error": str(ex)}
+            summaries.append(summary)
+            playstv.structured_info(
+                "batch",
+                f"[{len(summaries)}/{len(usernames)}] {username}: {summary['status']}"
+                f" ({summary.get('downloaded', 0)} downloaded,"
+                f" {summary.get('failed', 0)} failed)",
+            )
+
+    lookup_scheduler.shutdown()
+    download_scheduler.shutdown()
+
+    summaries.sort(key=lambda x: usernames.index(x["user"]))
+    with open(output_path / BATCH_SUMMARY_FILE_NAME, "w", encoding="utf-8") as file:
+        json.dump(summaries, file, indent=2)
+
+    playstv.structured_info(
+        "batch",
+        f"[green]Finished {len(usernames)} users, "
+        f"{sum(x.get('downloaded', 0) for x in summaries)} videos downloaded",
+    )
+
+
+@app.command()
+def plan(
+    manifest_path: ManifestOption,
+    user: Annotated[
+        Optional[list[str]], typer.Option(help="User to plan, can be repeated")
+    ] = None,
+    users_file: Annotated[
+        Optional[Path],
+        typer.Option(help='File with one username per line, "-" for stdin'),
+    ] = None,
+    lookup_workers: LookupWorkersOption = playstv.DEFAULT_LOOKUP_WORKERS,
+    bulk_resolve: BulkResolveOption = False,
+    pool_size: PoolSizeOption = session.DEFAULT_POOL_SIZE,
+    timeout: TimeoutOption = session.DEFAULT_TIMEOUT,
+    user_agent: UserAgentOption = session.DEFAULT_USER_AGENT,
+    cache_dir: CacheDirOption = None,
+    cache_size: CacheSizeOption = cache.DEFAULT_CACHE_SIZE // (1024 * 1024),
+    rate: RateOption = ratelimit.DEFAULT_RATE,
+    max_retries: MaxRetriesOption = session.DEFAULT_MAX_RETRIES,
+    raw: RawOption = False,
+    max_resolution: MaxResolutionOption = None,
+    prefer: PreferOption = sources.PREFER_LARGEST,
+    probe_size: ProbeSizeOption = False,
+    metrics_file: MetricsFileOption = None,
+    prometheus_file: PrometheusFileOption = None,
+    log_file: LogFileOption = None,
+    profile: ProfileOption = False,
+    profile_top: ProfileTopOption = profiling.DEFAULT_TOP,
+):
+    """
+    Write the resolved videos of users to a manifest for execute
+
+    Videos are discovered and resolved here, but not downloaded
+    """
+    usernames = list(user or [])
+    if users_file is not None:
+        usernames += read_usernames(users_file)
+    usernames = list(dict.fromkeys(usernames))
+    if not usernames:
+        playstv.structured_error("initialization", "No usernames to plan")
+        return
+
+    configure_run(
+        pool_size=max(pool_size, lookup_workers),
+        timeout=timeout,
+        user_agent=user_agent,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        rate=rate,
+        max_retries=max_retries,
+        raw=raw,
+        source_policy=sources.SourcePolicy(prefer, max_resolution, probe_size),
+        metrics_file=metrics_file,
+        prometheus_file=prometheus_file,
+        log_file=log_file,
+        profile_dir=profile_path(manifest_path) if profile else None,
+        profile_top=profile_top,
+    )
+
+    planned: int = 0
+    planned_bytes: int = 0
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        for username in usernames:
+            try:
+                with metrics.stage("profile"):
+                    user_profile = playstv.get_profile(username)
+                if user_profile is None:
+                    playstv.structured_error(
+                        "plan", f"Could not get user profile of {username}"
+                    )
+                    continue
+
+                with metrics.stage("discover"):
+                    user_profile.get_user_id()
+                    user_profile.get_initial_videos()
+                    user_profile.get_more_videos()
+                with metrics.stage("availability"):
+                    user_profile.check_video_availability(
+                        lookup_workers, load_snapshot_index() if bulk_resolve else None
+                    )
+                # Resolving the video urls here leaves only CDN downloads to
+                # the nodes executing the manifest
+                with metrics.stage("sources"):
+                    user_profile.resolve_video_sources(lookup_workers)
+
+                planned += manifest.write_entries(file, user_profile)
+                planned_bytes += sum(
+                    x.expected_bytes or 0 for x in user_profile.videos.valid
+                )
+            except Exception:
+                playstv.structured_error("plan", f"Planning of {username} failed")
+
+    playstv.structured_info(
+        "plan",
+        f"[green]Wrote {planned} videos of {len(usernames)} users to {manifest_path}",
+    )
+    if probe_size:
+        playstv.structured_info(
+            "plan", f"Probed sources add up to {planned_bytes / 1024**2:.1f} MiB"
+        )
+
+
+@app.command(
+    help="Download one shard of a manifest written by plan\n\n"
+    "Videos go into one sub directory per user. The content store is off unless "
+    "--store is given, the nodes may share the output directory and the SQLite "
+    "index of the store is not safe on network file systems"
+)
+def execute(
+    output_path: OutputPathOption,
+    manifest_path: ManifestOption,
+    shard: Annotated[
+        str,
+        typer.Option(help="Download only shard i of N (1 <= i <= N), e.g. 2/4"),
+    ] = "1/1",
+    workers: WorkersOption = playstv.DEFAULT_DOWNLOAD_WORKERS,
+    segments: SegmentsOption = download.DEFAULT_SEGMENTS,
+    buffer_size: BufferSizeOption = writer.DEFAULT_BUFFER_SIZE // 1024,
+    max_bandwidth: MaxBandwidthOption = None,
+    bandwidth_file: BandwidthFileOption = None,
+    pool_size: PoolSizeOption = session.DEFAULT_POOL_SIZE,
+    timeout: TimeoutOption = session.DEFAULT_TIMEOUT,
+    user_agent: UserAgentOption = session.DEFAULT_USER_AGENT,
+    cache_dir: CacheDirOption = None,
+    cache_size: CacheSizeOption = cache.DEFAULT_CACHE_SIZE // (1024 * 1024),
+    rate: RateOption = ratelimit.DEFAULT_RATE,
+    max_retries: MaxRetriesOption = session.DEFAULT_MAX_RETRIES,
+    raw: RawOption = False,
+    max_resolution: MaxResolutionOption = None,
+    prefer: PreferOption = sources.PREFER_LARGEST,
+    probe_size: ProbeSizeOption = False,
+    metrics_file: MetricsFileOption = None,
+    prometheus_file: PrometheusFileOption = None,
+    log_file: LogFileOption = None,
+    profile: ProfileOption = False,
+    profile_top: ProfileTopOption = profiling.DEFAULT_TOP,
+    use_store: StoreOption = False,
+):
+    if not output_path.is_dir():
+        playstv.structured_error("initialization", "Specified path is not a directory")
+        return
 
-    # return if user profile does not exist in archive
-    if user_profile is None:
-        playstv.structured_error("initialization", "Could not get user profile")
+    try:
+        index, count = manifest.parse_shard(shard)
+        entries = manifest.read_manifest(str(manifest_path))
+        entries = list(manifest.select_shard(entries, index, count))
+    except (OSError, manifest.ManifestError) as ex:
+        playstv.structured_error("initialization", str(ex))
         return
 
-    # Get user id
-    user_profile.get_user_id()
+    user_profiles = manifest.group_by_user(entries)
+    playstv.structured_info(
+        "execute",
+        f"Shard {index}/{count}: {len(entries)} videos of {len(user_profiles)} users",
+    )
+
+    configure_run(
+        pool_size=max(pool_size, workers * segments),
+        timeout=timeout,
+        user_agent=user_agent,
+        cache_dir=cache_dir,
+        cache_size=cache_size,
+        rate=rate,
+        max_retries=max_retries,
+        raw=raw,
+        source_policy=sources.SourcePolicy(prefer, max_resolution, probe_size),
+        segments=segments,
+        buffer_size=buffer_size,
+        max_bandwidth=max_bandwidth,
+        bandwidth_file=bandwidth_file,
+        monitor_bandwidth=True,
+        metrics_file=metrics_file,
+        prometheus_file=prometheus_file,
+        log_file=log_file,
+        profile_dir=(
+            profile_path(output_path, f"-{index}-of-{count}") if profile else None
+        ),
+        profile_top=profile_top,
+        store_dir=output_path / store.STORE_DIR_NAME if use_store else None,
+    )
+
+    # Users are downloaded one after another through a single pool
+    with ThreadPoolExecutor(max_workers=workers) as download_executor:
+        for user, user_profile in user_profiles.items():
+            started = time.monotonic()
+            user_output_path = output_path / user
+            user_output_path.mkdir(exist_ok=True)
+            with metrics.stage("download"):
+                user_profile.download_videos(
+                    str(user_output_path), workers, executor=download_executor
+                )
+            # Nodes may share the output directory, each shard has its own summary
+            write_summary(
+                user_output_path,
+                user,
+                "ok",
+                user_profile,
+                started,
+                file_name=f"summary-{index}-of-{count}.json",
+            )
+
+
+def configure_run(
+    pool_size: int,
+    timeout: float,
+    user_agent: str,
+    cache_dir: Path | None,
+    cache_size: int,
+    rate: float,
+    max_retries: int,
+    raw: bool,
+    source_policy: sources.SourcePolicy | None = None,
+    segments: int = 1,
+    buffer_size: int = writer.DEFAULT_BUFFER_SIZE // 1024,
+    max_bandwidth: float | None = None,
+    bandwidth_file: Path | None = None,
+    monitor_bandwidth: bool = False,
+    metrics_file: Path | None = None,
+    prometheus_file: Path | None = None,
+    log_file: Path | None = None,
+    profile_dir: Path | None = None,
+    profile_top: int = profiling.DEFAULT_TOP,
+    store_dir: Path | None = None,
+) -> None:
+    """
+    Set up the session, cache, rate limiter, capture mode, source policy,
+    download settings, bandwidth budget, metrics and content store every
+    request of the run shares
+    """
+    if log_file is not None:
+        playstv.set_log_file(str(log_file))
+    if metrics_file is not None or prometheus_file is not None:
+        # Written when the run ends, however it ends
+        atexit.register(
+            metrics.export,
+            str(metrics_file) if metrics_file else None,
+            str(prometheus_file) if prometheus_file else None,
+        )
+    if profile_dir is not None:
+        # Every stage timed by metrics is profiled too
+        profiler = profiling.Profiler(str(profile_dir), top=profile_top)
+        profiler.start()
+        metrics.get_metrics().stage_hooks.append(profiler.stage)
+        atexit.register(finish_profile, profiler)
+
+    # Every request of the run shares one pooled keep-alive session
+    session.configure(pool_size=pool_size, timeout=timeout, user_agent=user_agent)
+    session.set_rate_limiter(ratelimit.RateLimiter(rate=rate), max_retries)
+    wayback.set_raw_mode(raw)
+    sources.set_policy(source_policy or sources.SourcePolicy())
+    download.set_max_segments(segments)
+    writer.set_buffer_size(buffer_size * 1024)
+
+    bandwidth_limiter = ratelimit.BandwidthLimiter(
+        max_bandwidth * 1024**2 if max_bandwidth else None
+    )
+    session.set_bandwidth_limiter(bandwidth_limiter)
+    if monitor_bandwidth:
+        # Reports throughput while running and once more when the run ends
+        monitor = ratelimit.BandwidthMonitor(
+            bandwidth_limiter,
+            lambda message: playstv.structured_info("bandwidth", message),
+            control_file=str(bandwidth_file) if bandwidth_file else None,
+        )
+        monitor.start()
+        atexit.register(monitor.stop)
+
+    if cache_dir is not None:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        session.set_cache(
+            cache.ResponseCache(str(cache_dir), max_size=cache_size * 1024 * 1024)
+        )
+
+    # Shared by every user of the run, so each video is downloaded once
+    store.set_store(store.ContentStore(str(store_dir)) if store_dir else None)
+
+
+def recover_user(
+    user: str,
+    output_path: Path,
+    workers: int = playstv.DEFAULT_DOWNLOAD_WORKERS,
+    lookup_workers: int = playstv.DEFAULT_LOOKUP_WORKERS,
+    bulk_resolve: bool = False,
+    stream: bool = False,
+    resume: bool = True,
+    lookup_executor: Executor | None = None,
+    download_executor: Executor | None = None,
+) -> dict:
+    """
+    Run every stage for one user and write its summary.json, returns the
+    summary
+    """
+    started = time.monotonic()
+    output_path.mkdir(parents=True, exist_ok=True)
+    job_state = state.JobState(str(output_path))
+
+    try:
+        # Resume from the recorded state of an earlier run, otherwise create a
+        # UserProfile instance if archive is available
+        user_profile = job_state.load_profile(user) if resume else None
+
+        if user_profile is not None:
+            playstv.structured_info(
+                "initialization",
+                f"Resuming {user} from stage {job_state.stage(user)} "
+                f"({len(user_profile.videos)} videos)",
+            )
+        else:
+            with metrics.stage("profile"):
+                user_profile = playstv.get_profile(user)
+
+        # return if user profile does not exist in archive
+        if user_profile is None:
+            playstv.structured_error("initialization", "Could not get user profile")
+            return write_summary(output_path, user, "unavailable", None, started)
+
+        # Stages finished by an earlier run are skipped when resuming
+        discovered = resume and job_state.reached(user, state.STAGE_DISCOVERED)
+        resolved = resume and job_state.reached(user, state.STAGE_RESOLVED)
+
+        def save_stage(stage: str) -> None:
+            # Without the user id or with pages missing the video list is
+            # incomplete, so no stage is recorded and the next run discovers
+            # again
+            job_state.save_profile(
+                user_profile, stage if user_profile.discovered else state.STAGE_NEW
+            )
+
+        if stream and not discovered:
+            # Discover, resolve and download at the same time
+            with metrics.stage("stream"):
+                pipeline.StreamingPipeline(
+                    user_profile,
+                    str(output_path),
+                    lookup_workers=lookup_workers,
+                    download_workers=workers,
+                    snapshot_index=load_snapshot_index() if bulk_resolve else None,
+                    on_finished=lambda video: job_state.save_video(user, video),
+                ).run()
+
+            save_stage(state.STAGE_RESOLVED)
+            discovered = resolved = True
+
+        if not discovered:
+            with metrics.stage("discover"):
+                # Get user id
+                user_profile.get_user_id()
+
+                # Get initial videos available from profile page
+                user_profile.get_initial_videos()
+
+                # Get more videos
+                user_profile.get_more_videos()
+
+            save_stage(state.STAGE_DISCOVERED)
+
+        if not user_profile.discovered:
+            playstv.structured_warning(
+                "discover", f"Discovery of {user} is incomplete, it is retried next run"
+            )
+
+        if not resolved:
+            # Resolve snapshots in bulk, videos missing from the index fall back
+            # to their own availability lookup
+            with metrics.stage("availability"):
+                snapshot_index = None
+                if bulk_resolve:
+                    snapshot_index = load_snapshot_index()
+
+                # Check availability of videos
+                user_profile.check_video_availability(
+                    lookup_workers, snapshot_index, executor=lookup_executor
+                )
+
+            save_stage(state.STAGE_RESOLVED)
+
+        # Download available user videos, recording each result as it finishes.
+        # After a streaming run this retries the videos that failed
+        with metrics.stage("download"):
+            user_profile.download_videos(
+                str(output_path),
+                workers,
+                on_finished=lambda video: job_state.save_video(user, video),
+                executor=download_executor,
+            )
+
+        if not user_profile.videos.pending:
+            save_stage(state.STAGE_DOWNLOADED)
+
+        return write_summary(output_path, user, "ok", user_profile, started)
+    finally:
+        job_state.close()
+
+
+def profile_path(path: Path, suffix: str = "") -> Path:
+    """
+    Directory the profile reports of a run writing to path go to, next to it
+    """
+    path = path.resolve()
+    return path.with_name(f"{path.stem}{suffix}-profile")
+
+
+def finish_profile(profiler: profiling.Profiler) -> None:
+    profiler.stop()
+    if not profiler.stages:
+        return
+    profiler.write_reports()
+    playstv.structured_info("profile", f"Wrote stage reports to {profiler.directory}")
+    typer.echo(profiler.summary())
+
+
+def write_summary(
+    output_path: Path,
+    user: str,
+    status: str,
+    user_profile: playstv.UserProfile | None,
+    started: float,
+    file_name: str = SUMMARY_FILE_NAME,
+) -> dict:
+    """
+    Write the summary.json of a user and return it
+    """
+    videos = user_profile.videos if user_profile is not None else None
+    summary = {
+        "user": user,
+        "status": status,
+        "videos": len(videos) if videos is not None else 0,
+        "valid": videos.count(VIEW_VALID) if videos is not None else 0,
+        "downloaded": videos.count(VIEW_DOWNLOADED) if videos is not None else 0,
+        "failed": videos.count(VIEW_FAILED) if videos is not None else 0,
+        "bytes": sum(x.downloaded_bytes for x in videos) if videos is not None else 0,
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    with open(output_path / file_name, "w", encoding="utf-8") as file:
+        json.dump(summary, file, indent=2)
+    return summary
+
+
+def check_choice(value: str, choices: tuple[str, ...]) -> str:
+    if value not in choices:
+        raise typer.BadParameter(f"must be one of {', '.join(choices)}")
+    return value
+
+
+def read_usernames(users_file: Path) -> list[str]:
+    """
+    Usernames listed one per line, blank lines and # comments are skipped
+    """
+    if str(users_file) == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        lines = users_file.read_text(encoding="utf-8").splitlines()
+
+    usernames = [x.split("#", 1)[0].strip() for x in lines]
+    return list(dict.fromkeys(x for x in usernames if x))
+
 
-    # Get initial videos available from profile page
-    user_profile.get_initial_videos()
+def load_snapshot_index() -> wayback.SnapshotIndex | None:
+    """
+    Bulk snapshot index shared by every user of the run, queried on first
+    use. A failed query is not repeated, None is returned from then on
+    """
+    global __snapshot_index__, __snapshot_index_failed__
 
-    # Get more videos
-    user_profile.get_more_videos()
+    with __snapshot_index_lock__:
+        if __snapshot_index_failed__:
+            return None
+        if __snapshot_index__ is None or not __snapshot_index__.loaded:
+            __snapshot_index__ = query_snapshot_index()
+            __snapshot_index_failed__ = __snapshot_index__ is None
+        return __snapshot_index__
 
-    # Check availability of videos
-    user_profile.check_video_availability()
 
-    # Download available user videos
-    user_profile.download_videos(output_path.name)
+def query_snapshot_index() -> wayback.SnapshotIndex | None:
+    snapshot_index = wayback.SnapshotIndex()
+    playstv.structured_info("availability", "Querying bulk snapshot index")
+    try:
+        snapshot_index.load()
+    except Exception:
+        playstv.structured_warning(
+            "availability", "Bulk snapshot query failed, using per video lookups"
+        )
+        return None
+    playstv.structured_info(
+        "availability", f"Indexed {len(snapshot_index)} embed snapshots"
+    )
+    if not snapshot_index.complete:
+        playstv.structured_warning(
+            "availability",
+            f"Bulk snapshot index stopped after {snapshot_index.max_pages} pages, "
+            "videos missing from it are looked up one by one",
+        )
+    return snapshot_index
 
 
-def main():  # noqa: F811
+def main():
     app()
 
 
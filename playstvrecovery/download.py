@@ -0,0 +1,308 @@
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import re
+from threading import Lock
+from typing import Callable
+
+from . import session
+from .writer import DIGEST_ALGORITHM, PartFile
+
+
+PART_SUFFIX: str = ".part"
+# Record of the byte ranges of a .part file already written, a part file
+# is allocated to its full size and only its record tells what it holds
+SEGMENTS_SUFFIX: str = ".segments"
+# Bytes written by a segment between two saves of its record
+CHECKPOINT_SIZE: int = 16 * 1024 * 1024
+
+# Segments fetched at once for one file when segmenting is enabled, files
+# smaller than two segments of MIN_SEGMENT_SIZE stay a single stream
+DEFAULT_SEGMENTS: int = 4
+MIN_SEGMENT_SIZE: int = 4 * 1024 * 1024
+
+__content_range_pattern__ = re.compile(r"bytes\s+(\d+|\*)(?:-(\d+))?/(\d+|\*)")
+__max_segments__: int = 1
+
+
+class IncompleteDownload(Exception):
+    """
+    Raised when the received bytes do not add up to the announced size
+    """
+
+
+class RangesUnsupported(Exception):
+    """
+    Raised when a range request of a segment is not answered with that range
+    """
+
+
+class Segment:
+    __slots__ = ("start", "end", "written")
+
+    def __init__(self, start: int, end: int, written: int = 0) -> None:
+        self.start: int = start
+        self.end: int = end
+        self.written: int = written
+
+    @property
+    def remaining(self) -> int:
+        return self.end + 1 - self.start - self.written
+
+
+class SegmentRecord:
+    """
+    Progress of the segments of a .part file, saved next to it so an
+    interrupted download continues each segment where it stopped
+    """
+
+    def __init__(self, path: str, segments: list[Segment]) -> None:
+        self.path: str = path
+        self.segments: list[Segment] = segments
+        self.__lock__: Lock = Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "SegmentRecord | None":
+        try:
+            with open(path, encoding="utf-8") as file:
+                segments = [Segment(*x) for x in json.load(file)]
+        except (OSError, ValueError, TypeError):
+            return None
+        return cls(path, segments) if segments else None
+
+    @property
+    def total(self) -> int:
+        return self.segments[-1].end + 1
+
+    def save(self) -> None:
+        with self.__lock__:
+            temporary_path = self.path + ".tmp"
+            with open(temporary_path, "w", encoding="utf-8") as file:
+                json.dump([[x.start, x.end, x.written] for x in self.segments], file)
+            os.replace(temporary_path, self.path)
+
+
+def set_max_segments(segments: int) -> None:
+    """
+    Number of ranges a file may be split into, 1 disables segmenting
+    """
+    global __max_segments__
+    __max_segments__ = max(1, segments)
+
+
+def plan_segments(total: int, max_segments: int, start: int = 0) -> list[Segment]:
+    """
+    Split the bytes from start to total into up to max_segments ranges, the
+    bytes before start are recorded as one finished segment
+    """
+    count = max(1, min(max_segments, (total - start) // MIN_SEGMENT_SIZE))
+    size = -(-(total - start) // count)
+    segments = [Segment(0, start - 1, start)] if start else []
+    return segments + [
+        Segment(x, min(x + size, total) - 1) for x in range(start, total, size)
+    ]
+
+
+def parse_content_range(header: str | None) -> tuple[int | None, int | None]:
+    """
+    Return (first byte, total size) of a Content-Range header
+    """
+    match = __content_range_pattern__.match(header or "")
+    if not match:
+        return None, None
+    start = None if match.group(1) == "*" else int(match.group(1))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    return start, total
+
+
+def download_file(
+    url: str,
+    file_path: str,
+    buffer_size: int | None = None,
+    max_segments: int | None = None,
+    on_digest: Callable[[str], None] | None = None,
+) -> int:
+    """
+    Stream url into a .part file next to file_path, resuming from its current
+    size with a Range request, and rename it to file_path once complete.
+    Large files of servers accepting ranges are fetched in up to max_segments
+    concurrent ranges instead. Returns the size of the finished file, its
+    digest is passed to on_digest
+    """
+    algorithm = DIGEST_ALGORITHM if on_digest is not None else None
+    max_segments = __max_segments__ if max_segments is None else max_segments
+    part_path = file_path + PART_SUFFIX
+    segments_path = part_path + SEGMENTS_SUFFIX
+
+    if os.path.isfile(segments_path):
+        record = SegmentRecord.load(segments_path)
+        if record is not None and os.path.isfile(part_path):
+            try:
+                return download_segments(
+                    url, file_path, record, buffer_size, on_digest=on_digest
+                )
+            except RangesUnsupported:
+                pass
+        # Without its record the filled ranges of the part file are unknown
+        remove_part(part_path)
+
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+
+    with session.get(url, stream=True, headers=headers) as response:
+        if offset and response.status_code == 416:
+            # A part file as long as the whole one but without its record may
+            # be space reserved before anything was written, start over
+            os.remove(part_path)
+            return download_file(url, file_path, buffer_size, max_segments, on_digest)
+
+        response.raise_for_status()
+
+        if offset and response.status_code == 206:
+            start, total = parse_content_range(response.headers.get("Content-Range"))
+            if start != offset:
+                raise IncompleteDownload(f"Server resumed at {start}, not {offset}")
+            accepts_ranges = True
+        else:
+            # Server ignored the range, start over
+            if offset:
+                remove_part(part_path)
+                offset = 0
+            content_length = response.headers.get("Content-Length")
+            total = int(content_length) if content_length else None
+            accepts_ranges = (
+                response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            )
+
+        if not total:
+            # Nothing to reserve space for, append the body as it arrives
+            with PartFile(
+                part_path, buffer_size=buffer_size, algorithm=algorithm
+            ) as part_file:
+                size = offset + part_file.stream(response, offset)
+                digest = part_file.commit(file_path)
+            if on_digest is not None:
+                on_digest(digest)
+            return size
+
+        if not accepts_ranges or total - offset < 2 * MIN_SEGMENT_SIZE:
+            max_segments = 1
+        record = SegmentRecord(
+            segments_path, plan_segments(total, max_segments, start=offset)
+        )
+        try:
+            return download_segments(
+                url,
+                file_path,
+                record,
+                buffer_size,
+                first_response=response,
+                on_digest=on_digest,
+            )
+        except RangesUnsupported:
+            remove_part(part_path)
+            return download_file(
+                url, file_path, buffer_size, max_segments=1, on_digest=on_digest
+            )
+
+
+def download_segments(
+    url: str,
+    file_path: str,
+    record: SegmentRecord,
+    buffer_size: int | None = None,
+    first_response=None,
+    on_digest: Callable[[str], None] | None = None,
+) -> int:
+    """
+    Fetch the unfinished segments of a record concurrently into the part
+    file. A first_response is the GET that started or resumed the download,
+    it is read as the first unfinished segment while the others are
+    requested with ranges
+    """
+    algorithm = DIGEST_ALGORITHM if on_digest is not None else None
+    pending = [x for x in record.segments if x.remaining]
+    first = pending[0] if first_response is not None and pending else None
+    others = [x for x in pending if x is not first]
+    errors: list[Exception] = []
+
+    part_path = file_path + PART_SUFFIX
+    with PartFile(part_path, buffer_size=buffer_size, algorithm=algorithm) as part_file:
+        # Saved before space is reserved, a part file without its record is
+        # only ever the prefix of a sequential download
+        record.save()
+        part_file.allocate(record.total)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(others))) as executor:
+            futures = [
+                executor.submit(fetch_segment, url, part_file, x, record)
+                for x in others
+            ]
+            if first is not None:
+                try:
+                    write_segment(first_response, part_file, first, record)
+                except Exception as ex:
+                    errors.append(ex)
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as ex:
+                    errors.append(ex)
+
+        if errors:
+            raise next(
+                (x for x in errors if isinstance(x, RangesUnsupported)), errors[0]
+            )
+
+        digest = part_file.commit(file_path)
+
+    os.remove(record.path)
+    if on_digest is not None:
+        on_digest(digest)
+    return record.total
+
+
+def fetch_segment(
+    url: str, part_file: PartFile, segment: Segment, record: SegmentRecord
+) -> None:
+    start = segment.start + segment.written
+    headers = {"Range": f"bytes={start}-{segment.end}"}
+
+    with session.get(url, stream=True, headers=headers) as response:
+        response.raise_for_status()
+        first_byte, total = parse_content_range(response.headers.get("Content-Range"))
+        if response.status_code != 206 or first_byte != start or total != record.total:
+            raise RangesUnsupported(f"Range {start}-{segment.end} was not served")
+        write_segment(response, part_file, segment, record)
+
+
+def write_segment(
+    response, part_file: PartFile, segment: Segment, record: SegmentRecord
+) -> None:
+    saved = segment.written
+
+    def advance(count: int) -> None:
+        nonlocal saved
+        segment.written += count
+        if segment.written - saved >= CHECKPOINT_SIZE:
+            record.save()
+            saved = segment.written
+
+    try:
+        # The first segment may read a response that goes on past its end
+        part_file.stream(
+            response, segment.start + segment.written, segment.remaining, advance
+        )
+    finally:
+        record.save()
+
+    if segment.remaining:
+        raise IncompleteDownload(
+            f"Segment {segment.start}-{segment.end} misses {segment.remaining} bytes"
+        )
+
+
+def remove_part(part_path: str) -> None:
+    for path in (part_path, part_path + SEGMENTS_SUFFIX):
+        if os.path.isfile(path):
+            os.remove(path)
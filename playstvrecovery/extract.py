@@ -0,0 +1,155 @@
+import json
+import re
+from html import unescape
+
+from .metrics import timed
+
+
+# The page shapes below are small and regular, a targeted scan finds the
+# few values needed without building a tree. Whenever the scan does not
+# recognise a page it falls back to parsing only the relevant tags, bs4 is
+# not even imported until then.
+
+__attribute_pattern__ = re.compile(
+    r"""([^\s=/>"']+)\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+))"""
+)
+__button_pattern__ = re.compile(r"<button\b([^>]*)>", re.IGNORECASE)
+__ld_json_pattern__ = re.compile(
+    r"<script\b([^>]*)>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL
+)
+__video_pattern__ = re.compile(
+    r"<video\b[^>]*>(.*?)</video\s*>", re.IGNORECASE | re.DOTALL
+)
+__source_pattern__ = re.compile(r"<source\b([^>]*)>", re.IGNORECASE)
+__li_start_pattern__ = re.compile(r"<li\b([^>]*)>", re.IGNORECASE)
+__title_pattern__ = re.compile(
+    r"<a\b([^>]*)>(.*?)</a\s*>", re.IGNORECASE | re.DOTALL
+)
+__tag_pattern__ = re.compile(r"<[^>]*>")
+
+
+def parse_attributes(tag_body: str) -> dict[str, str]:
+    """
+    Attributes of a start tag given the text between its name and '>'
+    """
+    return {
+        match.group(1).lower(): unescape(
+            next(x for x in match.groups()[1:] if x is not None)
+        )
+        for match in __attribute_pattern__.finditer(tag_body)
+    }
+
+
+def parse_only(page: str, *args, **kwargs):
+    """
+    Tree of the tags of page matching SoupStrainer(*args, **kwargs)
+    """
+    from bs4 import BeautifulSoup, SoupStrainer
+
+    return BeautifulSoup(page, "html.parser", parse_only=SoupStrainer(*args, **kwargs))
+
+
+def to_text(page: str | bytes) -> str:
+    if isinstance(page, bytes):
+        return page.decode("utf-8", errors="replace")
+    return page
+
+
+@timed("parse_seconds", page="user_id")
+def find_user_id(page: str | bytes) -> str | None:
+    """
+    data-obj-id of the profile's "Add Friend" button
+    """
+    page = to_text(page)
+    for match in __button_pattern__.finditer(page):
+        attributes = parse_attributes(match.group(1))
+        if attributes.get("title") == "Add Friend" and "data-obj-id" in attributes:
+            return attributes["data-obj-id"]
+
+    soup = parse_only(page, "button")
+    html_element = soup.find("button", {"title": "Add Friend"})
+    if html_element is None:
+        return None
+    return html_element.attrs.get("data-obj-id")
+
+
+@timed("parse_seconds", page="profile")
+def find_ld_json_videos(page: str | bytes) -> list[dict]:
+    """
+    "video" entries of the first ld+json script on a profile page
+    """
+    page = to_text(page)
+    for match in __ld_json_pattern__.finditer(page):
+        if parse_attributes(match.group(1)).get("type") != "application/ld+json":
+            continue
+        try:
+            return json.loads(match.group(2))["video"]
+        except (ValueError, KeyError, TypeError):
+            break
+
+    soup = parse_only(page, "script", type="application/ld+json")
+    return [json.loads(x.string) for x in soup.find_all("script")][0]["video"]
+
+
+@timed("parse_seconds", page="embed")
+def find_video_sources(page: str | bytes) -> list[dict[str, str]] | None:
+    """
+    Attributes of every <source> of the first <video> on an embed page,
+    None when the page has no video element
+    """
+    page = to_text(page)
+    match = __video_pattern__.search(page)
+    if match is not None:
+        return [
+            parse_attributes(x.group(1))
+            for x in __source_pattern__.finditer(match.group(1))
+        ]
+
+    soup = parse_only(page, "video")
+    video_element = soup.find("video")
+    if video_element is None:
+        return None
+    return [dict(x.attrs) for x in video_element.find_all("source")]
+
+
+@timed("parse_seconds", page="module")
+def find_video_items(body: str | bytes) -> list[tuple[str, str]]:
+    """
+    (data-feed-id, title) of every li.video-item of a ws/module body, items
+    without an id or title are skipped
+    """
+    body = to_text(body)
+    starts = [
+        (match, parse_attributes(match.group(1)))
+        for match in __li_start_pattern__.finditer(body)
+    ]
+    starts = [
+        (match, attributes)
+        for match, attributes in starts
+        if "video-item" in attributes.get("class", "").split()
+    ]
+
+    items: list[tuple[str, str]] = []
+    for index, (match, attributes) in enumerate(starts):
+        end = starts[index + 1][0].start() if index + 1 < len(starts) else len(body)
+        video_id = attributes.get("data-feed-id")
+        if not video_id:
+            continue
+
+        for title_match in __title_pattern__.finditer(body, match.end(), end):
+            title_attributes = parse_attributes(title_match.group(1))
+            if "title" in title_attributes.get("class", "").split():
+                title = unescape(__tag_pattern__.sub("", title_match.group(2)))
+                items.append((video_id, title))
+                break
+
+    if items or "video-item" not in body:
+        return items
+
+    soup_body = parse_only(body, "li", {"class": "video-item"})
+    for video_item_element in soup_body.find_all("li", {"class": "video-item"}):
+        video_id = video_item_element.attrs.get("data-feed-id")
+        title_element = video_item_element.find("a", {"class": "title"})
+        if video_id and title_element is not None:
+            items.append((video_id, title_element.text))
+    return items
@@ -0,0 +1,115 @@
+import hashlib
+import json
+from typing import IO, Iterable, Iterator
+
+from .playstv import UserProfile, Video
+
+
+# Keys of every manifest line, in the order they are written
+MANIFEST_FIELDS: tuple[str, ...] = (
+    "user",
+    "video_id",
+    "title",
+    "archive_url",
+    "video_url",
+    "resolution",
+    "size",
+)
+
+
+class ManifestError(Exception):
+    """
+    Raised for an unreadable manifest line or an invalid shard
+    """
+
+
+def manifest_entry(user: str, video: Video) -> dict:
+    return {
+        "user": user,
+        "video_id": video.id,
+        "title": video.title,
+        "archive_url": video.archive_url,
+        "video_url": video.video_url,
+        "resolution": video.video_resolution,
+        "size": video.expected_bytes,
+    }
+
+
+def write_entries(file: IO[str], user_profile: UserProfile) -> int:
+    """
+    Append a line for every archived video of a profile, returns the
+    number of lines written
+    """
+    written: int = 0
+    for video in user_profile.videos.valid:
+        file.write(json.dumps(manifest_entry(user_profile.username, video)) + "\n")
+        written += 1
+    file.flush()
+    return written
+
+
+def read_manifest(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as file:
+        for line_num, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError as ex:
+                raise ManifestError(f"Line {line_num}: invalid JSON ({ex})") from ex
+            missing = [
+                x for x in ("user", "video_id", "archive_url") if not entry.get(x)
+            ]
+            if missing:
+                raise ManifestError(f"Line {line_num}: missing {', '.join(missing)}")
+            yield entry
+
+
+def video_from_entry(entry: dict) -> Video:
+    video = Video(entry["video_id"], entry.get("title") or entry["video_id"], "")
+    video.archive_url = entry["archive_url"]
+    video.video_url = entry.get("video_url")
+    video.video_resolution = entry.get("resolution")
+    video.expected_bytes = entry.get("size")
+    video.valid = True
+    return video
+
+
+def parse_shard(shard: str) -> tuple[int, int]:
+    """
+    "i/N" to (i, N), shards are numbered from 1 to N
+    """
+    try:
+        index, count = (int(x) for x in shard.split("/"))
+    except ValueError as ex:
+        raise ManifestError(f'Shard "{shard}" is not of the form i/N') from ex
+    if count < 1 or not 1 <= index <= count:
+        raise ManifestError(f'Shard "{shard}" is out of range')
+    return index, count
+
+
+def shard_of(video_id: str, count: int) -> int:
+    """
+    Shard (1 to count) a video belongs to. Uses a stable hash of the id, so
+    every node computes the same partition regardless of manifest order
+    """
+    digest = hashlib.sha1(video_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def select_shard(entries: Iterable[dict], index: int, count: int) -> Iterator[dict]:
+    return (x for x in entries if shard_of(x["video_id"], count) == index)
+
+
+def group_by_user(entries: Iterable[dict]) -> dict[str, UserProfile]:
+    """
+    A UserProfile per user holding the videos of their entries, in
+    manifest order
+    """
+    user_profiles: dict[str, UserProfile] = {}
+    for entry in entries:
+        user = entry["user"]
+        if user not in user_profiles:
+            user_profiles[user] = UserProfile(user)
+        user_profiles[user].videos.append(video_from_entry(entry))
+    return user_profiles
@@ -0,0 +1,305 @@
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+import json
+import os
+import time
+from threading import Lock
+from typing import Callable, ContextManager, Iterator
+from urllib.parse import urlparse
+
+
+# Upper bounds in seconds of the histogram buckets, request latencies and
+# page parse times live on very different scales
+LATENCY_BUCKETS: tuple[float, ...] = (
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60
+)
+PARSE_BUCKETS: tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1
+)
+HISTOGRAM_BUCKETS: dict[str, tuple[float, ...]] = {"parse_seconds": PARSE_BUCKETS}
+# Prefix of every metric name in the Prometheus textfile
+PROMETHEUS_PREFIX: str = "playstvrec"
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    """
+    Counts of observed values per bucket, with their total and sum
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets: tuple[float, ...] = buckets
+        # The last count is the +Inf bucket
+        self.counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """
+        (upper bound, observations at or below it) per bucket, Prometheus
+        style, ending with +Inf
+        """
+        total: int = 0
+        result: list[tuple[str, int]] = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return result
+
+    def quantile(self, share: float) -> float | None:
+        """
+        Upper bound of the bucket holding the given share of observations,
+        None without observations or when it is past the last bucket
+        """
+        total: int = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if self.count and total >= share * self.count:
+                return bound
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(self.cumulative()),
+        }
+
+
+class Metrics:
+    """
+    Thread safe counters and histograms of a run, keyed by name and labels.
+    Stage wall times are counters too, summed over every user going
+    through a stage
+    """
+
+    def __init__(self) -> None:
+        self.started: float = time.time()
+        # Context managers entered around every stage, given its name
+        self.stage_hooks: list[Callable[[str], ContextManager]] = []
+        self.__counters__: dict[tuple[str, Labels], float] = {}
+        self.__histograms__: dict[tuple[str, Labels], Histogram] = {}
+        self.__lock__: Lock = Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        key = (name, to_labels(labels))
+        with self.__lock__:
+            self.__counters__[key] = self.__counters__.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        key = (name, to_labels(labels))
+        with self.__lock__:
+            histogram = self.__histograms__.get(key)
+            if histogram is None:
+                histogram = Histogram(HISTOGRAM_BUCKETS.get(name, LATENCY_BUCKETS))
+                self.__histograms__[key] = histogram
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels: str) -> float:
+        with self.__lock__:
+            return self.__counters__.get((name, to_labels(labels)), 0)
+
+    def histogram(self, name: str, **labels: str) -> Histogram | None:
+        with self.__lock__:
+            return self.__histograms__.get((name, to_labels(labels)))
+
+    @contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Add the wall time spent in the block to the stage's total
+        """
+        started = time.perf_counter()
+        try:
+            with ExitStack() as hooks:
+                for hook in self.stage_hooks:
+                    hooks.enter_context(hook(name))
+                yield
+        finally:
+            self.inc("stage_seconds_total", time.perf_counter() - started, stage=name)
+            self.inc("stage_runs_total", stage=name)
+
+    def summary(self) -> dict:
+        with self.__lock__:
+            counters = sorted(self.__counters__.items())
+            histograms = sorted(self.__histograms__.items(), key=lambda x: x[0])
+            histograms = [(key, x.to_dict()) for key, x in histograms]
+
+        summary: dict = {
+            "started": self.started,
+            "seconds": round(time.time() - self.started, 3),
+            "stages": {},
+            "counters": {},
+            "histograms": {},
+        }
+        for (name, labels), value in counters:
+            if name == "stage_seconds_total":
+                stage = summary["stages"].setdefault(dict(labels)["stage"], {})
+                stage["seconds"] = round(value, 3)
+            elif name == "stage_runs_total":
+                stage = summary["stages"].setdefault(dict(labels)["stage"], {})
+                stage["runs"] = int(value)
+            else:
+                summary["counters"].setdefault(name, []).append(
+                    {"labels": dict(labels), "value": value}
+                )
+        for (name, labels), histogram in histograms:
+            summary["histograms"].setdefault(name, []).append(
+                {"labels": dict(labels), **histogram}
+            )
+        return summary
+
+    def prometheus(self) -> str:
+        """
+        Every metric in the Prometheus text exposition format
+        """
+        with self.__lock__:
+            counters = sorted(self.__counters__.items())
+            histograms = [
+                (key, x.cumulative(), x.sum, x.count)
+                for key, x in sorted(self.__histograms__.items(), key=lambda x: x[0])
+            ]
+
+        lines: list[str] = []
+        typed: set[str] = set()
+        for (name, labels), value in counters:
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{format_labels(labels)} {format_value(value)}")
+
+        for (name, labels), buckets, total, count in histograms:
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} histogram")
+                typed.add(metric)
+            for bound, bucket_count in buckets:
+                bucket_labels = format_labels(labels + (("le", bound),))
+                lines.append(f"{metric}_bucket{bucket_labels} {bucket_count}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {format_value(total)}")
+            lines.append(f"{metric}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path: str) -> None:
+        write_atomic(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path: str) -> None:
+        write_atomic(path, self.prometheus())
+
+
+def to_labels(labels: dict[str, str]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def write_atomic(path: str, text: str) -> None:
+    """
+    Replace path in one step, so collectors never read a partial file
+    """
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w", encoding="utf-8") as file:
+        file.write(text)
+    os.replace(temporary_path, path)
+
+
+def route_of(url: str) -> str:
+    """
+    Kind of archive request a url is, used as a label
+    """
+    parsed = urlparse(url)
+    if parsed.path.endswith("/wayback/available"):
+        return "availability"
+    if parsed.path.endswith("/cdx/search/cdx"):
+        return "cdx"
+    if "/ws/module" in parsed.path:
+        return "module"
+    if "/embeds/" in parsed.path:
+        return "embed"
+    if "/u/" in parsed.path:
+        return "profile"
+    if parsed.path.endswith(".mp4"):
+        return "video"
+    return "other"
+
+
+__metrics__: Metrics = Metrics()
+
+
+def set_metrics(metrics: Metrics) -> None:
+    global __metrics__
+    __metrics__ = metrics
+
+
+def get_metrics() -> Metrics:
+    return __metrics__
+
+
+def inc(name: str, value: float = 1, **labels: str) -> None:
+    __metrics__.inc(name, value, **labels)
+
+
+def observe(name: str, value: float, **labels: str) -> None:
+    __metrics__.observe(name, value, **labels)
+
+
+def stage(name: str):
+    return __metrics__.stage(name)
+
+
+def timed(name: str, **labels: str) -> Callable[[Callable], Callable]:
+    """
+    Decorator recording the duration of every call in a histogram
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                __metrics__.observe(name, time.perf_counter() - started, **labels)
+
+        return wrapper
+
+    return decorator
+
+
+def export(json_path: str | None = None, prometheus_path: str | None = None) -> None:
+    """
+    Write the metrics of the run as a JSON summary and/or Prometheus textfile
+    """
+    if json_path:
+        __metrics__.write_json(json_path)
+    if prometheus_path:
+        __metrics__.write_prometheus(prometheus_path)
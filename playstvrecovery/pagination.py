@@ -0,0 +1,215 @@
+import json
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator
+
+from .extract import find_video_items
+from . import session
+from .wayback import TimestampFinder, build_archive_url, parse_archive_url
+
+
+MODULE_URL: str = "https://plays.tv/ws/module"
+# Capture of the module endpoint tried when the profile's own timestamp fails
+ALTERNATE_MODULE_TIMESTAMP: str = "20191210164752"
+
+# Shared by every profile of the process, so a timestamp found to work for
+# one user is tried first for the next
+module_timestamps: TimestampFinder = TimestampFinder("plays.tv/ws/module")
+
+__feed_id_pattern__ = re.compile(r"""data-feed-id\s*=\s*["']([^"']+)["']""")
+
+
+class PaginationError(Exception):
+    """
+    Raised when a page could not be fetched or decoded with any timestamp
+    """
+
+    def __init__(self, page_num: int, message: str) -> None:
+        super().__init__(f"Page {page_num}: {message}")
+        self.page_num: int = page_num
+
+
+def fetch_text(url: str) -> str:
+    return session.get(url).text
+
+
+class ModulePaginator:
+    """
+    Iterates the ws/module video pages of a profile, yielding the new
+    (video id, title) pairs of each page. While a page is parsed the next
+    one is fetched speculatively, using the last feed id found by a cheap
+    scan of the page body as its last_id.
+
+    A page that is not valid JSON is retried with the timestamp that worked
+    before, then with listed captures of the endpoint closest to the profile
+    snapshot and finally with a fixed alternate timestamp.
+
+    Iteration stops when the module returns an empty body (finished is set)
+    and raises PaginationError when a page fails with every timestamp
+    """
+
+    def __init__(
+        self,
+        archive_url: str,
+        user_id: str,
+        last_id: str,
+        known_ids: set[str] | None = None,
+        fetch: Callable[[str], str] = fetch_text,
+        prefetch: bool = True,
+        start_page: int = 1,
+        timestamp_finder: TimestampFinder | None = None,
+    ) -> None:
+        self.archive_url: str = archive_url
+        self.user_id: str = user_id
+        self.last_id: str = last_id
+        self.known_ids: set[str] = set(known_ids or ())
+        self.fetch: Callable[[str], str] = fetch
+        self.prefetch: bool = prefetch
+        self.page_num: int = start_page
+        self.finished: bool = False
+        self.pages_fetched: int = 0
+        self.prefetch_hits: int = 0
+        self.timestamp_finder: TimestampFinder = timestamp_finder or module_timestamps
+        self.timestamps: list[str] = [
+            self.timestamp_finder.first(self.archive_timestamp(), self.user_id)
+        ]
+        self.__timestamp_index__: int = 0
+        self.__timestamps_listed__: bool = False
+
+    def __iter__(self) -> Iterator[list[tuple[str, str]]]:
+        executor = ThreadPoolExecutor(max_workers=1) if self.prefetch else None
+        prefetched: tuple[str, Future] | None = None
+
+        try:
+            while not self.finished:
+                url = self.page_url(self.page_num, self.last_id)
+                if prefetched is not None and prefetched[0] == url:
+                    self.prefetch_hits += 1
+                    body = self.__decode__(self.__result__(prefetched[1]))
+                    if body is None:
+                        body = self.__fetch_body__()
+                else:
+                    if prefetched is not None:
+                        prefetched[1].cancel()
+                    body = self.__fetch_body__()
+                prefetched = None
+
+                if body == "":
+                    self.finished = True
+                    return
+
+                if executor is not None:
+                    feed_ids = __feed_id_pattern__.findall(body)
+                    if feed_ids:
+                        next_url = self.page_url(self.page_num + 1, feed_ids[-1])
+                        prefetched = (next_url, executor.submit(self.fetch, next_url))
+
+                items = self.parse_page(body)
+                if items:
+                    self.last_id = items[-1][0]
+                self.page_num += 1
+                yield items
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def parse_page(self, body: str) -> list[tuple[str, str]]:
+        """
+        Return the (video id, title) pairs of a page not seen before
+        """
+        items: list[tuple[str, str]] = []
+
+        for video_id, title in find_video_items(body):
+            # if id not unique, continue
+            if video_id in self.known_ids:
+                continue
+            items.append((video_id, title))
+            self.known_ids.add(video_id)
+
+        return items
+
+    def page_url(self, page_num: int, last_id: str) -> str:
+        from requests.models import PreparedRequest
+
+        params = {
+            "section": "videos",
+            "page_num": page_num,
+            "target_user_id": self.user_id,
+            "infinite_scroll": True,
+            "last_id": last_id,
+            "custom_loading_module_state": "appending",
+            "infinite_scroll_fire_only": True,
+            "format": "application/json",
+            "id": "UserVideosMod",
+        }
+
+        module_url = PreparedRequest()
+        module_url.prepare_url(MODULE_URL, params)
+
+        timestamp = self.timestamps[self.__timestamp_index__]
+        return build_archive_url(module_url.url, timestamp)
+
+    def archive_timestamp(self) -> str:
+        parsed = parse_archive_url(self.archive_url)
+        return parsed[0] if parsed is not None else ALTERNATE_MODULE_TIMESTAMP
+
+    def __fetch_body__(self) -> str:
+        """
+        Fetch the current page, moving on to the next timestamp while the
+        response is not valid JSON
+        """
+        while True:
+            url = self.page_url(self.page_num, self.last_id)
+            try:
+                text = self.fetch(url)
+            except Exception as ex:
+                raise PaginationError(self.page_num, f"request failed ({ex})") from ex
+            self.pages_fetched += 1
+
+            body = self.__decode__(text)
+            if body is not None:
+                self.timestamp_finder.remember(
+                    self.timestamps[self.__timestamp_index__], self.user_id
+                )
+                return body
+
+            if self.__timestamp_index__ + 1 >= len(self.timestamps):
+                self.__list_timestamps__()
+            if self.__timestamp_index__ + 1 >= len(self.timestamps):
+                raise PaginationError(self.page_num, "could not decode JSON response")
+            self.__timestamp_index__ += 1
+
+    def __list_timestamps__(self) -> None:
+        """
+        Queue the listed captures of this user's pages closest to the profile
+        snapshot, then the alternate timestamp, once the first guesses have
+        failed
+        """
+        if self.__timestamps_listed__:
+            return
+        self.__timestamps_listed__ = True
+
+        archive_timestamp = self.archive_timestamp()
+        candidates = [archive_timestamp] + self.timestamp_finder.candidates(
+            archive_timestamp, exclude=set(self.timestamps), user_id=self.user_id
+        )
+        for timestamp in candidates + [ALTERNATE_MODULE_TIMESTAMP]:
+            if timestamp not in self.timestamps:
+                self.timestamps.append(timestamp)
+
+    def __result__(self, future: Future) -> str | None:
+        try:
+            text = future.result()
+        except Exception:
+            return None
+        self.pages_fetched += 1
+        return text
+
+    @staticmethod
+    def __decode__(text: str | None) -> str | None:
+        if text is None:
+            return None
+        try:
+            return json.loads(text)["body"]
+        except (ValueError, KeyError, TypeError):
+            return None
@@ -0,0 +1,162 @@
+from queue import Queue
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Callable
+
+from .playstv import (
+    DEFAULT_DOWNLOAD_WORKERS,
+    DEFAULT_LOOKUP_WORKERS,
+    NullProgress,
+    UserProfile,
+    Video,
+    create_progress,
+    structured_error,
+    structured_info,
+    structured_warning,
+)
+from .wayback import SnapshotIndex
+
+if TYPE_CHECKING:
+    from rich.progress import Progress
+
+
+# Videos buffered between two stages before the producing stage blocks
+DEFAULT_QUEUE_SIZE: int = 64
+
+# Put on a queue once per consumer when its producers are finished
+__end_of_stream__ = None
+
+
+class StreamingPipeline:
+    """
+    Runs discovery, availability resolution and downloads at the same time,
+    videos flow between the stages through bounded queues
+    """
+
+    def __init__(
+        self,
+        user_profile: UserProfile,
+        output_path: str,
+        lookup_workers: int = DEFAULT_LOOKUP_WORKERS,
+        download_workers: int = DEFAULT_DOWNLOAD_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        snapshot_index: SnapshotIndex | None = None,
+        on_finished: Callable[[Video], None] | None = None,
+    ) -> None:
+        self.user_profile: UserProfile = user_profile
+        self.output_path: str = output_path
+        self.lookup_workers: int = max(1, lookup_workers)
+        self.download_workers: int = max(1, download_workers)
+        self.snapshot_index: SnapshotIndex | None = snapshot_index
+        self.on_finished: Callable[[Video], None] | None = on_finished
+        self.discovered: int = 0
+        self.resolved: int = 0
+        self.downloaded: int = 0
+        self.failed: int = 0
+        self.__discovered_queue__: Queue = Queue(maxsize=queue_size)
+        self.__resolved_queue__: Queue = Queue(maxsize=queue_size)
+        self.__lock__: Lock = Lock()
+        self.__lookups_running__: int = self.lookup_workers
+        self.__progress__: "Progress | NullProgress | None" = None
+
+    def run(self) -> None:
+        structured_info("pipeline", "Starting streaming recovery")
+
+        with create_progress() as progress:
+            self.__progress__ = progress
+            self.__discovered_task__ = progress.add_task("Discovered", total=None)
+            self.__resolved_task__ = progress.add_task("Available", total=None)
+            self.__downloaded_task__ = progress.add_task("Downloaded", total=None)
+
+            threads = [Thread(target=self.__discover__, daemon=True)]
+            threads += [
+                Thread(target=self.__resolve__, daemon=True)
+                for _ in range(self.lookup_workers)
+            ]
+            threads += [
+                Thread(target=self.__download__, daemon=True)
+                for _ in range(self.download_workers)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        structured_info(
+            "pipeline",
+            f"[green]Finished streaming recovery ({self.discovered} discovered, "
+            f"{self.resolved} available, {self.downloaded} downloaded, "
+            f"{self.failed} failed)",
+        )
+
+    def __discover__(self) -> None:
+        self.user_profile.video_listeners.append(self.__enqueue__)
+        try:
+            self.user_profile.get_user_id()
+            self.user_profile.get_initial_videos()
+            self.user_profile.get_more_videos()
+        except Exception:
+            structured_error("pipeline", "Video discovery stopped unexpectedly")
+            # The video list is incomplete, the next run discovers again
+            self.user_profile.__more_video_error__ = True
+        finally:
+            self.user_profile.video_listeners.remove(self.__enqueue__)
+            for _ in range(self.lookup_workers):
+                self.__discovered_queue__.put(__end_of_stream__)
+
+    def __enqueue__(self, videos: list[Video]) -> None:
+        # Blocks pagination while the availability stage is behind
+        for video in videos:
+            self.__discovered_queue__.put(video)
+        self.__count__("discovered", len(videos), self.__discovered_task__)
+
+    def __resolve__(self) -> None:
+        try:
+            while (video := self.__discovered_queue__.get()) is not __end_of_stream__:
+                try:
+                    timestamp = (
+                        self.snapshot_index.timestamp_for(video.id)
+                        if self.snapshot_index is not None
+                        else None
+                    )
+                    if timestamp is not None:
+                        video.apply_snapshot(timestamp)
+                    else:
+                        video.check_availability()
+                except Exception:
+                    structured_warning(
+                        "pipeline", f"Could not check availability of {video.title}"
+                    )
+
+                if video.valid:
+                    self.__resolved_queue__.put(video)
+                    self.__count__("resolved", 1, self.__resolved_task__)
+        finally:
+            with self.__lock__:
+                self.__lookups_running__ -= 1
+                last_lookup = self.__lookups_running__ == 0
+            if last_lookup:
+                for _ in range(self.download_workers):
+                    self.__resolved_queue__.put(__end_of_stream__)
+
+    def __download__(self) -> None:
+        while (video := self.__resolved_queue__.get()) is not __end_of_stream__:
+            if not video.download_succeeded:
+                try:
+                    video.download_video(self.output_path)
+                except Exception:
+                    structured_error("download", f"Failed to download {video.title}")
+                    video.download_succeeded = False
+
+            if video.download_succeeded:
+                self.__count__("downloaded", 1, self.__downloaded_task__)
+            else:
+                self.__count__("failed", 1, None)
+
+            if self.on_finished is not None:
+                self.on_finished(video)
+
+    def __count__(self, counter: str, amount: int, task) -> None:
+        with self.__lock__:
+            setattr(self, counter, getattr(self, counter) + amount)
+        if task is not None and self.__progress__ is not None:
+            self.__progress__.advance(task, amount)
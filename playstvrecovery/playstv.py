@@ -1,98 +1,188 @@
-from datetime import datetime
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timezone
 import json
-from operator import concat
 import os
+import re
+from threading import Lock
 from time import sleep
-from urllib.parse import urlparse
-from bs4 import BeautifulSoup, NavigableString, Tag
-import requests
-from requests.models import PreparedRequest
-from rich import print
-from rich.progress import track
-
-from waybackpy import WaybackMachineAvailabilityAPI
-from waybackpy.exceptions import ArchiveNotInAvailabilityAPIResponse
+from typing import IO, TYPE_CHECKING, Callable, Iterable, Iterator
+
+from .pagination import ModulePaginator, PaginationError
+from . import session
+from .catalog import VIEW_DOWNLOADED, VIEW_VALID, VideoCatalog
+from .download import download_file
+from .extract import find_ld_json_videos, find_user_id, find_video_sources
+from .sources import get_policy
+from .store import get_store
+from .wayback import (
+    SnapshotIndex,
+    availability_near,
+    build_archive_url,
+    fetch_url,
+    from_timestamp,
+    source_url,
+)
+
+# Number of clips downloaded concurrently when no worker count is given
+DEFAULT_DOWNLOAD_WORKERS: int = 4
+
+# Number of availability lookups kept in flight when no limit is given
+DEFAULT_LOOKUP_WORKERS: int = 8
+
+# rich is imported by the first message or progress bar, not on start up
+if TYPE_CHECKING:
+    from rich.progress import Progress
+
+# Characters file systems do not accept in a file name, replaced in titles
+__unsafe_characters__ = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+__progress_enabled__: bool = True
+__log_file__: IO[str] | None = None
+__log_lock__: Lock = Lock()
 
 
 class Video:
+    __slots__ = (
+        "id",
+        "title",
+        "description",
+        "original_url",
+        "archive_url",
+        "video_url",
+        "video_resolution",
+        "expected_bytes",
+        "downloaded_bytes",
+        "__valid__",
+        "__download_succeeded__",
+        "__catalog__",
+    )
+
+    __archive_date__: datetime = datetime(year=2019, month=12, day=10, hour=17)
+
     def __init__(self, id: str, title: str, description: str) -> None:
+        self.__catalog__: VideoCatalog | None = None
         self.id: str = id
         self.valid: bool = False
         self.download_succeeded: bool | None = None
+        self.downloaded_bytes: int = 0
         self.title: str = title
-        self.video_url: str
-        self.video_resolution: int
+        self.video_url: str | None = None
+        self.video_resolution: str | None = None
+        # Content-Length of the chosen source, known when sources are probed
+        self.expected_bytes: int | None = None
         self.description: str = description
         self.original_url: str = f"https://plays.tv/embeds/{self.id}"
         self.archive_url: str = str()
-        self.__archive_date__: datetime = datetime(year=2019, month=12, day=10, hour=17)
-        self.__wayback_user_agent__: str = str(
-            "Mozilla/5.0 (Windows NT 5.1; rv:40.0) Gecko/20100101 Firefox/40.0"
-        )
 
-    def download_video(self, output_path: str) -> None:
+    @property
+    def valid(self) -> bool:
+        return self.__valid__
+
+    @valid.setter
+    def valid(self, value: bool) -> None:
+        self.__valid__ = value
+        if self.__catalog__ is not None:
+            self.__catalog__.update(self)
+
+    @property
+    def download_succeeded(self) -> bool | None:
+        return self.__download_succeeded__
+
+    @download_succeeded.setter
+    def download_succeeded(self, value: bool | None) -> None:
+        self.__download_succeeded__ = value
+        if self.__catalog__ is not None:
+            self.__catalog__.update(self)
+
+    @property
+    def file_name(self) -> str:
+        """
+        Name of the downloaded file, the id keeps clips sharing a title apart
+        """
+        title = __unsafe_characters__.sub("_", self.title).strip()
+        return f"{title} [{self.id}].mp4"
+
+    def resolve_source(self) -> bool:
+        """
+        Find the video url and resolution on the archived embed page
+        """
         try:
-            archive_page = requests.get(self.archive_url)
+            archive_page = session.get(fetch_url(self.archive_url))
         except KeyboardInterrupt:
             exit(1)
         except:
             structured_error(
                 "download", f"Failed to get archive url content for {self.title}"
             )
-            self.download_succeeded = False
-            return
-
-        archive_page_content = BeautifulSoup(archive_page.content, "html.parser")
+            return False
 
         try:
-            video_element = archive_page_content.find("video")
+            source_elements = find_video_sources(archive_page.content)
         except KeyboardInterrupt:
             exit(1)
         except:
+            source_elements = None
+
+        if source_elements is None:
             structured_error(
                 "download", f"Could not find video element for {self.title}"
             )
-            self.download_succeeded = False
-            return
+            return False
 
         try:
-            source_elements = video_element.find_all("source")
-
             if len(source_elements) < 1:
                 structured_error(
                     "download", f"Could not find source element for {self.title}"
                 )
 
                 sleep(2)
-                return
+                return False
+
+            choice = get_policy().choose(
+                source_elements, lambda src: source_url(src, self.archive_url)
+            )
+            if choice is None:
+                structured_error(
+                    "download", f"No usable source element for {self.title}"
+                )
+                return False
 
-            for i in range(len(source_elements)):
-                source_element: Tag | NavigableString = source_elements[i]
-                self.video_url = "https:" + source_element.attrs["src"]
-                self.video_resolution = source_element.attrs["res"]
-                break
+            source_element, self.video_url, self.expected_bytes = choice
+            self.video_resolution = source_element.get("res")
         except KeyboardInterrupt:
             exit(1)
         except:
             structured_error(
                 "download", f"Could not find source element for {self.title}"
             )
+            return False
+
+        return True
+
+    def download_video(self, output_path: str) -> None:
+        # Sources resolved ahead of time (e.g. read from a manifest) are
+        # downloaded without fetching the embed page again
+        if self.video_url is None and not self.resolve_source():
             self.download_succeeded = False
             return
 
         try:
-            file_name = concat(self.title, ".mp4")
-            file_path = os.path.join(output_path, file_name)
+            file_path = os.path.join(output_path, self.file_name)
 
+            # Interrupted downloads stay behind as .part files and are resumed,
+            # so an existing file_path is always complete
             if os.path.isfile(file_path):
+                self.downloaded_bytes = os.path.getsize(file_path)
+                self.download_succeeded = True
                 return
 
-            video_stream = requests.get(self.video_url, stream=True)
-
-            with open(file_path, "wb") as file:
-                for chunk in video_stream.iter_content(chunk_size=1024 * 1024):
-                    if chunk:
-                        file.write(chunk)
+            # With a content store, videos downloaded before for any user are
+            # linked instead of downloaded again
+            store = get_store()
+            if store is not None:
+                self.downloaded_bytes = store.fetch(self.video_url, file_path)
+            else:
+                self.downloaded_bytes = download_file(self.video_url, file_path)
         except KeyboardInterrupt:
             exit(1)
         except:
@@ -100,198 +190,298 @@ class Video:
             self.download_succeeded = False
             return
 
+        self.download_succeeded = True
+
+    def apply_snapshot(self, timestamp: str) -> None:
+        self.archive_url = build_archive_url(self.original_url, timestamp, raw=False)
+        self.valid = True
+
     def check_availability(self) -> bool:
         if self.valid:
             return True
-        availability_api = WaybackMachineAvailabilityAPI(
-            self.original_url, self.__wayback_user_agent__
-        )
-
-        possible_url = availability_api.near(
-            year=self.__archive_date__.year,
-            month=self.__archive_date__.month,
-            day=self.__archive_date__.day,
-            hour=self.__archive_date__.hour,
-        )
-
-        if possible_url is None:
-            return False
+        snapshot = availability_near(self.original_url, self.__archive_date__)
 
-        try:
-            self.archive_url = possible_url.archive_url
-        except ArchiveNotInAvailabilityAPIResponse:
+        if snapshot is None:
             self.valid = False
             return False
-        else:
-            self.valid = True
-            return True
+
+        self.archive_url = snapshot[0]
+        self.valid = True
+        return True
 
 
 class UserProfile:
     def __init__(self, username: str) -> None:
         self.username: str = username
-        self.videos: [Video] = []
+        self.__videos__: VideoCatalog = VideoCatalog()
         self.original_url: str = str(f"https://plays.tv/u/{self.username}")
         self.archive_url: str = str()
         self.__user_id__: str = str()
-        self.__module_url__: str = "https://plays.tv/ws/module"
         self.__last_video_fetched__: bool = False
         self.__more_video_error__: bool = False
         self.__last_video_id__: str = str()
         self.__archive_video_data__: [] = []
         self.__current_page_number__: int = 0
-        self.__wayback_user_agent__: str = str(
-            "Mozilla/5.0 (Windows NT 5.1; rv:40.0) Gecko/20100101 Firefox/40.0"
-        )
         self.__archive_date__: datetime = datetime(year=2019, month=12, day=10)
+        # Called with every batch of newly discovered videos
+        self.video_listeners: list[Callable[[list[Video]], None]] = []
+
+    @property
+    def videos(self) -> VideoCatalog:
+        return self.__videos__
+
+    @videos.setter
+    def videos(self, videos: Iterable[Video]) -> None:
+        self.__videos__.clear()
+        self.__videos__.extend(videos)
+
+    @property
+    def discovered(self) -> bool:
+        """
+        Whether the user id was found and no page of videos failed, only then
+        is the video list complete
+        """
+        return bool(self.__user_id__) and not self.__more_video_error__
+
+    def add_videos(self, videos: list[Video]) -> None:
+        added_videos = self.videos.extend(videos)
+        for listener in self.video_listeners:
+            listener(added_videos)
 
     def get_id_from_url(url: str) -> str:
         pass
 
     def get_user_id(self) -> None:
         try:
-            content = requests.get(self.archive_url).content
-            soup = BeautifulSoup(content, "html.parser")
-            html_element = soup.find("button", {"title": "Add Friend"})
+            content = session.get(fetch_url(self.archive_url)).content
+            user_id = find_user_id(content)
 
-            if html_element is not None:
-                self.__user_id__ = html_element.attrs["data-obj-id"]
+            if user_id is not None:
+                self.__user_id__ = user_id
                 structured_info(
                     "initialization", f"Retrieved user id ({self.__user_id__})"
                 )
         except:
             structured_error("initialization", "Failed to retrieve user id")
 
-    def check_video_availability(self) -> None:
+    def check_video_availability(
+        self,
+        concurrency: int = DEFAULT_LOOKUP_WORKERS,
+        snapshot_index: SnapshotIndex | None = None,
+        executor: Executor | None = None,
+    ) -> int:
         structured_info(
             "Availability",
             f"Checking availability of videos (total: {len(self.videos)})",
         )
-        for vid_index in track(
-            range(len(self.videos)), description="Checking video availability..."
-        ):
-            current_vid: Video = self.videos[vid_index]
-            current_vid.check_availability()
 
-        valid_videos = [x for x in self.videos if x.valid]
+        # Videos found in the bulk index skip their own availability lookup
+        pending_videos: list[Video] = list(self.videos)
+        if snapshot_index is not None:
+            pending_videos = []
+            for video in self.videos:
+                timestamp = snapshot_index.timestamp_for(video.id)
+                if timestamp is not None:
+                    video.apply_snapshot(timestamp)
+                else:
+                    pending_videos.append(video)
+            structured_info(
+                "Availability",
+                f"Resolved {len(self.videos) - len(pending_videos)} videos from the snapshot index",
+            )
+
+        in_flight_lock = Lock()
+        in_flight: int = 0
+        peak_in_flight: int = 0
+
+        def check(video: Video) -> bool:
+            nonlocal in_flight, peak_in_flight
+            with in_flight_lock:
+                in_flight += 1
+                peak_in_flight = max(peak_in_flight, in_flight)
+            try:
+                return video.check_availability()
+            finally:
+                with in_flight_lock:
+                    in_flight -= 1
+
+        # A shared executor (batch mode) is used as is, otherwise lookups
+        # get a pool of their own
+        futures: dict[Future, Video] = {}
+
+        with create_progress() as progress:
+            task = progress.add_task(
+                "Checking video availability...", total=len(pending_videos)
+            )
+            with worker_pool(executor, concurrency, futures) as lookup_executor:
+                futures.update(
+                    (lookup_executor.submit(check, video), video)
+                    for video in pending_videos
+                )
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception:
+                        video: Video = futures[future]
+                        structured_warning(
+                            "Availability",
+                            f"Could not check availability of {video.title}",
+                        )
+                    progress.advance(task)
+
         structured_info(
             "Availability",
-            f"[green]Successfully checked availability of videos ({len(valid_videos)} out of {len(self.videos)} valid)",
+            "[green]Successfully checked availability of videos "
+            f"({self.videos.count(VIEW_VALID)} out of {len(self.videos)} valid)",
+        )
+        structured_info(
+            "Availability",
+            f"Ran up to {peak_in_flight} lookups in flight (limit: {concurrency})",
+        )
+        return peak_in_flight
+
+    def resolve_video_sources(
+        self,
+        concurrency: int = DEFAULT_LOOKUP_WORKERS,
+        executor: Executor | None = None,
+    ) -> int:
+        """
+        Resolve the video url of every archived video without downloading
+        it, returns the number of videos resolved
+        """
+        unresolved_videos: list[Video] = [
+            x for x in self.videos.valid if x.video_url is None
+        ]
+        structured_info(
+            "sources", f"Resolving video sources (total: {len(unresolved_videos)})"
+        )
+
+        futures: dict[Future, Video] = {}
+
+        resolved: int = 0
+        with create_progress() as progress:
+            task = progress.add_task(
+                "Resolving video sources...", total=len(unresolved_videos)
+            )
+            with worker_pool(executor, concurrency, futures) as source_executor:
+                futures.update(
+                    (source_executor.submit(video.resolve_source), video)
+                    for video in unresolved_videos
+                )
+                for future in as_completed(futures):
+                    try:
+                        resolved += bool(future.result())
+                    except Exception:
+                        video: Video = futures[future]
+                        structured_warning(
+                            "sources", f"Could not resolve source of {video.title}"
+                        )
+                    progress.advance(task)
+
+        structured_info(
+            "sources",
+            f"[green]Resolved {resolved} out of {len(unresolved_videos)} video sources",
+        )
+        return resolved
+
+    def iter_more_videos(self, prefetch: bool = True) -> Iterator[list[Video]]:
+        """
+        Yield the batch of new videos of every ws/module page, adding them to
+        the profile as they arrive. Raises PaginationError when a page fails
+        """
+        paginator = ModulePaginator(
+            self.archive_url,
+            self.__user_id__,
+            self.__last_video_id__,
+            known_ids=self.videos.ids(),
+            prefetch=prefetch,
+            start_page=max(1, self.__current_page_number__),
         )
 
-    def get_more_videos(self, timestamp: str | None = None) -> list[Video] | None:
-        if self.__current_page_number__ == 0:
-            structured_info("more videos", "Starting queries for more videos")
-            self.__current_page_number__ += 1
+        for items in paginator:
+            video_list = [Video(video_id, title, "") for video_id, title in items]
+            self.add_videos(video_list)
+            self.__last_video_id__ = paginator.last_id
+            self.__current_page_number__ = paginator.page_num
+            structured_info(
+                "More videos",
+                f"[bright_green]Successfully added [bold]{len(video_list)} videos[/bold] (total: {len(self.videos)})",
+            )
+            yield video_list
+
+        self.__last_video_fetched__ = paginator.finished
+
+    def get_more_videos(self, prefetch: bool = True) -> None:
         if self.__last_video_fetched__:
             structured_info(
                 "more videos", "[green]Succesfully querried for more videos"
             )
             return
 
-        if self.__more_video_error__:
+        structured_info("more videos", "Starting queries for more videos")
+        self.__more_video_error__ = False
+
+        try:
+            for _ in self.iter_more_videos(prefetch):
+                pass
+        except PaginationError as ex:
+            structured_error("more videos", str(ex))
             structured_warning("more videos", "Stopping queries for more videos")
+            self.__more_video_error__ = True
             return
 
-        video_list: list[Video] = []
-
-        params = {
-            "section": "videos",
-            "page_num": self.__current_page_number__,
-            "target_user_id": self.__user_id__,
-            "infinite_scroll": True,
-            "last_id": self.__last_video_id__,
-            "custom_loading_module_state": "appending",
-            "infinite_scroll_fire_only": True,
-            "format": "application/json",
-            "id": "UserVideosMod",
-        }
-
-        module_url = PreparedRequest()
-        module_url.prepare_url(self.__module_url__, params)
-
-        parsed_archive_url = urlparse(self.archive_url)
+        structured_info("more videos", "[green]Succesfully querried for more videos")
+
+    def download_videos(
+        self,
+        output_path: str,
+        workers: int = DEFAULT_DOWNLOAD_WORKERS,
+        on_finished: Callable[[Video], None] | None = None,
+        executor: Executor | None = None,
+    ) -> None:
+        # Videos already downloaded by an earlier run are not fetched again
+        valid_videos: list[Video] = self.videos.pending
+        structured_info(
+            "download",
+            f"Starting download process for {len(valid_videos)} videos ({workers} workers)",
+        )
 
-        #
-        if not timestamp:
-            query_url = f"{parsed_archive_url.scheme}://{parsed_archive_url.netloc}/{'/'.join(parsed_archive_url.path.split('/')[1:3])}/{module_url.url}"
-        else:
-            query_url = f"{parsed_archive_url.scheme}://{parsed_archive_url.netloc}/{parsed_archive_url.path.split('/')[1]}/{timestamp}/{module_url.url}"
+        succeeded_downloads: list[Video] = []
+        failed_downloads: list[Video] = []
 
-        try:
-            r = requests.get(query_url)
-        except KeyboardInterrupt:
-            exit(1)
-        except:
-            structured_error(
-                "more videos", "failed to retrieve more videos from playstv api"
-            )
+        # Workers only set their own Video's flags; results are gathered here,
+        # on the calling thread, as each future completes.
+        futures: dict[Future, Video] = {}
 
-        try:
-            json_data = json.loads(r.text)
-        except:
-            alternate_timestamp = "20191210164752"
-            if parsed_archive_url.path.split("/")[2] != alternate_timestamp:
-                structured_warning(
-                    "more videos",
-                    "Failed to parse JSON, retrying with different timestamp",
+        with create_progress() as progress:
+            task = progress.add_task("Downloading videos...", total=len(valid_videos))
+            with worker_pool(executor, workers, futures) as download_executor:
+                futures.update(
+                    (download_executor.submit(video.download_video, output_path), video)
+                    for video in valid_videos
                 )
-                self.get_more_videos(alternate_timestamp)
-            else:
-                structured_error("more videos", "JSON parsing error")
-                self.__more_video_error__ = True
-                return
-
-        if json_data["body"] == "":
-            self.__last_video_fetched__ = True
-        else:
-            soup_body = BeautifulSoup(json_data["body"], "html.parser")
-            # Get video-items
-            video_item_elements = soup_body.find_all("li", {"class": "video-item"})
-            current_ids = [x.id for x in self.videos]
-
-            for video_item_element in video_item_elements:
-                # if video_id does not exist on item, continue
-                try:
-                    video_id = video_item_element.attrs["data-feed-id"]
-                except ValueError:
-                    continue
-
-                # if id not unique, continue
-                if video_id in current_ids:
-                    continue
-
-                try:
-                    title = video_item_element.find("a", {"class": "title"}).text
-                except:
-                    structured_warning(
-                        "more videos", f"Could not get title for {video_id}"
-                    )
-                    continue
-
-                video_list.append(Video(video_id, title, ""))
-                current_ids.append(video_id)
-
-            self.videos += video_list
-            self.__last_video_id__ = current_ids[-1]
-            self.__current_page_number__ += 1
-            structured_info(
-                "More videos",
-                f"[bright_green]Successfully added [bold]{len(video_list)} videos[/bold] (total: {len(self.videos)})",
+                for future in as_completed(futures):
+                    video: Video = futures[future]
+                    try:
+                        future.result()
+                    except Exception:
+                        structured_error(
+                            "download", f"Failed to download {video.title}"
+                        )
+                        video.download_succeeded = False
+
+                    if video.download_succeeded:
+                        succeeded_downloads.append(video)
+                    else:
+                        failed_downloads.append(video)
+                    if on_finished is not None:
+                        on_finished(video)
+                    progress.advance(task)
+
+        if len(failed_downloads) > 0:
+            structured_warning(
+                "download", f"{len(failed_downloads)} videos failed to download"
             )
-        # TODO: Test recursive function
-        self.get_more_videos()
-
-    def download_videos(self, output_path: str) -> None:
-        valid_videos: list[Video] = [x for x in self.videos if x.valid]
-        structured_info(
-            "download", f"Starting download process for {len(valid_videos)} videos"
-        )
-        for video_index in track(range(len(valid_videos)), "Downloading videos..."):
-            current_video: Video = self.videos[video_index]
-            current_video.download_video(output_path)
-
-        succeeded_downloads = [x for x in self.videos if x.download_succeeded]
 
         if len(succeeded_downloads) > 0:
             structured_info(
@@ -300,33 +490,34 @@ class UserProfile:
             )
             return
 
+        # Nothing was left to this call when a streamed run or an earlier one
+        # downloaded everything
+        if self.videos.count(VIEW_DOWNLOADED) > 0:
+            structured_info(
+                "download",
+                "[green]No videos left to download "
+                f"({self.videos.count(VIEW_DOWNLOADED)} already downloaded)",
+            )
+            return
+
         structured_info("download", "[red]No videos were downloaded!")
 
     def check_availability(self) -> bool:
-        availability_api = WaybackMachineAvailabilityAPI(
-            self.original_url, self.__wayback_user_agent__
-        )
+        snapshot = availability_near(self.original_url, self.__archive_date__)
 
-        possible_url = availability_api.near(
-            year=self.__archive_date__.year,
-            month=self.__archive_date__.month,
-            day=self.__archive_date__.day,
-        )
-
-        try:
-            possible_url_timestamp = possible_url.timestamp()
-        except ValueError as ex:
+        if snapshot is None:
             structured_error(
                 "availability",
                 f"Could not find snapshot of the profile for {self.username}",
             )
-            structured_error("availability", ex)
             return False
-        else:
-            structured_info(
-                "availability", f"Found snapshot of the profile for {self.username}"
-            )
 
+        structured_info(
+            "availability", f"Found snapshot of the profile for {self.username}"
+        )
+
+        archive_url, timestamp = snapshot
+        possible_url_timestamp = from_timestamp(timestamp)
         possible_url_datetime: datetime = datetime(
             year=possible_url_timestamp.year,
             month=possible_url_timestamp.month,
@@ -338,23 +529,25 @@ class UserProfile:
                 "availability", "Available date is not ideal archive date"
             )
 
-        self.archive_url = possible_url.archive_url
+        self.archive_url = archive_url
         return True
 
     def get_initial_videos(self) -> None:
         structured_info("initial videos", "Getting initial videos from profile page")
-        response = requests.get(self.archive_url)
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        video_data = [
-            json.loads(x.string)
-            for x in soup.find_all("script", type="application/ld+json")
-        ][0]["video"]
-
-        self.videos = [
-            Video(id=str(x["embedURL"]).split("/")[-1], title=x["name"], description="")
-            for x in video_data
-        ]
+        response = session.get(fetch_url(self.archive_url))
+        video_data = find_ld_json_videos(response.content)
+
+        self.videos.clear()
+        self.add_videos(
+            [
+                Video(
+                    id=str(x["embedURL"]).split("/")[-1],
+                    title=x["name"],
+                    description="",
+                )
+                for x in video_data
+            ]
+        )
 
         self.__last_video_id__ = self.videos[-1].id
         structured_info(
@@ -382,18 +575,113 @@ def get_profile(user: str) -> UserProfile:
     return newUser
 
 
+class NullProgress:
+    """
+    Stands in for a progress bar when several users run at once
+    """
+
+    def __enter__(self) -> "NullProgress":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def add_task(self, *args, **kwargs) -> int:
+        return 0
+
+    def advance(self, *args, **kwargs) -> None:
+        pass
+
+
+@contextmanager
+def worker_pool(
+    executor: Executor | None, workers: int, futures: dict[Future, object]
+) -> Iterator[Executor]:
+    """
+    The shared executor as is, otherwise a pool of its own. When the block
+    is left by an exception, Ctrl-C included, the futures not started yet
+    are cancelled and the pool is not waited for
+    """
+    pool = executor or ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        yield pool
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        if executor is None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    if executor is None:
+        pool.shutdown()
+
+
+def set_progress_enabled(enabled: bool) -> None:
+    global __progress_enabled__
+    __progress_enabled__ = enabled
+
+
+def create_progress() -> "Progress | NullProgress":
+    if not __progress_enabled__:
+        return NullProgress()
+
+    from rich.progress import Progress
+
+    return Progress()
+
+
+def set_log_file(path: str | None) -> None:
+    """
+    Also append every structured message to path as a JSON line
+    """
+    global __log_file__
+    with __log_lock__:
+        if __log_file__ is not None:
+            __log_file__.close()
+        __log_file__ = (
+            open(path, "a", encoding="utf-8", buffering=1) if path else None
+        )
+
+
+def structured_log(level: str, subject: str, message: str) -> None:
+    if __log_file__ is None:
+        return
+    from rich.errors import MarkupError
+    from rich.text import Text
+
+    try:
+        text = Text.from_markup(message).plain
+    except MarkupError:
+        text = message
+    record = {
+        "time": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "level": level,
+        "subject": subject.lower(),
+        "message": text,
+    }
+    with __log_lock__:
+        if __log_file__ is not None:
+            __log_file__.write(json.dumps(record) + "\n")
+
+
 def structured_print(subject: str, message: str, color: str):
+    from rich import print
+
     print(f"[bold {color}]{subject.title()}: [/bold {color}][{color}]{message}")
 
 
 def structured_info(subject: str, message: str):
+    from rich import print
+
+    structured_log("info", subject, message)
     color = "bright_blue"
     print(f"[bold {color}]Info - {subject.title()}: [/bold {color}]{message}")
 
 
 def structured_error(subject: str, message: str):
+    structured_log("error", subject, message)
     structured_print(f"error - {subject}", message, "red")
 
 
 def structured_warning(subject: str, message: str):
+    structured_log("warning", subject, message)
     structured_print(f"warning - {subject}", message, "bright_yellow")
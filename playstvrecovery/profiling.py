@@ -0,0 +1,290 @@
+from collections import Counter
+import cProfile
+from contextlib import contextmanager
+import io
+import os
+import pstats
+import sys
+from threading import Event, Lock, Thread, get_ident
+import time
+import tracemalloc
+from typing import Iterator
+
+
+# Seconds between two samples of the stacks of every thread
+SAMPLE_INTERVAL: float = 0.005
+# Functions listed per stage in the printed summary and the reports
+DEFAULT_TOP: int = 15
+# Frames stored per traced allocation, more make tracemalloc slower
+TRACEMALLOC_FRAMES: int = 1
+
+__package_path__: str = os.path.dirname(os.path.abspath(__file__))
+
+# Left out of the allocation reports, the profilers' own bookkeeping
+__own_allocations__: tuple[tracemalloc.Filter, ...] = tuple(
+    tracemalloc.Filter(False, x.__file__) for x in (cProfile, pstats, tracemalloc)
+)
+
+# Held by the stage running cProfile, which allows a single active profiler
+# per process since Python 3.12
+__cprofile_lock__: Lock = Lock()
+
+# (file name, first line, function name) of a code object
+FunctionKey = tuple[str, int, str]
+
+
+class Sampler:
+    """
+    Samples the stacks of every thread at a fixed interval, so the work of
+    the lookup and download pools is seen too and not only that of the
+    thread running a stage. Threads parked waiting for work are skipped,
+    threads blocked on a socket are not: that is the network time
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL) -> None:
+        self.interval: float = interval
+        self.samples: int = 0
+        self.self_samples: Counter[FunctionKey] = Counter()
+        self.total_samples: Counter[FunctionKey] = Counter()
+        self.__lock__: Lock = Lock()
+        self.__stopped__: Event = Event()
+        self.__thread__: Thread | None = None
+
+    def start(self) -> None:
+        self.__stopped__.clear()
+        self.__thread__ = Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def stop(self) -> None:
+        self.__stopped__.set()
+        if self.__thread__ is not None:
+            self.__thread__.join()
+            self.__thread__ = None
+
+    def snapshot(self) -> tuple[int, Counter, Counter]:
+        with self.__lock__:
+            return self.samples, self.self_samples.copy(), self.total_samples.copy()
+
+    def sample(self, own_thread: int | None = None) -> None:
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread or is_idle(frame):
+                continue
+            seen: set[FunctionKey] = set()
+            leaf = function_key(frame)
+            while frame is not None:
+                seen.add(function_key(frame))
+                frame = frame.f_back
+            with self.__lock__:
+                self.samples += 1
+                self.self_samples[leaf] += 1
+                self.total_samples.update(seen)
+
+    def __run__(self) -> None:
+        own_thread = get_ident()
+        while not self.__stopped__.wait(self.interval):
+            self.sample(own_thread)
+
+
+class StageProfile:
+    """
+    Everything recorded over the runs of one stage
+    """
+
+    def __init__(self, name: str) -> None:
+        self.name: str = name
+        self.runs: int = 0
+        self.seconds: float = 0.0
+        self.stats: pstats.Stats | None = None
+        self.samples: int = 0
+        self.self_samples: Counter[FunctionKey] = Counter()
+        self.total_samples: Counter[FunctionKey] = Counter()
+        self.peak_memory: int = 0
+        self.allocations: list[tracemalloc.Statistic] = []
+
+    def hot_functions(
+        self, top: int, package_only: bool = False
+    ) -> list[tuple[FunctionKey, int, int]]:
+        """
+        (function, self samples, total samples) of the functions the most
+        samples were taken in, by self samples, or by total samples for
+        the functions of this package
+        """
+        counts = self.total_samples if package_only else self.self_samples
+        keys = [
+            key
+            for key, _ in counts.most_common()
+            if not package_only or in_package(key[0])
+        ][:top]
+        return [(x, self.self_samples[x], self.total_samples[x]) for x in keys]
+
+
+class Profiler:
+    """
+    Profiles every stage of a run: cProfile on the thread running the
+    stage, stack samples of all threads and the tracemalloc peak. Reports
+    are written to directory once the run is over. Stages of concurrent
+    users overlap, their samples and memory peak are shared and only the
+    first of them running is traced by cProfile
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        top: int = DEFAULT_TOP,
+        interval: float = SAMPLE_INTERVAL,
+    ) -> None:
+        self.directory: str = directory
+        self.top: int = top
+        self.sampler: Sampler = Sampler(interval)
+        self.stages: dict[str, StageProfile] = {}
+        self.__lock__: Lock = Lock()
+
+    def start(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.sampler.start()
+
+    def stop(self) -> None:
+        self.sampler.stop()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        samples_before = self.sampler.snapshot()
+        tracemalloc.reset_peak()
+        profile = (
+            cProfile.Profile() if __cprofile_lock__.acquire(blocking=False) else None
+        )
+        started = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                __cprofile_lock__.release()
+            seconds = time.perf_counter() - started
+            samples_after = self.sampler.snapshot()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            allocations = (
+                tracemalloc.take_snapshot()
+                .filter_traces(__own_allocations__)
+                .statistics("lineno")[: self.top]
+                if tracemalloc.is_tracing()
+                else []
+            )
+
+            with self.__lock__:
+                stage = self.stages.setdefault(name, StageProfile(name))
+                stage.runs += 1
+                stage.seconds += seconds
+                if profile is not None and stage.stats is None:
+                    stage.stats = pstats.Stats(profile)
+                elif profile is not None:
+                    stage.stats.add(profile)
+                stage.samples += samples_after[0] - samples_before[0]
+                stage.self_samples.update(samples_after[1] - samples_before[1])
+                stage.total_samples.update(samples_after[2] - samples_before[2])
+                if peak_memory >= stage.peak_memory:
+                    stage.peak_memory = peak_memory
+                    stage.allocations = allocations
+
+    def write_reports(self) -> list[str]:
+        """
+        Write a pstats dump (<stage>.prof) and a text report (<stage>.txt)
+        per stage, returns the paths written
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        paths: list[str] = []
+        with self.__lock__:
+            stages = list(self.stages.values())
+
+        for stage in stages:
+            if stage.stats is not None:
+                path = os.path.join(self.directory, f"{stage.name}.prof")
+                stage.stats.dump_stats(path)
+                paths.append(path)
+            path = os.path.join(self.directory, f"{stage.name}.txt")
+            with open(path, "w", encoding="utf-8") as file:
+                file.write(self.report(stage))
+            paths.append(path)
+        return paths
+
+    def report(self, stage: StageProfile) -> str:
+        lines: list[str] = [
+            f"Stage {stage.name}: {stage.runs} runs, {stage.seconds:.2f} s, "
+            f"peak traced memory {stage.peak_memory / 1024**2:.1f} MiB",
+            f"{stage.samples} stack samples of busy threads, "
+            f"one every {self.sampler.interval * 1000:g} ms",
+            "",
+            "Hot functions of all threads (sampled)",
+            *format_samples(stage, stage.hot_functions(self.top)),
+            "",
+            "Functions of this package (sampled)",
+            *format_samples(stage, stage.hot_functions(self.top, package_only=True)),
+            "",
+            "Thread running the stage (cProfile), by cumulative time",
+        ]
+        if stage.stats is not None:
+            output = io.StringIO()
+            stage.stats.stream = output
+            stage.stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            lines.append(output.getvalue().strip("\n"))
+        lines += ["", "Largest live allocations at the end of the stage"]
+        lines += [f"  {x}" for x in stage.allocations]
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """
+        Time, memory peak and hottest functions of every stage
+        """
+        lines: list[str] = []
+        with self.__lock__:
+            stages = list(self.stages.values())
+        for stage in stages:
+            lines.append(
+                f"{stage.name}: {stage.seconds:.2f} s over {stage.runs} runs, "
+                f"peak {stage.peak_memory / 1024**2:.1f} MiB"
+            )
+            lines += format_samples(stage, stage.hot_functions(self.top))
+        return "\n".join(lines)
+
+
+def in_package(file_name: str) -> bool:
+    return os.path.abspath(file_name).startswith(__package_path__ + os.sep)
+
+
+def function_key(frame) -> FunctionKey:
+    code = frame.f_code
+    return code.co_filename, code.co_firstlineno, code.co_name
+
+
+def format_function(key: FunctionKey) -> str:
+    file_name, line, name = key
+    return f"{os.path.basename(file_name)}:{line}({name})"
+
+
+def format_samples(
+    stage: StageProfile, functions: list[tuple[FunctionKey, int, int]]
+) -> list[str]:
+    lines = [f"  {'self %':>7}{'total %':>9}  function"]
+    for key, self_samples, total_samples in functions:
+        lines.append(
+            f"  {self_samples / max(1, stage.samples):>7.1%}"
+            f"{total_samples / max(1, stage.samples):>9.1%}  {format_function(key)}"
+        )
+    return lines
+
+
+def is_idle(frame) -> bool:
+    """
+    Whether a thread's innermost frame is a pool worker or waiter parked
+    until there is something to do
+    """
+    code = frame.f_code
+    file_name = os.path.basename(code.co_filename)
+    return (code.co_name == "_worker" and file_name == "thread.py") or (
+        code.co_name == "wait" and file_name == "threading.py"
+    )
@@ -0,0 +1,332 @@
+from collections import deque
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from threading import Event, Lock, Thread
+from typing import Callable
+
+
+# Requests per second the limiter starts at and the bounds it adapts within
+DEFAULT_RATE: float = 5
+MIN_RATE: float = 0.2
+MAX_RATE: float = 20
+DEFAULT_BURST: int = 10
+
+# Consecutive successes needed before the rate is raised again
+RECOVERY_SUCCESSES: int = 20
+RATE_INCREASE: float = 0.5
+RATE_DECREASE: float = 0.5
+
+BACKOFF_BASE: float = 1
+BACKOFF_MAX: float = 60
+
+# Seconds of traffic the byte bucket may send at once, and the window the
+# recent throughput is measured over
+BANDWIDTH_BURST_SECONDS: float = 0.5
+MIN_BANDWIDTH_BURST: int = 64 * 1024
+THROUGHPUT_WINDOW: float = 5
+# Seconds between two throughput reports, and between checks of the
+# bandwidth control file
+REPORT_INTERVAL: float = 30
+CONTROL_FILE_INTERVAL: float = 1
+
+
+class RateLimiter:
+    """
+    Thread safe token bucket shared by every request. The refill rate is
+    halved when the server throttles or fails and slowly raised again after
+    a run of successful requests, a Retry-After pause blocks all callers.
+    Concurrent requests throttled by the same burst halve the rate once:
+    for a request interval after a decrease, further ones are ignored
+    """
+
+    def __init__(
+        self,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        min_rate: float = MIN_RATE,
+        max_rate: float = MAX_RATE,
+    ) -> None:
+        self.min_rate: float = min_rate
+        self.max_rate: float = max(max_rate, rate)
+        self.burst: int = burst
+        self.successes: int = 0
+        self.throttled: int = 0
+        self.failures: int = 0
+        self.__rate__: float = rate
+        self.__tokens__: float = burst
+        self.__updated__: float = time.monotonic()
+        self.__paused_until__: float = 0
+        self.__decreased_at__: float | None = None
+        self.__streak__: int = 0
+        self.__lock__: Lock = Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.__rate__
+
+    def acquire(self) -> None:
+        """
+        Block until a request may be sent
+        """
+        while True:
+            with self.__lock__:
+                now = time.monotonic()
+                self.__refill__(now)
+                if now >= self.__paused_until__ and self.__tokens__ >= 1:
+                    self.__tokens__ -= 1
+                    return
+                wait = max(
+                    self.__paused_until__ - now,
+                    (1 - self.__tokens__) / self.__rate__,
+                )
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Hold back every caller for the given number of seconds
+        """
+        with self.__lock__:
+            self.__paused_until__ = max(
+                self.__paused_until__, time.monotonic() + seconds
+            )
+
+    def record_success(self) -> None:
+        with self.__lock__:
+            self.successes += 1
+            self.__streak__ += 1
+            if self.__streak__ >= RECOVERY_SUCCESSES:
+                self.__streak__ = 0
+                self.__rate__ = min(self.max_rate, self.__rate__ + RATE_INCREASE)
+
+    def record_throttle(self, retry_after: float | None = None) -> None:
+        """
+        Slow down after a 429 or 5xx response, honouring Retry-After
+        """
+        with self.__lock__:
+            self.throttled += 1
+            self.__slow_down__()
+        if retry_after:
+            self.pause(retry_after)
+
+    def record_failure(self) -> None:
+        """
+        Slow down after a connection reset or timeout
+        """
+        with self.__lock__:
+            self.failures += 1
+            self.__slow_down__()
+
+    def __slow_down__(self) -> None:
+        self.__streak__ = 0
+        self.__tokens__ = min(self.__tokens__, 1)
+        now = time.monotonic()
+        if (
+            self.__decreased_at__ is not None
+            and now - self.__decreased_at__ < 1 / self.__rate__
+        ):
+            return
+        self.__decreased_at__ = now
+        self.__rate__ = max(self.min_rate, self.__rate__ * RATE_DECREASE)
+
+    def __refill__(self, now: float) -> None:
+        elapsed = now - self.__updated__
+        self.__updated__ = now
+        self.__tokens__ = min(self.burst, self.__tokens__ + elapsed * self.__rate__)
+
+
+class BandwidthLimiter:
+    """
+    Thread safe byte token bucket every download stream draws from. Streams
+    pay for what they read afterwards and sleep off the debt, so a read may
+    be larger than the bucket. Without a rate bytes are only counted. The
+    rate can be changed while downloads are running
+    """
+
+    def __init__(self, rate: float | None = None) -> None:
+        self.transferred: int = 0
+        self.__started__: float = time.monotonic()
+        self.__window__: deque[tuple[float, int]] = deque()
+        self.__window_bytes__: int = 0
+        self.__lock__: Lock = Lock()
+        self.__rate__: float | None = None
+        self.__tokens__: float = 0
+        self.__updated__: float = self.__started__
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> float | None:
+        """
+        Bytes per second, None when unlimited
+        """
+        return self.__rate__
+
+    @property
+    def burst(self) -> int | None:
+        if self.__rate__ is None:
+            return None
+        return max(MIN_BANDWIDTH_BURST, int(self.__rate__ * BANDWIDTH_BURST_SECONDS))
+
+    def set_rate(self, rate: float | None) -> None:
+        with self.__lock__:
+            now = time.monotonic()
+            previous_rate = self.__rate__
+            if previous_rate is not None:
+                self.__refill__(now)
+            self.__rate__ = rate if rate and rate > 0 else None
+            self.__updated__ = now
+            if self.__rate__ is not None:
+                # A newly limited bucket starts full
+                self.__tokens__ = (
+                    self.burst
+                    if previous_rate is None
+                    else min(self.__tokens__, self.burst)
+                )
+
+    def consume(self, count: int) -> None:
+        """
+        Account for count bytes read, blocking while over the rate
+        """
+        with self.__lock__:
+            now = time.monotonic()
+            self.transferred += count
+            self.__window__.append((now, count))
+            self.__window_bytes__ += count
+            self.__trim__(now)
+            if self.__rate__ is None:
+                return
+            self.__refill__(now)
+            self.__tokens__ -= count
+            wait = -self.__tokens__ / self.__rate__
+
+        if wait > 0:
+            time.sleep(wait)
+
+    def throughput(self) -> float:
+        """
+        Average bytes per second since the limiter was created
+        """
+        elapsed = time.monotonic() - self.__started__
+        return self.transferred / elapsed if elapsed > 0 else 0
+
+    def recent_throughput(self) -> float:
+        """
+        Bytes per second over the last THROUGHPUT_WINDOW seconds
+        """
+        with self.__lock__:
+            now = time.monotonic()
+            self.__trim__(now)
+            window = min(THROUGHPUT_WINDOW, now - self.__started__)
+            return self.__window_bytes__ / window if window > 0 else 0
+
+    def __refill__(self, now: float) -> None:
+        elapsed = now - self.__updated__
+        self.__updated__ = now
+        self.__tokens__ = min(self.burst, self.__tokens__ + elapsed * self.__rate__)
+
+    def __trim__(self, now: float) -> None:
+        while self.__window__ and self.__window__[0][0] < now - THROUGHPUT_WINDOW:
+            self.__window_bytes__ -= self.__window__.popleft()[1]
+
+
+class BandwidthMonitor:
+    """
+    Reports the throughput of a BandwidthLimiter every interval and applies
+    the rate written to a control file (MiB/s, 0 or empty for unlimited)
+    whenever the file changes
+    """
+
+    def __init__(
+        self,
+        limiter: BandwidthLimiter,
+        report: Callable[[str], None],
+        interval: float = REPORT_INTERVAL,
+        control_file: str | None = None,
+    ) -> None:
+        self.limiter: BandwidthLimiter = limiter
+        self.report: Callable[[str], None] = report
+        self.interval: float = interval
+        self.control_file: str | None = control_file
+        self.__control_mtime__: float | None = None
+        self.__stopped__: Event = Event()
+        self.__thread__: Thread = Thread(target=self.__run__, daemon=True)
+
+    def start(self) -> None:
+        self.reload()
+        self.__thread__.start()
+
+    def stop(self) -> None:
+        """
+        Stop reporting and report the average throughput of the run
+        """
+        if self.__stopped__.is_set():
+            return
+        self.__stopped__.set()
+        if self.__thread__.is_alive():
+            self.__thread__.join()
+        self.report(
+            f"Transferred {self.limiter.transferred / 1024**2:.1f} MiB at "
+            f"{self.limiter.throughput() / 1024**2:.2f} MiB/s on average"
+        )
+
+    def reload(self) -> bool:
+        """
+        Apply the control file if it changed, returns whether it did
+        """
+        if self.control_file is None:
+            return False
+        try:
+            mtime = os.path.getmtime(self.control_file)
+            if mtime == self.__control_mtime__:
+                return False
+            self.__control_mtime__ = mtime
+            with open(self.control_file, encoding="utf-8") as file:
+                text = file.read().strip()
+            rate = float(text) * 1024**2 if text else None
+        except (OSError, ValueError):
+            return False
+
+        self.limiter.set_rate(rate)
+        self.report(f"Bandwidth limit set to {format_rate(self.limiter.rate)}")
+        return True
+
+    def __run__(self) -> None:
+        next_report = time.monotonic() + self.interval
+        while not self.__stopped__.wait(CONTROL_FILE_INTERVAL):
+            self.reload()
+            if time.monotonic() >= next_report:
+                next_report += self.interval
+                self.report(
+                    f"{self.limiter.recent_throughput() / 1024**2:.2f} MiB/s "
+                    f"(limit: {format_rate(self.limiter.rate)}), "
+                    f"{self.limiter.transferred / 1024**2:.1f} MiB transferred"
+                )
+
+
+def format_rate(rate: float | None) -> str:
+    return f"{rate / 1024**2:.2f} MiB/s" if rate else "none"
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full jitter exponential backoff for the given retry attempt (from 0)
+    """
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2**attempt))
+
+
+def parse_retry_after(header: str | None) -> float | None:
+    """
+    Seconds to wait from a Retry-After header in seconds or HTTP date form
+    """
+    if not header:
+        return None
+    try:
+        return max(0.0, float(header))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
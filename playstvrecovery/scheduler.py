@@ -0,0 +1,90 @@
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+from typing import Callable
+
+
+class FairScheduler:
+    """
+    Worker pool shared by several users. Work is queued per key and the
+    workers take it round robin across keys, so a user with thousands of
+    queued videos does not hold back the others
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers: int = max(1, workers)
+        self.__queues__: OrderedDict[str, deque] = OrderedDict()
+        self.__condition__: Condition = Condition()
+        self.__threads__: list[Thread] = []
+        self.__shutdown__: bool = False
+
+    def submit(self, key: str, fn: Callable, *args, **kwargs) -> Future:
+        future: Future = Future()
+        with self.__condition__:
+            if self.__shutdown__:
+                raise RuntimeError("cannot schedule new work after shutdown")
+            self.__queues__.setdefault(key, deque()).append((future, fn, args, kwargs))
+            if len(self.__threads__) < self.workers:
+                thread = Thread(target=self.__work__, daemon=True)
+                self.__threads__.append(thread)
+                thread.start()
+            self.__condition__.notify()
+        return future
+
+    def for_key(self, key: str) -> "KeyedExecutor":
+        return KeyedExecutor(self, key)
+
+    def pending(self, key: str | None = None) -> int:
+        with self.__condition__:
+            if key is not None:
+                return len(self.__queues__.get(key, ()))
+            return sum(len(x) for x in self.__queues__.values())
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self.__condition__:
+            self.__shutdown__ = True
+            self.__condition__.notify_all()
+        if wait:
+            for thread in self.__threads__:
+                thread.join()
+
+    def __take__(self) -> tuple | None:
+        with self.__condition__:
+            while not self.__queues__:
+                if self.__shutdown__:
+                    return None
+                self.__condition__.wait()
+
+            # Take from the key at the front, then move it to the back
+            key, queue = next(iter(self.__queues__.items()))
+            item = queue.popleft()
+            if queue:
+                self.__queues__.move_to_end(key)
+            else:
+                del self.__queues__[key]
+            return item
+
+    def __work__(self) -> None:
+        while (item := self.__take__()) is not None:
+            future, fn, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = fn(*args, **kwargs)
+            except BaseException as ex:
+                future.set_exception(ex)
+            else:
+                future.set_result(result)
+
+
+class KeyedExecutor:
+    """
+    Executor style view of a FairScheduler submitting under one key
+    """
+
+    def __init__(self, scheduler: FairScheduler, key: str) -> None:
+        self.scheduler: FairScheduler = scheduler
+        self.key: str = key
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        return self.scheduler.submit(self.key, fn, *args, **kwargs)
@@ -0,0 +1,229 @@
+from io import BytesIO
+from threading import Lock
+from time import perf_counter, sleep
+from typing import TYPE_CHECKING
+
+from .cache import ResponseCache
+from . import metrics
+from .ratelimit import (
+    BandwidthLimiter,
+    RateLimiter,
+    backoff_delay,
+    parse_retry_after,
+)
+
+# requests takes a good part of the start up time, it is imported when the
+# first request is made instead
+if TYPE_CHECKING:
+    import requests
+
+
+DEFAULT_USER_AGENT: str = (
+    "Mozilla/5.0 (Windows NT 5.1; rv:40.0) Gecko/20100101 Firefox/40.0"
+)
+# Connections kept alive per host, should be at least the number of workers
+DEFAULT_POOL_SIZE: int = 16
+# Seconds to wait for a connection and between received bytes
+DEFAULT_TIMEOUT: float = 30
+# Attempts after the first one for throttled, failed or reset requests
+DEFAULT_MAX_RETRIES: int = 5
+RETRY_STATUS_CODES: set[int] = {429, 500, 502, 503, 504}
+
+__session__: "requests.Session | None" = None
+__session_lock__: Lock = Lock()
+__pool_size__: int = DEFAULT_POOL_SIZE
+__timeout__: float = DEFAULT_TIMEOUT
+__user_agent__: str = DEFAULT_USER_AGENT
+__cache__: ResponseCache | None = None
+__rate_limiter__: RateLimiter = RateLimiter()
+__max_retries__: int = DEFAULT_MAX_RETRIES
+__bandwidth_limiter__: BandwidthLimiter = BandwidthLimiter()
+
+
+def configure(
+    pool_size: int | None = None,
+    timeout: float | None = None,
+    user_agent: str | None = None,
+) -> None:
+    """
+    Change the shared session settings, the session is rebuilt on next use
+    """
+    global __session__, __pool_size__, __timeout__, __user_agent__
+
+    with __session_lock__:
+        if pool_size is not None:
+            __pool_size__ = pool_size
+        if timeout is not None:
+            __timeout__ = timeout
+        if user_agent is not None:
+            __user_agent__ = user_agent
+        if __session__ is not None:
+            __session__.close()
+        __session__ = None
+
+
+def set_cache(cache: ResponseCache | None) -> None:
+    """
+    Serve non streaming GET requests from cache, snapshots never change so
+    entries do not expire
+    """
+    global __cache__
+    __cache__ = cache
+
+
+def get_cache() -> ResponseCache | None:
+    return __cache__
+
+
+def set_rate_limiter(
+    rate_limiter: RateLimiter, max_retries: int = DEFAULT_MAX_RETRIES
+) -> None:
+    global __rate_limiter__, __max_retries__
+    __rate_limiter__ = rate_limiter
+    __max_retries__ = max_retries
+
+
+def get_rate_limiter() -> RateLimiter:
+    return __rate_limiter__
+
+
+def set_bandwidth_limiter(bandwidth_limiter: BandwidthLimiter) -> None:
+    """
+    Byte budget every download stream draws from
+    """
+    global __bandwidth_limiter__
+    __bandwidth_limiter__ = bandwidth_limiter
+
+
+def get_bandwidth_limiter() -> BandwidthLimiter:
+    return __bandwidth_limiter__
+
+
+def get_session() -> "requests.Session":
+    """
+    Return the process wide pooled session, creating it on first use
+    """
+    global __session__
+
+    with __session_lock__:
+        if __session__ is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            adapter = HTTPAdapter(
+                pool_connections=__pool_size__, pool_maxsize=__pool_size__
+            )
+            new_session = requests.Session()
+            new_session.mount("https://", adapter)
+            new_session.mount("http://", adapter)
+            new_session.headers["User-Agent"] = __user_agent__
+            __session__ = new_session
+        return __session__
+
+
+def get(url: str, **kwargs) -> "requests.Response":
+    kwargs.setdefault("timeout", __timeout__)
+    cache = __cache__
+
+    if cache is None or kwargs.get("stream"):
+        return request("GET", url, **kwargs)
+
+    cache_key = cache_key_for(url, kwargs.get("params"))
+    cached = cache.get(cache_key)
+    if cached is not None:
+        metrics.inc("cache_hits_total", route=metrics.route_of(url))
+        return to_response(
+            cached.url, cached.status_code, cached.content, cached.encoding
+        )
+
+    response = request("GET", url, **kwargs)
+    if response.status_code == 200:
+        cache.put(cache_key, 200, response.content, response.encoding)
+    elif response.status_code == 404:
+        cache.put_negative(cache_key)
+    return response
+
+
+def mark_missing(url: str, params: dict | None = None) -> None:
+    """
+    Replace the cached response of a lookup that found no snapshot with a
+    negative entry
+    """
+    if __cache__ is not None:
+        __cache__.put_negative(cache_key_for(url, params))
+
+
+def cache_key_for(url: str, params: dict | None = None) -> str:
+    if not params:
+        return url
+    import requests
+
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+def to_response(
+    url: str, status_code: int, content: bytes, encoding: str | None = None
+) -> "requests.Response":
+    import requests
+
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = content
+    response.raw = BytesIO(content)
+    response.encoding = encoding
+    return response
+
+
+def head(url: str, **kwargs) -> "requests.Response":
+    kwargs.setdefault("timeout", __timeout__)
+    return request("HEAD", url, **kwargs)
+
+
+def request(method: str, url: str, **kwargs) -> "requests.Response":
+    """
+    Send a request through the shared rate limiter, retrying throttled,
+    failed and reset requests with jittered exponential backoff
+    """
+    import requests
+
+    rate_limiter = __rate_limiter__
+    route = metrics.route_of(url)
+
+    for attempt in range(__max_retries__ + 1):
+        last_attempt = attempt == __max_retries__
+        rate_limiter.acquire()
+
+        started = perf_counter()
+        try:
+            response = get_session().request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            rate_limiter.record_failure()
+            metrics.inc("request_errors_total", route=route)
+            if last_attempt:
+                raise
+            metrics.inc("retries_total", route=route, reason="connection")
+            sleep(backoff_delay(attempt))
+            continue
+
+        # Time to the response headers, streamed bodies are read later
+        metrics.observe("request_seconds", perf_counter() - started, route=route)
+        metrics.inc(
+            "requests_total",
+            method=method,
+            route=route,
+            status=str(response.status_code),
+        )
+
+        if response.status_code in RETRY_STATUS_CODES:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            rate_limiter.record_throttle(retry_after)
+            if last_attempt:
+                return response
+            metrics.inc("retries_total", route=route, reason=str(response.status_code))
+            response.close()
+            sleep(max(retry_after or 0, backoff_delay(attempt)))
+            continue
+
+        rate_limiter.record_success()
+        return response
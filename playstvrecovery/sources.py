@@ -0,0 +1,110 @@
+import re
+from typing import Callable
+
+from . import session
+
+
+PREFER_LARGEST: str = "largest"
+PREFER_SMALLEST: str = "smallest"
+PREFERENCES: tuple[str, ...] = (PREFER_LARGEST, PREFER_SMALLEST)
+
+__resolution_pattern__ = re.compile(r"\d+")
+
+
+class SourcePolicy:
+    """
+    Chooses between the <source> elements of an embed page. Sources are
+    ranked by their res attribute, those above max_resolution are left out
+    unless none is small enough. With probe_size every candidate is sized
+    with a HEAD request first: sources that do not answer are skipped and
+    the sizes found decide the order instead of res
+    """
+
+    def __init__(
+        self,
+        prefer: str = PREFER_LARGEST,
+        max_resolution: int | None = None,
+        probe_size: bool = False,
+        probe: Callable[[str], int | None] | None = None,
+    ) -> None:
+        if prefer not in PREFERENCES:
+            raise ValueError(f"prefer must be one of {', '.join(PREFERENCES)}")
+        self.prefer: str = prefer
+        self.max_resolution: int | None = max_resolution
+        self.probe_size: bool = probe_size
+        self.probe: Callable[[str], int | None] = probe or content_length
+
+    def rank(self, sources: list[dict[str, str]]) -> list[dict[str, str]]:
+        """
+        Sources in the order they should be tried, best first
+        """
+        ranked = sorted(
+            sources, key=resolution_of, reverse=self.prefer == PREFER_LARGEST
+        )
+        if self.max_resolution is None:
+            return ranked
+
+        allowed = [x for x in ranked if resolution_of(x) <= self.max_resolution]
+        # Nothing small enough, the smallest source is still better than none
+        return allowed or sorted(ranked, key=resolution_of)[:1]
+
+    def choose(
+        self, sources: list[dict[str, str]], to_url: Callable[[str], str]
+    ) -> tuple[dict[str, str], str, int | None] | None:
+        """
+        (source, absolute url, size if probed) of the preferred source, None
+        when no source is usable
+        """
+        ranked = [x for x in self.rank(sources) if x.get("src")]
+        if not self.probe_size:
+            return (ranked[0], to_url(ranked[0]["src"]), None) if ranked else None
+
+        probed: list[tuple[dict[str, str], str, int]] = []
+        for source in ranked:
+            url = to_url(source["src"])
+            size = self.probe(url)
+            if size is not None:
+                probed.append((source, url, size))
+
+        if not probed:
+            return None
+        choose = max if self.prefer == PREFER_LARGEST else min
+        return choose(probed, key=lambda x: (x[2], resolution_of(x[0])))
+
+
+def resolution_of(source: dict[str, str]) -> int:
+    """
+    Height given by a source's res attribute ("720", "720p"), 0 if unknown
+    """
+    match = __resolution_pattern__.search(source.get("res") or "")
+    return int(match.group(0)) if match is not None else 0
+
+
+def content_length(url: str) -> int | None:
+    """
+    Size announced by a HEAD request, None when the url does not answer
+    with a length
+    """
+    try:
+        response = session.head(url, allow_redirects=True)
+    except Exception:
+        return None
+    with response:
+        if response.status_code != 200:
+            return None
+        try:
+            return int(response.headers["Content-Length"])
+        except (KeyError, ValueError):
+            return None
+
+
+__policy__: SourcePolicy = SourcePolicy()
+
+
+def set_policy(policy: SourcePolicy) -> None:
+    global __policy__
+    __policy__ = policy
+
+
+def get_policy() -> SourcePolicy:
+    return __policy__
@@ -0,0 +1,173 @@
+import os
+import sqlite3
+from threading import Lock
+
+from .playstv import UserProfile, Video
+
+
+STATE_FILE_NAME: str = ".playstvrec.sqlite"
+
+# Pipeline stages in the order cli.main completes them
+STAGE_NEW: str = "new"
+STAGE_DISCOVERED: str = "discovered"
+STAGE_RESOLVED: str = "resolved"
+STAGE_DOWNLOADED: str = "downloaded"
+STAGES: list[str] = [STAGE_NEW, STAGE_DISCOVERED, STAGE_RESOLVED, STAGE_DOWNLOADED]
+
+STATUS_PENDING: str = "pending"
+STATUS_DOWNLOADED: str = "downloaded"
+STATUS_FAILED: str = "failed"
+
+
+class JobState:
+    """
+    Per output directory record of discovered videos, resolved archive urls
+    and download progress, used to resume an interrupted run
+    """
+
+    def __init__(self, output_path: str) -> None:
+        self.path: str = os.path.join(output_path, STATE_FILE_NAME)
+        self.__lock__: Lock = Lock()
+        self.__connection__ = sqlite3.connect(self.path, check_same_thread=False)
+        self.__connection__.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS profiles (
+                username TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                archive_url TEXT NOT NULL,
+                stage TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS videos (
+                username TEXT NOT NULL,
+                id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                archive_url TEXT NOT NULL,
+                valid INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                PRIMARY KEY (username, id)
+            );
+            """
+        )
+        self.__connection__.commit()
+
+    def stage(self, username: str) -> str:
+        with self.__lock__:
+            row = self.__connection__.execute(
+                "SELECT stage FROM profiles WHERE username = ?", (username,)
+            ).fetchone()
+        return row[0] if row else STAGE_NEW
+
+    def reached(self, username: str, stage: str) -> bool:
+        return STAGES.index(self.stage(username)) >= STAGES.index(stage)
+
+    def load_profile(self, username: str) -> UserProfile | None:
+        """
+        Rebuild a UserProfile with its recorded videos, None if the user
+        was never seen in this output directory
+        """
+        with self.__lock__:
+            profile_row = self.__connection__.execute(
+                "SELECT user_id, archive_url FROM profiles WHERE username = ?",
+                (username,),
+            ).fetchone()
+            video_rows = self.__connection__.execute(
+                "SELECT id, title, archive_url, valid, status, bytes FROM videos "
+                "WHERE username = ? ORDER BY position",
+                (username,),
+            ).fetchall()
+
+        if profile_row is None:
+            return None
+
+        user_profile = UserProfile(username)
+        user_profile.__user_id__ = profile_row[0]
+        user_profile.archive_url = profile_row[1]
+
+        for id, title, archive_url, valid, status, downloaded_bytes in video_rows:
+            video = Video(id, title, "")
+            video.archive_url = archive_url
+            video.valid = bool(valid)
+            video.download_succeeded = {
+                STATUS_DOWNLOADED: True,
+                STATUS_FAILED: False,
+            }.get(status)
+            video.downloaded_bytes = downloaded_bytes
+            user_profile.videos.append(video)
+
+        if user_profile.videos:
+            user_profile.__last_video_id__ = user_profile.videos[-1].id
+        return user_profile
+
+    def save_profile(self, user_profile: UserProfile, stage: str) -> None:
+        """
+        Record the profile, all of its videos and the stage it completed
+        """
+        with self.__lock__:
+            self.__connection__.execute(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?)",
+                (
+                    user_profile.username,
+                    user_profile.__user_id__,
+                    user_profile.archive_url,
+                    stage,
+                ),
+            )
+            self.__connection__.executemany(
+                "INSERT OR REPLACE INTO videos VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    self.__video_row__(user_profile.username, position, video)
+                    for position, video in enumerate(user_profile.videos)
+                ],
+            )
+            self.__connection__.commit()
+
+    def save_video(self, username: str, video: Video) -> None:
+        """
+        Record the download result of a single video, videos streamed in
+        before their profile is saved are appended at the end
+        """
+        with self.__lock__:
+            self.__connection__.execute(
+                "INSERT INTO videos VALUES (?, ?, "
+                "(SELECT COUNT(*) FROM videos WHERE username = ?), ?, ?, ?, ?, ?) "
+                "ON CONFLICT (username, id) DO UPDATE SET archive_url = "
+                "excluded.archive_url, valid = excluded.valid, "
+                "status = excluded.status, bytes = excluded.bytes",
+                (
+                    username,
+                    video.id,
+                    username,
+                    video.title,
+                    video.archive_url,
+                    int(video.valid),
+                    self.__status__(video),
+                    video.downloaded_bytes,
+                ),
+            )
+            self.__connection__.commit()
+
+    def close(self) -> None:
+        with self.__lock__:
+            self.__connection__.close()
+
+    def __video_row__(self, username: str, position: int, video: Video) -> tuple:
+        return (
+            username,
+            video.id,
+            position,
+            video.title,
+            video.archive_url,
+            int(video.valid),
+            self.__status__(video),
+            video.downloaded_bytes,
+        )
+
+    @staticmethod
+    def __status__(video: Video) -> str:
+        if video.download_succeeded:
+            return STATUS_DOWNLOADED
+        if video.download_succeeded is False:
+            return STATUS_FAILED
+        return STATUS_PENDING
@@ -0,0 +1,193 @@
+from contextlib import contextmanager
+import os
+import sqlite3
+from threading import Lock
+from typing import Iterator
+
+from . import metrics
+from .download import download_file
+from .wayback import parse_archive_url
+
+
+STORE_DIR_NAME: str = ".playstvrec-store"
+INDEX_FILE_NAME: str = "index.sqlite"
+OBJECTS_DIR_NAME: str = "objects"
+# Extension of stored files, every stored file is a video
+BLOB_SUFFIX: str = ".mp4"
+# Name a link is made under before it replaces the file in place
+LINK_SUFFIX: str = ".link"
+
+__store__: "ContentStore | None" = None
+
+
+class ContentStore:
+    """
+    Downloaded videos kept once under the digest of their bytes, with an
+    index of the urls they were downloaded from. Output directories get
+    hard links to the stored files, so a clip reachable from several
+    accounts is downloaded once and takes the space of one. The store
+    has to be on the file system of the output directories, where files
+    cannot be hard linked into it the store turns itself off and the
+    downloads stay in the output directories
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path: str = path
+        self.objects_path: str = os.path.join(path, OBJECTS_DIR_NAME)
+        os.makedirs(self.objects_path, exist_ok=True)
+        self.__lock__: Lock = Lock()
+        # Cleared on the first file that cannot be hard linked with the store
+        self.hard_links: bool = True
+        # [lock, fetches holding or waiting for it] per url being fetched, so
+        # concurrent users wanting the same video wait for a single download.
+        # Dropped once no fetch needs it
+        self.__url_locks__: dict[str, list] = {}
+        self.__connection__ = sqlite3.connect(
+            os.path.join(path, INDEX_FILE_NAME), check_same_thread=False
+        )
+        self.__connection__.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sources (
+                url TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL
+            )
+            """
+        )
+        self.__connection__.commit()
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.objects_path, digest[:2], digest + BLOB_SUFFIX)
+
+    def lookup(self, url: str) -> str | None:
+        """
+        Digest of the stored download of url, None when it was never
+        downloaded or its file is gone
+        """
+        with self.__lock__:
+            row = self.__connection__.execute(
+                "SELECT digest FROM sources WHERE url = ?", (source_key(url),)
+            ).fetchone()
+        if row is None or not os.path.isfile(self.blob_path(row[0])):
+            return None
+        return row[0]
+
+    def add(self, file_path: str, digest: str, url: str) -> bool:
+        """
+        Hard link a finished download into the store and index it under
+        url. Content already stored from another url is kept and the
+        download replaced by a link to it. False when file_path cannot be
+        hard linked with the store, the download is then left as it is
+        """
+        blob_path = self.blob_path(digest)
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+        with self.__lock__:
+            if os.path.isfile(blob_path):
+                size = os.path.getsize(file_path)
+                if not self.link(digest, file_path):
+                    return False
+                metrics.inc("store_duplicate_bytes_total", size)
+            else:
+                try:
+                    os.link(file_path, blob_path)
+                except OSError:
+                    return False
+            self.__connection__.execute(
+                "INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                (source_key(url), digest, os.path.getsize(blob_path)),
+            )
+            self.__connection__.commit()
+        return True
+
+    def link(self, digest: str, file_path: str) -> bool:
+        """
+        Put a hard link to the stored file of digest at file_path, replacing
+        what is there. False when the file systems do not allow it
+        """
+        temporary_path = file_path + LINK_SUFFIX
+        if os.path.lexists(temporary_path):
+            os.remove(temporary_path)
+        try:
+            os.link(self.blob_path(digest), temporary_path)
+        except OSError:
+            # Another file system, or one without hard links
+            return False
+        os.replace(temporary_path, file_path)
+        return True
+
+    def fetch(self, url: str, file_path: str) -> int:
+        """
+        Download url to file_path through the store, linking the stored
+        file instead when url was downloaded before. Returns its size
+        """
+        if not self.hard_links:
+            return download_file(url, file_path)
+
+        with self.__url_lock__(url):
+            digest = self.lookup(url)
+            if digest is not None and self.link(digest, file_path):
+                size = os.path.getsize(file_path)
+                metrics.inc("store_hits_total")
+                metrics.inc("store_reused_bytes_total", size)
+                return size
+
+            digests: list[str] = []
+            size = download_file(url, file_path, on_digest=digests.append)
+            if not self.add(file_path, digests[0], url):
+                self.__turn_off__()
+            return size
+
+    def close(self) -> None:
+        with self.__lock__:
+            self.__connection__.close()
+
+    def __turn_off__(self) -> None:
+        """
+        Keep downloads in the output directories only, a copy in the store
+        would take the space the store is meant to save
+        """
+        with self.__lock__:
+            if not self.hard_links:
+                return
+            self.hard_links = False
+
+        from .playstv import structured_warning
+
+        structured_warning(
+            "store",
+            f"Videos cannot be hard linked with {self.path}, the store is "
+            "turned off",
+        )
+
+    @contextmanager
+    def __url_lock__(self, url: str) -> Iterator[None]:
+        key = source_key(url)
+        with self.__lock__:
+            entry = self.__url_locks__.setdefault(key, [Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.__lock__:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.__url_locks__[key]
+
+
+def source_key(url: str) -> str:
+    """
+    Index key of a download url, the original url of a Wayback capture so
+    captures of the same file at other timestamps share it
+    """
+    parsed = parse_archive_url(url)
+    return parsed[1] if parsed is not None else url
+
+
+def set_store(store: ContentStore | None) -> None:
+    global __store__
+    __store__ = store
+
+
+def get_store() -> ContentStore | None:
+    return __store__
@@ -0,0 +1,369 @@
+import re
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Callable, Generator
+from urllib.parse import urlparse
+
+from . import session
+
+
+WAYBACK_URL: str = "https://web.archive.org"
+CDX_ENDPOINT: str = f"{WAYBACK_URL}/cdx/search/cdx"
+AVAILABILITY_ENDPOINT: str = "https://archive.org/wayback/available"
+TIMESTAMP_FORMAT: str = "%Y%m%d%H%M%S"
+# Replay flag returning the capture exactly as archived, without the
+# toolbar and rewritten links
+RAW_FLAG: str = "id_"
+
+# Embed pages were captured by the archive team in the days before shutdown
+EMBEDS_PREFIX: str = "plays.tv/embeds/"
+EMBEDS_ARCHIVE_DATE: datetime = datetime(year=2019, month=12, day=10, hour=17)
+EMBEDS_WINDOW: timedelta = timedelta(days=2)
+
+CDX_PAGE_SIZE: int = 50000
+CDX_MAX_PAGES: int = 20
+
+# Captures of an endpoint listed and tried when its first timestamp fails
+TIMESTAMP_WINDOW: timedelta = timedelta(days=3)
+TIMESTAMP_LIST_PAGES: int = 2
+MAX_TIMESTAMP_CANDIDATES: int = 5
+
+__archive_url_pattern__ = re.compile(
+    r"^https?://[^/]+/web/(\d{1,14})([a-z]{2}_)?/(.+)$"
+)
+__raw__: bool = False
+
+
+def set_raw_mode(raw: bool) -> None:
+    """
+    Fetch original captures instead of the rewritten replay
+    """
+    global __raw__
+    __raw__ = raw
+
+
+def raw_mode() -> bool:
+    return __raw__
+
+
+def set_base_url(wayback_url: str, availability_endpoint: str | None = None) -> None:
+    """
+    Send every archive request to another host, e.g. a local stand-in of
+    the Wayback Machine. The Availability API is expected under the same
+    host unless its endpoint is given
+    """
+    global WAYBACK_URL, CDX_ENDPOINT, AVAILABILITY_ENDPOINT
+    WAYBACK_URL = wayback_url.rstrip("/")
+    CDX_ENDPOINT = f"{WAYBACK_URL}/cdx/search/cdx"
+    AVAILABILITY_ENDPOINT = availability_endpoint or f"{WAYBACK_URL}/wayback/available"
+
+
+def build_archive_url(original: str, timestamp: str, raw: bool | None = None) -> str:
+    """
+    Wayback url of the capture of original at timestamp, in raw form when
+    raw (or, if not given, the raw mode) is set
+    """
+    flag = RAW_FLAG if (__raw__ if raw is None else raw) else ""
+    return f"{WAYBACK_URL}/web/{timestamp}{flag}/{original}"
+
+
+def parse_archive_url(archive_url: str) -> tuple[str, str] | None:
+    """
+    (timestamp, original url) of a Wayback url, None for other urls
+    """
+    match = __archive_url_pattern__.match(archive_url)
+    if match is None:
+        return None
+    return match.group(1), match.group(3)
+
+
+def fetch_url(archive_url: str) -> str:
+    """
+    Url to request for a stored archive url, honouring the raw mode
+    """
+    parsed = parse_archive_url(archive_url)
+    if parsed is None:
+        return archive_url
+    return build_archive_url(parsed[1], parsed[0])
+
+
+def source_url(src: str, page_archive_url: str) -> str:
+    """
+    Absolute url of a <source> src found on an archived page. Replayed pages
+    already point into the archive, raw pages keep the original CDN url
+    which is requested from the capture closest to the page instead
+    """
+    url = f"https:{src}" if src.startswith("//") else src
+    if parse_archive_url(url) is not None:
+        return url
+
+    parsed = parse_archive_url(page_archive_url)
+    if parsed is None:
+        return url
+    return build_archive_url(url, parsed[0], raw=True)
+
+
+def to_timestamp(date: datetime) -> str:
+    return date.strftime(TIMESTAMP_FORMAT)
+
+
+def from_timestamp(timestamp: str) -> datetime:
+    return datetime.strptime(timestamp[:14], TIMESTAMP_FORMAT)
+
+
+def availability_near(url: str, date: datetime) -> tuple[str, str] | None:
+    """
+    Ask the Availability API for the capture of url closest to date, returns
+    (archive url, timestamp) or None when there is no capture
+    """
+    params = {"url": url, "timestamp": to_timestamp(date)}
+    response = session.get(AVAILABILITY_ENDPOINT, params=params)
+
+    # Negative cache entries come back as 404
+    if response.status_code == 404:
+        return None
+
+    snapshots = response.json().get("archived_snapshots") or {}
+    closest = snapshots.get("closest")
+
+    if not closest or not closest.get("available", True):
+        session.mark_missing(AVAILABILITY_ENDPOINT, params)
+        return None
+
+    timestamp = closest["timestamp"]
+    parsed = parse_archive_url(str(closest["url"]))
+    original = parsed[1] if parsed is not None else url
+    return build_archive_url(original, timestamp, raw=False), timestamp
+
+
+def iter_cdx_captures(
+    url: str,
+    match_type: str = "exact",
+    start: datetime | None = None,
+    end: datetime | None = None,
+    page_size: int = CDX_PAGE_SIZE,
+    max_pages: int = CDX_MAX_PAGES,
+    collapse: str | None = None,
+    filters: list[str] | None = None,
+) -> Generator[tuple[str, str], None, str | None]:
+    """
+    Yield (original url, timestamp) for every successful capture matching url
+    and the extra CDX filters, following the CDX resume key for at most
+    max_pages pages. Returns the resume key of the pages left unread, None
+    when every capture was yielded
+    """
+    params = {
+        "url": url,
+        "matchType": match_type,
+        "output": "json",
+        "fl": "original,timestamp",
+        "filter": ["statuscode:200"] + list(filters or ()),
+        "limit": page_size,
+        "showResumeKey": "true",
+    }
+    if start is not None:
+        params["from"] = to_timestamp(start)
+    if end is not None:
+        params["to"] = to_timestamp(end)
+    if collapse is not None:
+        params["collapse"] = collapse
+
+    for _ in range(max_pages):
+        response = session.get(CDX_ENDPOINT, params=params)
+        response.raise_for_status()
+        rows: list[list[str]] = response.json() if response.text.strip() else []
+
+        # First row is the field header, a resume key follows an empty row
+        resume_key: str | None = None
+        if len(rows) >= 2 and rows[-2] == []:
+            resume_key = rows[-1][0]
+            rows = rows[:-2]
+
+        for row in rows[1:]:
+            if len(row) >= 2:
+                yield row[0], row[1]
+
+        if not resume_key:
+            return None
+        params["resumeKey"] = resume_key
+    return params["resumeKey"]
+
+
+class SnapshotIndex:
+    """
+    In-memory map of embed id to the capture closest to the archive date,
+    built from a single paged CDX prefix query. An index cut off by
+    max_pages is not complete, ids missing from it may still be archived
+    """
+
+    def __init__(
+        self,
+        prefix: str = EMBEDS_PREFIX,
+        archive_date: datetime = EMBEDS_ARCHIVE_DATE,
+        window: timedelta = EMBEDS_WINDOW,
+        max_pages: int = CDX_MAX_PAGES,
+    ) -> None:
+        self.prefix: str = prefix
+        self.archive_date: datetime = archive_date
+        self.window: timedelta = window
+        self.max_pages: int = max_pages
+        self.loaded: bool = False
+        self.complete: bool = False
+        self.__timestamps__: dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.__timestamps__)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.__timestamps__
+
+    def load(self) -> int:
+        """
+        Query the CDX endpoint and keep the closest capture per id, returns
+        the number of ids found
+        """
+        captures = iter_cdx_captures(
+            self.prefix,
+            match_type="prefix",
+            start=self.archive_date - self.window,
+            end=self.archive_date + self.window,
+            max_pages=self.max_pages,
+        )
+        try:
+            while True:
+                self.add(*next(captures))
+        except StopIteration as stop:
+            # A resume key is left when max_pages ran out first
+            self.complete = stop.value is None
+        self.loaded = True
+        return len(self)
+
+    def add(self, original: str, timestamp: str) -> None:
+        key = self.key_for(original)
+        if not key:
+            return
+        current = self.__timestamps__.get(key)
+        if current is None or self.distance(timestamp) < self.distance(current):
+            self.__timestamps__[key] = timestamp
+
+    def timestamp_for(self, key: str) -> str | None:
+        return self.__timestamps__.get(key)
+
+    def distance(self, timestamp: str) -> float:
+        try:
+            return abs((from_timestamp(timestamp) - self.archive_date).total_seconds())
+        except ValueError:
+            return float("inf")
+
+    @staticmethod
+    def key_for(original: str) -> str:
+        path = urlparse(original if "//" in original else f"//{original}").path
+        return path.rstrip("/").split("/")[-1]
+
+
+class TimestampFinder:
+    """
+    Picks capture timestamps of an endpoint to try, closest to a target
+    timestamp first. The captures around a target are listed once with a
+    CDX query, scoped to one user's requests when a user id is given, and
+    the timestamp that last worked for the same user is tried before all
+    others
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        list_captures: Callable[[str, str | None], list[str]] | None = None,
+        max_candidates: int = MAX_TIMESTAMP_CANDIDATES,
+    ) -> None:
+        self.endpoint: str = endpoint
+        self.max_candidates: int = max_candidates
+        # Timestamp that last worked per user id
+        self.winners: dict[str | None, str] = {}
+        self.__list_captures__: Callable[[str, str | None], list[str]] = (
+            list_captures or self.list_captures
+        )
+        self.__captures__: dict[tuple[str, str | None], list[str]] = {}
+        self.__lock__: Lock = Lock()
+
+    def first(self, target: str, user_id: str | None = None) -> str:
+        """
+        Timestamp to try before any listing is needed
+        """
+        return self.winners.get(user_id) or target
+
+    def candidates(
+        self,
+        target: str,
+        exclude: set[str] | None = None,
+        user_id: str | None = None,
+    ) -> list[str]:
+        """
+        Listed capture timestamps ranked by distance to target
+        """
+        with self.__lock__:
+            captures = self.__captures__.get((target, user_id))
+
+        # Listed without the lock, so paginators of other users do not wait
+        # for this query. Concurrent misses of the same key list it twice
+        if captures is None:
+            try:
+                captures = sorted(set(self.__list_captures__(target, user_id)))
+            except Exception:
+                captures = []
+            with self.__lock__:
+                captures = self.__captures__.setdefault((target, user_id), captures)
+
+        winner = self.winners.get(user_id)
+        ranked = [
+            x
+            for x in ([winner] if winner else []) + self.rank(captures, target)
+            if x not in (exclude or set())
+        ]
+        return list(dict.fromkeys(ranked))[: self.max_candidates]
+
+    def remember(self, timestamp: str, user_id: str | None = None) -> None:
+        self.winners[user_id] = timestamp
+
+    def list_captures(self, target: str, user_id: str | None = None) -> list[str]:
+        """
+        Timestamps of the endpoint's captures around target. The CDX index
+        sorts query parameters, so a user's requests are picked out with a
+        filter on the original url instead of a longer prefix
+        """
+        try:
+            target_date = from_timestamp(target)
+        except ValueError:
+            target_date = EMBEDS_ARCHIVE_DATE
+        filters = (
+            [f"original:.*[?&]target_user_id={re.escape(user_id)}(&.*)?"]
+            if user_id
+            else []
+        )
+        return [
+            timestamp
+            for _, timestamp in iter_cdx_captures(
+                self.endpoint,
+                match_type="prefix",
+                start=target_date - TIMESTAMP_WINDOW,
+                end=target_date + TIMESTAMP_WINDOW,
+                max_pages=TIMESTAMP_LIST_PAGES,
+                collapse="timestamp:12",
+                filters=filters,
+            )
+        ]
+
+    @staticmethod
+    def rank(timestamps: list[str], target: str) -> list[str]:
+        try:
+            target_date = from_timestamp(target)
+        except ValueError:
+            return list(timestamps)
+
+        def distance(timestamp: str) -> float:
+            try:
+                return abs((from_timestamp(timestamp) - target_date).total_seconds())
+            except ValueError:
+                return float("inf")
+
+        return sorted(timestamps, key=distance)
@@ -0,0 +1,202 @@
+import hashlib
+import os
+from threading import Lock
+from typing import Callable
+
+from . import metrics
+from .ratelimit import BandwidthLimiter
+from . import session
+
+# Bytes read from a response and written to disk per system call
+DEFAULT_BUFFER_SIZE: int = 4 * 1024 * 1024
+# Hash of a file's content, computed while it is written
+DIGEST_ALGORITHM: str = "sha256"
+
+__buffer_size__: int = DEFAULT_BUFFER_SIZE
+
+
+def set_buffer_size(size: int) -> None:
+    global __buffer_size__
+    __buffer_size__ = max(64 * 1024, size)
+
+
+def get_buffer_size() -> int:
+    return __buffer_size__
+
+
+class PartFile:
+    """
+    Unbuffered handle on a .part file, shared by every segment of a download.
+    Space for the whole file is reserved up front, response bodies are read
+    into one reused buffer per stream and written at explicit offsets, and
+    the file is synced once, right before it is renamed into place. Given an
+    algorithm, bytes written in order from the start of the file are hashed
+    as they are written
+    """
+
+    def __init__(
+        self,
+        path: str,
+        size: int | None = None,
+        buffer_size: int | None = None,
+        bandwidth_limiter: BandwidthLimiter | None = None,
+        algorithm: str | None = None,
+    ) -> None:
+        self.path: str = path
+        self.buffer_size: int = buffer_size or __buffer_size__
+        self.bandwidth_limiter: BandwidthLimiter = (
+            bandwidth_limiter or session.get_bandwidth_limiter()
+        )
+        self.__fd__: int | None = os.open(
+            path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644
+        )
+        self.__seek_lock__: Lock = Lock()
+        self.__hash__ = hashlib.new(algorithm) if algorithm else None
+        # Bytes from the start of the file the hash covers
+        self.__hashed__: int = 0
+        self.__hash_lock__: Lock = Lock()
+        if size is not None:
+            self.allocate(size)
+
+    def __enter__(self) -> "PartFile":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def allocate(self, size: int) -> None:
+        """
+        Reserve size bytes, keeping what the file already holds
+        """
+        current_size = os.fstat(self.__fd__).st_size
+        if current_size > size:
+            os.ftruncate(self.__fd__, size)
+        elif current_size < size:
+            try:
+                os.posix_fallocate(self.__fd__, current_size, size - current_size)
+            except (AttributeError, OSError):
+                # Not available on this platform or file system
+                os.ftruncate(self.__fd__, size)
+
+    def write_at(self, data: memoryview | bytes, offset: int) -> None:
+        written = data
+        if hasattr(os, "pwrite"):
+            while data:
+                count = os.pwrite(self.__fd__, data, offset)
+                data, offset = data[count:], offset + count
+        else:
+            with self.__seek_lock__:
+                os.lseek(self.__fd__, offset, os.SEEK_SET)
+                while data:
+                    count = os.write(self.__fd__, data)
+                    data, offset = data[count:], offset + count
+
+        if self.__hash__ is not None:
+            with self.__hash_lock__:
+                # Only the stream writing right after the hashed bytes extends
+                # the hash, ranges written ahead are read back by digest
+                if offset - len(written) == self.__hashed__:
+                    self.__hash__.update(written)
+                    self.__hashed__ = offset
+
+    def read_at(self, size: int, offset: int) -> bytes:
+        if hasattr(os, "pread"):
+            return os.pread(self.__fd__, size, offset)
+
+        with self.__seek_lock__:
+            os.lseek(self.__fd__, offset, os.SEEK_SET)
+            return os.read(self.__fd__, size)
+
+    def digest(self) -> str | None:
+        """
+        Hex digest of the whole file, None without an algorithm. Bytes not
+        hashed while being written, ranges of other segments or the part of
+        a resumed download, are read back from the file
+        """
+        if self.__hash__ is None:
+            return None
+
+        with self.__hash_lock__:
+            size = os.fstat(self.__fd__).st_size
+            while self.__hashed__ < size:
+                chunk = self.read_at(
+                    min(self.buffer_size, size - self.__hashed__), self.__hashed__
+                )
+                if not chunk:
+                    break
+                self.__hash__.update(chunk)
+                self.__hashed__ += len(chunk)
+            return self.__hash__.hexdigest()
+
+    def stream(
+        self,
+        response,
+        offset: int,
+        limit: int | None = None,
+        on_write: Callable[[int], None] | None = None,
+    ) -> int:
+        """
+        Copy up to limit bytes of a response body to offset, returns the
+        number of bytes copied
+        """
+        remaining = limit if limit is not None else float("inf")
+        copied = 0
+        # Under a bandwidth limit reads stay within the bucket, so streams
+        # sleep often and briefly instead of bursting
+        burst = self.bandwidth_limiter.burst
+        read_size = min(self.buffer_size, burst) if burst else self.buffer_size
+
+        if reads_into(response):
+            buffer = memoryview(bytearray(read_size))
+            while remaining > 0:
+                read = response.raw.readinto(buffer[: min(read_size, remaining)])
+                if not read:
+                    break
+                self.write_at(buffer[:read], offset + copied)
+                copied += read
+                remaining -= read
+                self.bandwidth_limiter.consume(read)
+                if on_write is not None:
+                    on_write(read)
+            metrics.inc("downloaded_bytes_total", copied)
+            return copied
+
+        for chunk in response.iter_content(chunk_size=read_size):
+            if limit is not None:
+                chunk = chunk[:remaining]
+            if chunk:
+                self.write_at(chunk, offset + copied)
+                copied += len(chunk)
+                remaining -= len(chunk)
+                self.bandwidth_limiter.consume(len(chunk))
+                if on_write is not None:
+                    on_write(len(chunk))
+            if remaining <= 0:
+                break
+        metrics.inc("downloaded_bytes_total", copied)
+        return copied
+
+    def commit(self, file_path: str) -> str | None:
+        """
+        Flush the file to disk and move it to file_path, returns its digest
+        """
+        digest = self.digest()
+        os.fsync(self.__fd__)
+        self.close()
+        os.replace(self.path, file_path)
+        return digest
+
+    def close(self) -> None:
+        if self.__fd__ is not None:
+            os.close(self.__fd__)
+            self.__fd__ = None
+
+
+def reads_into(response) -> bool:
+    """
+    Whether the body can be read straight from the raw stream, which skips
+    the content decoding iter_content would apply
+    """
+    raw = getattr(response, "raw", None)
+    encoding = response.headers.get("Content-Encoding", "identity").lower()
+    return hasattr(raw, "readinto") and encoding == "identity"
@@ -0,0 +1,30 @@
+from playstvrecovery.cache import ResponseCache
+
+
+def test_response_cache_round_trip(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.put("https://web.archive.org/a", 200, b"<html></html>", "utf-8")
+    cache.put_negative("https://web.archive.org/missing")
+
+    cached = cache.get("https://web.archive.org/a")
+    assert cached.content == b"<html></html>"
+    assert cached.encoding == "utf-8"
+    assert not cached.negative
+    assert cache.get("https://web.archive.org/missing").negative
+    assert cache.get("https://web.archive.org/unknown") is None
+
+    cache.close()
+    assert len(ResponseCache(str(tmp_path))) == 2
+
+
+def test_response_cache_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite"), max_size=250)
+    cache.put("a", 200, b"x" * 100)
+    cache.put("b", 200, b"x" * 100)
+    cache.get("a")
+    cache.put("c", 200, b"x" * 100)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.size <= 250
@@ -0,0 +1,48 @@
+import pytest
+
+from playstvrecovery.catalog import VideoCatalog
+from playstvrecovery.playstv import Video
+
+
+def test_catalog_indexes_and_deduplicates():
+    catalog = VideoCatalog(Video(str(i), f"clip {i}", "") for i in range(3))
+
+    assert catalog.extend([Video("2", "again", ""), Video("3", "clip 3", "")])[0].id == "3"
+    assert len(catalog) == 4
+    assert "2" in catalog
+    assert catalog.get("2").title == "clip 2"
+    assert catalog[-1].id == "3"
+    assert [x.id for x in catalog] == ["0", "1", "2", "3"]
+
+
+def test_catalog_views_follow_video_status():
+    catalog = VideoCatalog(Video(str(i), f"clip {i}", "") for i in range(4))
+    for video in catalog[:3]:
+        video.valid = True
+
+    catalog.get("0").download_succeeded = True
+    catalog.get("1").download_succeeded = False
+
+    assert {x.id for x in catalog.valid} == {"0", "1", "2"}
+    assert {x.id for x in catalog.pending} == {"1", "2"}
+    assert [x.id for x in catalog.downloaded] == ["0"]
+    assert [x.id for x in catalog.failed] == ["1"]
+
+    catalog.get("1").download_succeeded = True
+    assert catalog.failed == []
+    assert catalog.count("downloaded") == 2
+
+
+def test_video_has_no_instance_dict():
+    with pytest.raises(AttributeError):
+        Video("0", "clip", "").unknown = True
+
+
+def test_catalog_views_keep_catalog_order():
+    catalog = VideoCatalog(Video(str(i), f"clip {i}", "") for i in range(5))
+    # Lookups finishing in any order
+    for video_id in ("3", "0", "4", "1"):
+        catalog.get(video_id).valid = True
+
+    assert [x.id for x in catalog.valid] == ["0", "1", "3", "4"]
+    assert [x.id for x in catalog.pending] == ["0", "1", "3", "4"]
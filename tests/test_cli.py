@@ -0,0 +1,216 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from typer.testing import CliRunner
+
+from playstvrecovery import cli, state
+from playstvrecovery.pagination import PaginationError
+from playstvrecovery.playstv import UserProfile, Video
+
+
+def test_read_usernames_skips_blanks_comments_and_duplicates(tmp_path):
+    users_file = tmp_path / "users.txt"
+    users_file.write_text("alice\n\n# friends\nbob  # old account\nalice\n")
+
+    assert cli.read_usernames(users_file) == ["alice", "bob"]
+
+
+def test_batch_recovers_every_user_and_writes_summary(monkeypatch, tmp_path):
+    calls = {}
+
+    def fake_recover_user(user, output_path, **kwargs):
+        calls[user] = (output_path, kwargs)
+        if user == "broken":
+            raise RuntimeError("no archive")
+        return {"user": user, "status": "ok", "downloaded": 1, "failed": 0}
+
+    monkeypatch.setattr(cli, "recover_user", fake_recover_user)
+    monkeypatch.setattr(cli, "configure_run", lambda **kwargs: None)
+
+    result = CliRunner().invoke(
+        cli.app,
+        ["batch", f"--output-path={tmp_path}", "--users-file=-"],
+        input="alice\nbroken\nbob\n",
+    )
+
+    assert result.exit_code == 0, result.output
+    assert calls["alice"][0] == tmp_path / "alice"
+    lookup_executor = calls["alice"][1]["lookup_executor"]
+    assert lookup_executor.key == "alice"
+    assert lookup_executor.scheduler is calls["bob"][1]["lookup_executor"].scheduler
+
+    summaries = json.loads((tmp_path / cli.BATCH_SUMMARY_FILE_NAME).read_text())
+    assert [x["user"] for x in summaries] == ["alice", "broken", "bob"]
+    assert [x["status"] for x in summaries] == ["ok", "error", "ok"]
+
+
+def test_batch_stops_on_interrupt(monkeypatch, tmp_path):
+    recovered = []
+
+    def fake_recover_user(user, output_path, **kwargs):
+        time.sleep(0.01)
+        recovered.append(user)
+        if user == "user1":
+            raise KeyboardInterrupt
+        return {"user": user, "status": "ok"}
+
+    monkeypatch.setattr(cli, "recover_user", fake_recover_user)
+    monkeypatch.setattr(cli, "configure_run", lambda **kwargs: None)
+
+    result = CliRunner().invoke(
+        cli.app,
+        [
+            "batch",
+            f"--output-path={tmp_path}",
+            "--users-file=-",
+            "--concurrent-users=2",
+        ],
+        input="".join(f"user{i}\n" for i in range(20)),
+    )
+
+    assert result.exit_code != 0
+    # Only users already running when it was interrupted are recovered
+    time.sleep(0.05)
+    assert len(recovered) <= 4
+
+
+def test_execute_downloads_only_its_shard(monkeypatch, tmp_path):
+    manifest_path = tmp_path / "plan.jsonl"
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        for i in range(20):
+            entry = {
+                "user": f"user{i % 2}",
+                "video_id": str(i),
+                "title": f"clip {i}",
+                "archive_url": f"https://web.archive.org/web/2019/embeds/{i}",
+                "video_url": f"https://cdn/{i}.mp4",
+                "resolution": "720",
+            }
+            file.write(json.dumps(entry) + "\n")
+
+    downloaded = []
+
+    def fake_download_videos(self, output_path, workers, executor=None):
+        downloaded.extend(x.id for x in self.videos.pending)
+
+    monkeypatch.setattr(cli.playstv.UserProfile, "download_videos", fake_download_videos)
+    runs = []
+    monkeypatch.setattr(cli, "configure_run", lambda **kwargs: runs.append(kwargs))
+
+    for shard in ("1/3", "2/3", "3/3"):
+        result = CliRunner().invoke(
+            cli.app,
+            [
+                "execute",
+                f"--output-path={tmp_path}",
+                f"--manifest={manifest_path}",
+                f"--shard={shard}",
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+    assert sorted(downloaded, key=int) == [str(i) for i in range(20)]
+    assert (tmp_path / "user0" / "summary-1-of-3.json").is_file()
+    # Shards may share the output directory, the store is left off
+    assert [x["store_dir"] for x in runs] == [None, None, None]
+
+
+def test_profile_reports_go_next_to_the_output(tmp_path):
+    assert cli.profile_path(tmp_path / "out") == tmp_path / "out-profile"
+    assert cli.profile_path(tmp_path / "plan.jsonl") == tmp_path / "plan-profile"
+    assert cli.profile_path(tmp_path / "out", "-2-of-4") == (
+        tmp_path / "out-2-of-4-profile"
+    )
+
+
+def test_import_loads_no_network_or_parsing_dependencies():
+    # A fresh interpreter, this one has them loaded by the other tests
+    code = (
+        "import sys, playstvrecovery.cli; "
+        "print(sorted({'requests', 'bs4', 'rich'} & set(sys.modules)))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.join(os.path.dirname(__file__), ".."),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert completed.stdout.strip() == "[]"
+
+
+def test_failed_snapshot_index_is_not_queried_again(monkeypatch):
+    queries = []
+
+    def failing_query():
+        queries.append(1)
+        return None
+
+    monkeypatch.setattr(cli, "__snapshot_index__", None)
+    monkeypatch.setattr(cli, "__snapshot_index_failed__", False)
+    monkeypatch.setattr(cli, "query_snapshot_index", failing_query)
+
+    assert cli.load_snapshot_index() is None
+    assert cli.load_snapshot_index() is None
+    assert len(queries) == 1
+
+
+def test_recover_user_discovers_again_after_failed_pages(monkeypatch, tmp_path):
+    pages_fail = True
+    discoveries = []
+
+    def fake_get_profile(user):
+        user_profile = UserProfile(user)
+        user_profile.archive_url = "https://web.archive.org/web/1/https://plays.tv/u/x"
+        return user_profile
+
+    def fake_get_user_id(self):
+        self.__user_id__ = "42"
+
+    def fake_get_initial_videos(self):
+        self.videos = [Video("1", "clip 1", "")]
+
+    def fake_iter_more_videos(self, prefetch=True):
+        discoveries.append(self.username)
+        if pages_fail:
+            raise PaginationError(2, "not archived")
+        yield []
+
+    monkeypatch.setattr(cli.playstv, "get_profile", fake_get_profile)
+    monkeypatch.setattr(UserProfile, "get_user_id", fake_get_user_id)
+    monkeypatch.setattr(UserProfile, "get_initial_videos", fake_get_initial_videos)
+    monkeypatch.setattr(UserProfile, "iter_more_videos", fake_iter_more_videos)
+    monkeypatch.setattr(UserProfile, "check_video_availability", lambda *a, **k: 0)
+    monkeypatch.setattr(UserProfile, "download_videos", lambda *a, **k: None)
+
+    cli.recover_user("someone", tmp_path)
+    job_state = state.JobState(str(tmp_path))
+    assert job_state.stage("someone") == state.STAGE_NEW
+    job_state.close()
+
+    pages_fail = False
+    cli.recover_user("someone", tmp_path)
+    job_state = state.JobState(str(tmp_path))
+    assert job_state.reached("someone", state.STAGE_RESOLVED)
+    job_state.close()
+    assert discoveries == ["someone", "someone"]
+
+
+def test_options_without_a_command_recover_one_user(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setattr(cli, "configure_run", lambda **kwargs: None)
+    monkeypatch.setattr(
+        cli, "recover_user", lambda user, output_path, **kwargs: calls.append(user)
+    )
+
+    result = CliRunner().invoke(
+        cli.app, ["--user=someone", f"--output-path={tmp_path}"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert calls == ["someone"]
+    assert CliRunner().invoke(cli.app, ["--user=someone"]).exit_code == 2
@@ -0,0 +1,236 @@
+import hashlib
+import os
+
+import pytest
+
+from playstvrecovery import download
+from playstvrecovery.download import IncompleteDownload, download_file
+
+payload = bytes(range(256)) * 40
+
+
+class FakeStream:
+    def __init__(self, status_code: int, body: bytes, headers: dict) -> None:
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i : i + chunk_size]
+
+
+def serve(monkeypatch, support_ranges: bool, truncate_at: int | None = None):
+    requests_made = []
+
+    def fake_get(url, stream=False, headers=None, **kwargs):
+        requests_made.append(headers or {})
+        range_header = (headers or {}).get("Range")
+        if range_header and support_ranges:
+            start, end = range_header[len("bytes=") :].split("-")
+            start, end = int(start), int(end or len(payload) - 1)
+            body = payload[start : end + 1]
+            return FakeStream(
+                206,
+                body,
+                {
+                    "Content-Length": str(len(body)),
+                    "Content-Range": f"bytes {start}-{end}/{len(payload)}",
+                },
+            )
+        body = payload[:truncate_at] if truncate_at else payload
+        return FakeStream(200, body, {"Content-Length": str(len(payload))})
+
+    monkeypatch.setattr(download.session, "get", fake_get)
+    return requests_made
+
+
+def test_download_file_resumes_part_file(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    with open(file_path + ".part", "wb") as file:
+        file.write(payload[:1000])
+
+    requests_made = serve(monkeypatch, support_ranges=True)
+
+    assert download_file("https://cdn/clip.mp4", file_path) == len(payload)
+    assert requests_made[0]["Range"] == "bytes=1000-"
+    assert not os.path.exists(file_path + ".part")
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_download_file_restarts_without_range_support(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    with open(file_path + ".part", "wb") as file:
+        file.write(b"stale")
+
+    serve(monkeypatch, support_ranges=False)
+    download_file("https://cdn/clip.mp4", file_path)
+
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_download_file_keeps_truncated_part(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    serve(monkeypatch, support_ranges=True, truncate_at=500)
+
+    with pytest.raises(IncompleteDownload):
+        download_file("https://cdn/clip.mp4", file_path)
+
+    # The part file is allocated in full, its record keeps what was received
+    assert not os.path.exists(file_path)
+    assert os.path.getsize(file_path + ".part") == len(payload)
+    record = download.SegmentRecord.load(file_path + ".part.segments")
+    assert [x.written for x in record.segments] == [500]
+
+    requests_made = serve(monkeypatch, support_ranges=True)
+    assert download_file("https://cdn/clip.mp4", file_path) == len(payload)
+    assert requests_made == [{"Range": f"bytes=500-{len(payload) - 1}"}]
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def serve_segments(monkeypatch, honour_ranges: bool = True, fail_from: int | None = None):
+    """
+    Advertise range support for a payload, optionally answering range requests
+    with the whole body or failing those starting at fail_from
+    """
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 1000)
+    ranges_requested = []
+
+    def fake_get(url, stream=False, headers=None, **kwargs):
+        range_header = (headers or {}).get("Range")
+        if range_header is None or not honour_ranges:
+            return FakeStream(
+                200,
+                payload,
+                {"Content-Length": str(len(payload)), "Accept-Ranges": "bytes"},
+            )
+
+        start, end = (int(x) for x in range_header[len("bytes=") :].split("-"))
+        ranges_requested.append((start, end))
+        if fail_from is not None and start >= fail_from:
+            raise ConnectionError("reset")
+        return FakeStream(
+            206,
+            payload[start : end + 1],
+            {"Content-Range": f"bytes {start}-{end}/{len(payload)}"},
+        )
+
+    monkeypatch.setattr(download.session, "get", fake_get)
+    return ranges_requested
+
+
+def test_download_file_fetches_segments_concurrently(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    ranges_requested = serve_segments(monkeypatch)
+
+    assert download_file("https://cdn/clip.mp4", file_path, max_segments=4) == len(payload)
+
+    # The plain GET is read as the first segment
+    assert sorted(ranges_requested) == [(2560, 5119), (5120, 7679), (7680, 10239)]
+    assert not os.path.exists(file_path + ".part.segments")
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_download_file_resumes_unfinished_segments(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    serve_segments(monkeypatch, fail_from=7680)
+
+    with pytest.raises(ConnectionError):
+        download_file("https://cdn/clip.mp4", file_path, max_segments=4)
+    assert os.path.getsize(file_path + ".part") == len(payload)
+    assert os.path.exists(file_path + ".part.segments")
+
+    ranges_requested = serve_segments(monkeypatch)
+    download_file("https://cdn/clip.mp4", file_path, max_segments=4)
+
+    assert ranges_requested == [(7680, 10239)]
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_download_file_falls_back_to_single_stream(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    serve_segments(monkeypatch, honour_ranges=False)
+
+    assert download_file("https://cdn/clip.mp4", file_path, max_segments=4) == len(payload)
+
+    assert not os.path.exists(file_path + ".part.segments")
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_plan_segments_cover_the_file(monkeypatch):
+    monkeypatch.setattr(download, "MIN_SEGMENT_SIZE", 1000)
+
+    segments = download.plan_segments(10_001, 4)
+    assert [(x.start, x.end) for x in segments] == [
+        (0, 2500),
+        (2501, 5001),
+        (5002, 7502),
+        (7503, 10000),
+    ]
+    assert len(download.plan_segments(2_500, 4)) == 2
+
+
+def test_download_file_passes_digest_of_segmented_file(monkeypatch, tmp_path):
+    serve_segments(monkeypatch)
+    digests = []
+
+    download_file(
+        "https://cdn/clip.mp4",
+        str(tmp_path / "clip.mp4"),
+        max_segments=4,
+        on_digest=digests.append,
+    )
+
+    assert digests == [hashlib.sha256(payload).hexdigest()]
+
+
+def test_download_file_discards_full_part_without_record(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    # Space reserved for the whole file, interrupted before anything was written
+    with open(file_path + ".part", "wb") as file:
+        file.write(bytes(len(payload)))
+
+    requests_made = []
+
+    def fake_get(url, stream=False, headers=None, **kwargs):
+        requests_made.append(headers or {})
+        if headers:
+            return FakeStream(416, b"", {"Content-Range": f"bytes */{len(payload)}"})
+        return FakeStream(200, payload, {"Content-Length": str(len(payload))})
+
+    monkeypatch.setattr(download.session, "get", fake_get)
+
+    assert download_file("https://cdn/clip.mp4", file_path) == len(payload)
+    assert requests_made == [{"Range": f"bytes={len(payload)}-"}, {}]
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_download_segments_saves_record_before_reserving_space(monkeypatch, tmp_path):
+    file_path = str(tmp_path / "clip.mp4")
+    serve_segments(monkeypatch)
+
+    def interrupted_allocate(self, size):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(download.PartFile, "allocate", interrupted_allocate)
+    with pytest.raises(KeyboardInterrupt):
+        download_file("https://cdn/clip.mp4", file_path)
+
+    assert download.SegmentRecord.load(file_path + ".part.segments") is not None
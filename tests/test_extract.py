@@ -0,0 +1,59 @@
+import json
+import os
+
+from bs4 import BeautifulSoup
+
+from playstvrecovery.extract import (
+    find_ld_json_videos,
+    find_user_id,
+    find_video_items,
+    find_video_sources,
+)
+
+fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def read_fixture(name: str) -> str:
+    with open(os.path.join(fixtures_path, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def test_profile_page_matches_tree_parse():
+    page = read_fixture("profile.html")
+    soup = BeautifulSoup(page, "html.parser")
+
+    assert find_user_id(page) == soup.find("button", {"title": "Add Friend"}).attrs[
+        "data-obj-id"
+    ]
+    assert find_user_id(page.encode()) == find_user_id(page)
+    assert find_ld_json_videos(page) == [
+        json.loads(x.string)
+        for x in soup.find_all("script", type="application/ld+json")
+    ][0]["video"]
+
+
+def test_module_body_matches_tree_parse():
+    body = json.loads(read_fixture("module.json"))["body"]
+    soup = BeautifulSoup(body, "html.parser")
+
+    assert find_video_items(body) == [
+        (x.attrs["data-feed-id"], x.find("a", {"class": "title"}).text)
+        for x in soup.find_all("li", {"class": "video-item"})
+    ]
+
+
+def test_embed_page_matches_tree_parse():
+    page = read_fixture("embed.html")
+    soup = BeautifulSoup(page, "html.parser")
+
+    assert find_video_sources(page) == [
+        x.attrs for x in soup.find("video").find_all("source")
+    ]
+    assert find_video_sources("<html><body>No video</body></html>") is None
+    assert find_video_sources("<video></video>") == []
+
+
+def test_extraction_falls_back_to_tree_parse():
+    unquoted = "<button data-obj-id=abc title='Add Friend'>Add</button>"
+    assert find_user_id(unquoted) == "abc"
+    assert find_user_id("<p>No button</p>") is None
@@ -0,0 +1,95 @@
+import json
+
+import pytest
+
+from playstvrecovery import manifest
+from playstvrecovery.manifest import (
+    ManifestError,
+    group_by_user,
+    parse_shard,
+    read_manifest,
+    select_shard,
+    shard_of,
+    write_entries,
+)
+from playstvrecovery.playstv import UserProfile, Video
+
+
+def make_profile() -> UserProfile:
+    profile = UserProfile("someone")
+    for i in range(4):
+        video = Video(str(i), f"clip {i}", "")
+        video.archive_url = f"https://web.archive.org/web/2019/https://plays.tv/embeds/{i}"
+        video.valid = i != 3
+        if i == 0:
+            video.video_url = "https://cdn/0.mp4"
+            video.video_resolution = "720"
+        profile.videos.append(video)
+    return profile
+
+
+def test_manifest_round_trip_keeps_archived_videos(tmp_path):
+    path = tmp_path / "plan.jsonl"
+    with open(path, "w", encoding="utf-8") as file:
+        assert write_entries(file, make_profile()) == 3
+
+    entries = list(read_manifest(str(path)))
+    assert [x["video_id"] for x in entries] == ["0", "1", "2"]
+    assert list(entries[0]) == list(manifest.MANIFEST_FIELDS)
+    assert entries[0]["resolution"] == "720"
+
+    videos = group_by_user(entries)["someone"].videos
+    assert videos[0].video_url == "https://cdn/0.mp4"
+    assert videos[1].video_url is None
+    assert len(videos.pending) == 3
+
+
+def test_read_manifest_rejects_incomplete_lines(tmp_path):
+    path = tmp_path / "plan.jsonl"
+    path.write_text(json.dumps({"user": "someone", "video_id": "1"}) + "\n")
+
+    with pytest.raises(ManifestError):
+        list(read_manifest(str(path)))
+
+
+def test_shards_partition_videos_deterministically():
+    entries = [{"video_id": f"{i:024x}"} for i in range(200)]
+
+    shards = [list(select_shard(entries, index, 4)) for index in range(1, 5)]
+
+    assert sorted(x["video_id"] for shard in shards for x in shard) == sorted(
+        x["video_id"] for x in entries
+    )
+    assert all(shards)
+    assert list(select_shard(reversed(entries), 2, 4)) == shards[1][::-1]
+    assert shard_of("abc", 4) == shard_of("abc", 4)
+
+
+@pytest.mark.parametrize("shard", ["0/4", "5/4", "1/0", "1", "a/b"])
+def test_parse_shard_rejects_invalid_values(shard):
+    with pytest.raises(ManifestError):
+        parse_shard(shard)
+
+
+def test_parse_shard():
+    assert parse_shard("2/4") == (2, 4)
+
+
+def test_planned_videos_download_without_fetching_the_embed(monkeypatch, tmp_path):
+    video = make_profile().videos[0]
+    downloads = []
+
+    def fail_resolve(self) -> bool:
+        raise AssertionError("embed page fetched")
+
+    def fake_download(url: str, file_path: str) -> int:
+        downloads.append(url)
+        return 10
+
+    monkeypatch.setattr(Video, "resolve_source", fail_resolve)
+    monkeypatch.setattr("playstvrecovery.playstv.download_file", fake_download)
+
+    video.download_video(str(tmp_path))
+
+    assert downloads == ["https://cdn/0.mp4"]
+    assert video.download_succeeded
@@ -0,0 +1,82 @@
+import json
+
+from playstvrecovery import metrics
+from playstvrecovery.metrics import Histogram, Metrics
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram(buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+
+    assert histogram.cumulative() == [("0.1", 2), ("1", 3), ("+Inf", 4)]
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.75) == 1
+    assert histogram.quantile(1) is None
+    assert Histogram().quantile(0.5) is None
+
+
+def test_counters_and_stages_in_summary(monkeypatch):
+    recorded = Metrics()
+    recorded.inc("requests_total", route="embed", status="200")
+    recorded.inc("requests_total", route="embed", status="200")
+    recorded.inc("downloaded_bytes_total", 1024)
+    recorded.observe("request_seconds", 0.02, route="embed")
+    with recorded.stage("download"):
+        pass
+
+    summary = json.loads(json.dumps(recorded.summary()))
+
+    assert recorded.counter("requests_total", status="200", route="embed") == 2
+    assert summary["counters"]["downloaded_bytes_total"] == [
+        {"labels": {}, "value": 1024}
+    ]
+    assert summary["stages"]["download"]["runs"] == 1
+    assert summary["stages"]["download"]["seconds"] >= 0
+    (latency,) = summary["histograms"]["request_seconds"]
+    assert latency["labels"] == {"route": "embed"}
+    assert latency["count"] == 1
+    assert latency["p50"] == 0.025
+
+
+def test_prometheus_textfile(tmp_path):
+    recorded = Metrics()
+    recorded.inc("downloaded_bytes_total", 1234567890)
+    recorded.inc("retries_total", route="module", reason='4"29')
+    recorded.observe("parse_seconds", 0.0003, page="embed")
+
+    recorded.write_prometheus(str(tmp_path / "run.prom"))
+    lines = (tmp_path / "run.prom").read_text().splitlines()
+
+    assert "# TYPE playstvrec_downloaded_bytes_total counter" in lines
+    assert "playstvrec_downloaded_bytes_total 1234567890" in lines
+    assert 'playstvrec_retries_total{reason="4\\"29",route="module"} 1' in lines
+    assert "# TYPE playstvrec_parse_seconds histogram" in lines
+    assert 'playstvrec_parse_seconds_bucket{page="embed",le="0.00025"} 0' in lines
+    assert 'playstvrec_parse_seconds_bucket{page="embed",le="0.0005"} 1' in lines
+    assert 'playstvrec_parse_seconds_count{page="embed"} 1' in lines
+    assert not (tmp_path / "run.prom.tmp").exists()
+
+
+def test_timed_records_into_current_metrics(monkeypatch):
+    recorded = Metrics()
+    monkeypatch.setattr(metrics, "__metrics__", recorded)
+
+    @metrics.timed("parse_seconds", page="profile")
+    def parse(page: str) -> int:
+        return len(page)
+
+    assert parse("abc") == 3
+    assert recorded.histogram("parse_seconds", page="profile").count == 1
+
+
+def test_route_of():
+    base = "https://web.archive.org/web/20191210170000"
+    assert metrics.route_of("https://archive.org/wayback/available") == (
+        "availability"
+    )
+    assert metrics.route_of("https://web.archive.org/cdx/search/cdx") == "cdx"
+    assert metrics.route_of(f"{base}/https://plays.tv/u/someone") == "profile"
+    assert metrics.route_of(f"{base}/https://plays.tv/embeds/abc") == "embed"
+    assert metrics.route_of(f"{base}/https://plays.tv/ws/module?x=1") == "module"
+    assert metrics.route_of(f"{base}id_/https://cdn.example/abc/720.mp4") == "video"
@@ -0,0 +1,123 @@
+import json
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from playstvrecovery.pagination import (
+    ALTERNATE_MODULE_TIMESTAMP,
+    ModulePaginator,
+    PaginationError,
+)
+from playstvrecovery.wayback import TimestampFinder
+
+archive_url = "https://web.archive.org/web/20191210043532/https://plays.tv/u/someone"
+
+
+def page(*ids: str) -> str:
+    items = "".join(
+        f'<li class="video-item" data-feed-id="{x}"><a class="title">clip {x}</a></li>'
+        for x in ids
+    )
+    return json.dumps({"body": f"<ul>{items}</ul>" if ids else ""})
+
+
+def no_captures() -> TimestampFinder:
+    return TimestampFinder(
+        "plays.tv/ws/module", list_captures=lambda target, user_id: []
+    )
+
+
+def fake_module(pages: dict[int, str], broken_timestamps: set[str] = frozenset()):
+    requested = []
+
+    def fetch(url: str) -> str:
+        requested.append(url)
+        if url.split("/")[4] in broken_timestamps:
+            return "<html>not json</html>"
+        query = parse_qs(urlparse(url.split("/", 5)[5]).query)
+        return pages[int(query["page_num"][0])]
+
+    return fetch, requested
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_paginator_stops_on_empty_page(prefetch):
+    fetch, requested = fake_module({1: page("a", "b"), 2: page("b", "c"), 3: page()})
+    paginator = ModulePaginator(
+        archive_url,
+        "42",
+        "start",
+        {"a"},
+        fetch=fetch,
+        prefetch=prefetch,
+        timestamp_finder=no_captures(),
+    )
+
+    assert [ids for ids in paginator] == [[("b", "clip b")], [("c", "clip c")]]
+    assert paginator.finished
+    assert paginator.last_id == "c"
+    assert len(requested) == 3
+    assert paginator.prefetch_hits == (2 if prefetch else 0)
+
+
+def test_paginator_retries_alternate_timestamp():
+    fetch, requested = fake_module(
+        {1: page("a"), 2: page()}, broken_timestamps={"20191210043532"}
+    )
+    paginator = ModulePaginator(
+        archive_url,
+        "42",
+        "start",
+        fetch=fetch,
+        prefetch=False,
+        timestamp_finder=no_captures(),
+    )
+
+    assert list(paginator) == [[("a", "clip a")]]
+    assert f"/{ALTERNATE_MODULE_TIMESTAMP}/" in requested[-1]
+
+
+def test_paginator_raises_when_every_timestamp_fails():
+    fetch, _ = fake_module(
+        {1: page("a")}, broken_timestamps={"20191210043532", ALTERNATE_MODULE_TIMESTAMP}
+    )
+    paginator = ModulePaginator(
+        archive_url, "42", "start", fetch=fetch, timestamp_finder=no_captures()
+    )
+
+    with pytest.raises(PaginationError) as error:
+        list(paginator)
+    assert error.value.page_num == 1
+    assert not paginator.finished
+
+
+def test_paginator_tries_closest_listed_capture_and_remembers_it():
+    listed = []
+
+    def list_captures(target: str, user_id: str) -> list[str]:
+        listed.append((target, user_id))
+        return ["20191201000000", "20191210050000", "20191210120000"]
+
+    finder = TimestampFinder("plays.tv/ws/module", list_captures=list_captures)
+    fetch, requested = fake_module(
+        {1: page("a"), 2: page()}, broken_timestamps={"20191210043532"}
+    )
+    paginator = ModulePaginator(
+        archive_url, "42", "start", fetch=fetch, prefetch=False, timestamp_finder=finder
+    )
+
+    assert list(paginator) == [[("a", "clip a")]]
+    assert "/20191210050000/" in requested[1]
+    assert finder.winners == {"42": "20191210050000"}
+    assert listed == [("20191210043532", "42")]
+
+    next_paginator = ModulePaginator(
+        archive_url, "42", "start", fetch=fetch, prefetch=False, timestamp_finder=finder
+    )
+    assert "/20191210050000/" in next_paginator.page_url(1, "start")
+
+    # Another user's paginator starts from its own profile snapshot
+    other_paginator = ModulePaginator(
+        archive_url, "43", "start", fetch=fetch, prefetch=False, timestamp_finder=finder
+    )
+    assert "/20191210043532/" in other_paginator.page_url(1, "start")
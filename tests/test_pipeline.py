@@ -0,0 +1,48 @@
+from playstvrecovery.pipeline import StreamingPipeline
+from playstvrecovery.playstv import UserProfile, Video
+
+
+class FakeProfile(UserProfile):
+    def get_user_id(self) -> None:
+        pass
+
+    def get_initial_videos(self) -> None:
+        self.add_videos([Video(str(i), f"clip {i}", "") for i in range(5)])
+
+    def get_more_videos(self, timestamp: str | None = None) -> None:
+        for page in range(1, 4):
+            self.add_videos(
+                [Video(str(page * 10 + i), f"clip {i}", "") for i in range(5)]
+            )
+
+
+def test_streaming_pipeline_moves_videos_through_stages(monkeypatch, tmp_path):
+    def fake_check(self) -> bool:
+        self.valid = int(self.id) % 2 == 0
+        return self.valid
+
+    def fake_download(self, output_path: str) -> None:
+        self.download_succeeded = self.id != "10"
+
+    monkeypatch.setattr(Video, "check_availability", fake_check)
+    monkeypatch.setattr(Video, "download_video", fake_download)
+
+    finished = []
+    profile = FakeProfile("someone")
+    streaming_pipeline = StreamingPipeline(
+        profile,
+        str(tmp_path),
+        lookup_workers=3,
+        download_workers=2,
+        queue_size=2,
+        on_finished=finished.append,
+    )
+    streaming_pipeline.run()
+
+    assert streaming_pipeline.discovered == 20
+    assert streaming_pipeline.resolved == 12
+    assert streaming_pipeline.downloaded == 11
+    assert streaming_pipeline.failed == 1
+    valid_ids = sorted(x.id for x in profile.videos if x.valid)
+    assert sorted(x.id for x in finished) == valid_ids
+    assert profile.video_listeners == []
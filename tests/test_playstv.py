@@ -1,4 +1,10 @@
-from playstvrecovery.playstv import UserProfile
+import json
+from time import sleep
+
+import pytest
+
+from playstvrecovery import playstv
+from playstvrecovery.playstv import UserProfile, Video
 
 
 test_username = "MrNicola"
@@ -28,3 +34,135 @@ def test_userprofile_get_user_id():
         assert len(test_user_profile.__user_id__) > 0
     else:
         assert False
+
+
+def test_userprofile_download_videos_concurrently(monkeypatch, tmp_path):
+    profile = UserProfile(test_username)
+    profile.videos = [Video(str(i), f"clip {i}", "") for i in range(10)]
+    for video in profile.videos[:8]:
+        video.valid = True
+
+    def fake_download(self, output_path):
+        self.download_succeeded = self.id != "3"
+
+    monkeypatch.setattr(Video, "download_video", fake_download)
+    profile.download_videos(str(tmp_path), workers=4)
+
+    assert [x.id for x in profile.videos if x.download_succeeded is False] == ["3"]
+    assert all(x.download_succeeded is None for x in profile.videos[8:])
+
+
+def test_userprofile_download_videos_stops_on_interrupt(monkeypatch, tmp_path):
+    profile = UserProfile(test_username)
+    profile.videos = [Video(str(i), f"clip {i}", "") for i in range(40)]
+    for video in profile.videos:
+        video.valid = True
+    downloaded = []
+
+    def fake_download(self, output_path):
+        sleep(0.01)
+        downloaded.append(self.id)
+        if self.id == "1":
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(Video, "download_video", fake_download)
+    with pytest.raises(KeyboardInterrupt):
+        profile.download_videos(str(tmp_path), workers=2)
+
+    # Only downloads already running when it was interrupted are finished
+    sleep(0.05)
+    assert len(downloaded) <= 4
+
+
+def test_userprofile_download_videos_after_a_streamed_run(monkeypatch, tmp_path):
+    profile = UserProfile(test_username)
+    profile.videos = [Video(str(i), f"clip {i}", "") for i in range(3)]
+    for video in profile.videos:
+        video.valid = True
+        video.download_succeeded = True
+    messages = []
+    monkeypatch.setattr(
+        playstv, "structured_info", lambda subject, message: messages.append(message)
+    )
+
+    profile.download_videos(str(tmp_path), workers=2)
+
+    assert messages[-1] == "[green]No videos left to download (3 already downloaded)"
+
+
+def test_userprofile_check_video_availability_concurrently(monkeypatch):
+    profile = UserProfile(test_username)
+    profile.videos = [Video(str(i), f"clip {i}", "") for i in range(12)]
+
+    def fake_check(self):
+        sleep(0.01)
+        self.valid = int(self.id) % 2 == 0
+        if self.valid:
+            self.archive_url = f"https://web.archive.org/web/1/{self.original_url}"
+        return self.valid
+
+    monkeypatch.setattr(Video, "check_availability", fake_check)
+    peak = profile.check_video_availability(concurrency=3)
+
+    assert 1 <= peak <= 3
+    assert [x.id for x in profile.videos if x.valid] == ["0", "2", "4", "6", "8", "10"]
+    assert all(x.archive_url for x in profile.videos if x.valid)
+
+
+def test_userprofile_check_video_availability_stops_on_interrupt(monkeypatch):
+    profile = UserProfile(test_username)
+    profile.videos = [Video(str(i), f"clip {i}", "") for i in range(40)]
+    checked = []
+
+    def fake_check(self):
+        sleep(0.01)
+        checked.append(self.id)
+        if self.id == "1":
+            raise KeyboardInterrupt
+        return False
+
+    monkeypatch.setattr(Video, "check_availability", fake_check)
+    with pytest.raises(KeyboardInterrupt):
+        profile.check_video_availability(concurrency=2)
+
+    sleep(0.05)
+    assert len(checked) <= 4
+
+
+def test_userprofile_resolve_video_sources_stops_on_interrupt(monkeypatch):
+    profile = UserProfile(test_username)
+    profile.videos = [Video(str(i), f"clip {i}", "") for i in range(40)]
+    for video in profile.videos:
+        video.valid = True
+    resolved = []
+
+    def fake_resolve(self):
+        sleep(0.01)
+        resolved.append(self.id)
+        if self.id == "1":
+            raise KeyboardInterrupt
+        return True
+
+    monkeypatch.setattr(Video, "resolve_source", fake_resolve)
+    with pytest.raises(KeyboardInterrupt):
+        profile.resolve_video_sources(concurrency=2)
+
+    sleep(0.05)
+    assert len(resolved) <= 4
+
+
+def test_structured_messages_as_json_lines(tmp_path):
+    log_path = tmp_path / "run.jsonl"
+    playstv.set_log_file(str(log_path))
+    try:
+        playstv.structured_info("More videos", "[green]Added [bold]3 videos")
+        playstv.structured_error("download", "[1/2] clip failed")
+    finally:
+        playstv.set_log_file(None)
+
+    records = [json.loads(x) for x in log_path.read_text().splitlines()]
+    assert [(x["level"], x["subject"], x["message"]) for x in records] == [
+        ("info", "more videos", "Added 3 videos"),
+        ("error", "download", "[1/2] clip failed"),
+    ]
+    assert all(x["time"].endswith("+00:00") for x in records)
@@ -0,0 +1,81 @@
+from threading import Event, Thread
+
+from playstvrecovery import profiling
+from playstvrecovery.profiling import Profiler, Sampler
+
+
+def spin(stop: Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_sees_busy_worker_threads():
+    stop = Event()
+    worker = Thread(target=spin, args=(stop,), daemon=True)
+    worker.start()
+    sampler = Sampler()
+    try:
+        for _ in range(20):
+            sampler.sample()
+    finally:
+        stop.set()
+        worker.join()
+
+    names = {key[2] for key in sampler.total_samples}
+    assert "spin" in names
+    assert sampler.samples >= 20
+
+
+def test_profiler_writes_a_report_per_stage(tmp_path):
+    profiler = Profiler(str(tmp_path / "profile"), top=5, interval=0.001)
+    profiler.start()
+    try:
+        for _ in range(2):
+            with profiler.stage("parse"):
+                data = [str(x) * 10 for x in range(20000)]
+                sorted(data)
+    finally:
+        profiler.stop()
+
+    stage = profiler.stages["parse"]
+    assert stage.runs == 2
+    assert stage.peak_memory > 0
+    assert stage.stats.total_calls > 0
+
+    paths = profiler.write_reports()
+    assert sorted(x.rsplit("/", 1)[-1] for x in paths) == ["parse.prof", "parse.txt"]
+    report = (tmp_path / "profile" / "parse.txt").read_text()
+    assert report.startswith("Stage parse: 2 runs")
+    assert "test_profiling.py" in report
+    assert "parse: " in profiler.summary()
+
+
+def test_idle_pool_workers_are_skipped():
+    class Code:
+        def __init__(self, name: str, file_name: str) -> None:
+            self.co_name = name
+            self.co_filename = file_name
+
+    class Frame:
+        def __init__(self, name: str, file_name: str) -> None:
+            self.f_code = Code(name, file_name)
+
+    assert profiling.is_idle(Frame("_worker", "/usr/lib/concurrent/futures/thread.py"))
+    assert profiling.is_idle(Frame("wait", "/usr/lib/threading.py"))
+    assert not profiling.is_idle(Frame("readinto", "/usr/lib/socket.py"))
+
+
+def test_overlapping_stages_share_one_cprofile(tmp_path):
+    profiler = Profiler(str(tmp_path / "profile"), interval=0.001)
+    profiler.start()
+    try:
+        with profiler.stage("discover"):
+            with profiler.stage("download"):
+                sorted(str(x) for x in range(1000))
+    finally:
+        profiler.stop()
+
+    assert profiler.stages["discover"].stats is not None
+    assert profiler.stages["download"].stats is None
+    assert profiler.stages["download"].runs == 1
+    assert not profiling.__cprofile_lock__.locked()
@@ -0,0 +1,86 @@
+import os
+import time
+
+from playstvrecovery import ratelimit
+from playstvrecovery.ratelimit import RateLimiter, parse_retry_after
+
+
+def test_rate_limiter_adapts_to_throttling(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter(rate=4, burst=1, min_rate=1, max_rate=5)
+
+    limiter.record_throttle()
+    assert limiter.rate == 2
+    # The rest of the same burst does not slow down any further
+    for _ in range(15):
+        limiter.record_throttle()
+    assert limiter.rate == 2
+    assert limiter.throttled == 16
+
+    now[0] += 1
+    limiter.record_failure()
+    now[0] += 1
+    limiter.record_failure()
+    assert limiter.rate == 1
+
+    for _ in range(ratelimit.RECOVERY_SUCCESSES):
+        limiter.record_success()
+    assert limiter.rate == 1 + ratelimit.RATE_INCREASE
+
+
+def test_rate_limiter_honours_pause():
+    limiter = RateLimiter(rate=100, burst=5)
+    limiter.pause(0.2)
+
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.19
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("12") == 12
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("soon") is None
+
+
+def test_bandwidth_limiter_holds_streams_to_the_rate(monkeypatch):
+    waits = []
+    monkeypatch.setattr(ratelimit.time, "sleep", waits.append)
+    limiter = ratelimit.BandwidthLimiter(rate=1024**2)
+    burst = limiter.burst
+
+    limiter.consume(burst)
+    assert waits == []
+    limiter.consume(1024**2)
+    assert 0.99 < waits[0] <= 1
+
+    limiter.set_rate(None)
+    limiter.consume(10 * 1024**2)
+    assert len(waits) == 1
+    assert limiter.burst is None
+    assert limiter.transferred == burst + 11 * 1024**2
+    assert limiter.recent_throughput() > 0
+
+
+def test_bandwidth_monitor_applies_control_file(tmp_path):
+    control_file = tmp_path / "bandwidth"
+    control_file.write_text("2.5\n")
+    limiter = ratelimit.BandwidthLimiter()
+    reports = []
+
+    monitor = ratelimit.BandwidthMonitor(
+        limiter, reports.append, control_file=str(control_file)
+    )
+    assert monitor.reload()
+    assert limiter.rate == 2.5 * 1024**2
+    assert not monitor.reload()
+
+    control_file.write_text("")
+    os.utime(control_file, (time.time() + 5, time.time() + 5))
+    assert monitor.reload()
+    assert limiter.rate is None
+
+    monitor.stop()
+    assert reports[-1].startswith("Transferred 0.0 MiB")
@@ -0,0 +1,48 @@
+from threading import Event
+
+import pytest
+
+from playstvrecovery.scheduler import FairScheduler
+
+
+def test_scheduler_takes_work_round_robin_across_keys():
+    scheduler = FairScheduler(1)
+    started = Event()
+    release = Event()
+    order = []
+
+    def blocker() -> None:
+        started.set()
+        release.wait(5)
+
+    def work(name: str) -> str:
+        order.append(name)
+        return name
+
+    scheduler.submit("warmup", blocker)
+    started.wait(5)
+    futures = [scheduler.submit("a", work, f"a{i}") for i in range(4)]
+    futures += [scheduler.submit("b", work, f"b{i}") for i in range(2)]
+    futures += [scheduler.for_key("c").submit(work, "c0")]
+    assert scheduler.pending() == 7
+    assert scheduler.pending("a") == 4
+    release.set()
+
+    assert sorted(x.result(5) for x in futures) == sorted(order)
+    assert order == ["a0", "b0", "c0", "a1", "b1", "a2", "a3"]
+    scheduler.shutdown()
+
+
+def test_scheduler_reports_exceptions_and_rejects_work_after_shutdown():
+    scheduler = FairScheduler(2)
+
+    def fail() -> None:
+        raise ValueError("broken")
+
+    future = scheduler.submit("a", fail)
+    with pytest.raises(ValueError):
+        future.result(5)
+
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.submit("a", fail)
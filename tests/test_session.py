@@ -0,0 +1,63 @@
+from playstvrecovery import session
+from playstvrecovery.ratelimit import RateLimiter
+
+
+def test_session_is_shared_and_configurable():
+    session.configure(pool_size=3, timeout=5, user_agent="test-agent")
+    try:
+        shared_session = session.get_session()
+
+        assert session.get_session() is shared_session
+        assert shared_session.headers["User-Agent"] == "test-agent"
+        adapter = shared_session.get_adapter("https://web.archive.org")
+        assert adapter._pool_maxsize == 3
+    finally:
+        session.configure(
+            pool_size=session.DEFAULT_POOL_SIZE,
+            timeout=session.DEFAULT_TIMEOUT,
+            user_agent=session.DEFAULT_USER_AGENT,
+        )
+    assert session.get_session() is not shared_session
+    assert session.__timeout__ == session.DEFAULT_TIMEOUT
+
+
+def test_request_retries_throttled_responses(monkeypatch):
+    responses = [
+        session.to_response("https://web.archive.org", 429, b""),
+        session.to_response("https://web.archive.org", 503, b""),
+        session.to_response("https://web.archive.org", 200, b"ok"),
+    ]
+    responses[0].headers["Retry-After"] = "7"
+    waits = []
+
+    class FakeSession:
+        def request(self, method, url, **kwargs):
+            return responses.pop(0)
+
+    limiter = RateLimiter(rate=100)
+    monkeypatch.setattr(session, "get_session", FakeSession)
+    monkeypatch.setattr(session, "sleep", waits.append)
+    monkeypatch.setattr(limiter, "pause", lambda seconds: None)
+    session.set_rate_limiter(limiter)
+
+    assert session.request("GET", "https://web.archive.org").content == b"ok"
+    assert waits[0] >= 7
+    assert limiter.throttled == 2
+    assert limiter.successes == 1
+
+    session.set_rate_limiter(RateLimiter())
+
+
+def test_request_records_a_throttled_last_attempt(monkeypatch):
+    class FakeSession:
+        def request(self, method, url, **kwargs):
+            return session.to_response("https://web.archive.org", 429, b"")
+
+    limiter = RateLimiter(rate=100)
+    monkeypatch.setattr(session, "get_session", FakeSession)
+    monkeypatch.setattr(session, "__rate_limiter__", limiter)
+    monkeypatch.setattr(session, "__max_retries__", 0)
+
+    assert session.request("GET", "https://web.archive.org").status_code == 429
+    assert limiter.throttled == 1
+    assert limiter.successes == 0
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from playstvrecovery.extract import find_video_sources
+from playstvrecovery.sources import (
+    PREFER_SMALLEST,
+    SourcePolicy,
+    resolution_of,
+)
+
+fixtures_path = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def embed_sources() -> list[dict[str, str]]:
+    with open(os.path.join(fixtures_path, "embed.html"), encoding="utf-8") as file:
+        return find_video_sources(file.read())
+
+
+def resolutions(sources: list[dict[str, str]]) -> list[str]:
+    return [x["res"] for x in sources]
+
+
+def test_sources_are_ranked_by_resolution():
+    assert resolutions(SourcePolicy().rank(embed_sources())) == ["1080", "720", "480"]
+    assert resolutions(SourcePolicy(PREFER_SMALLEST).rank(embed_sources())) == [
+        "480",
+        "720",
+        "1080",
+    ]
+
+
+def test_max_resolution_leaves_out_larger_sources():
+    policy = SourcePolicy(max_resolution=720)
+    assert resolutions(policy.rank(embed_sources())) == ["720", "480"]
+
+    # Without a source small enough the smallest one is kept
+    assert resolutions(SourcePolicy(max_resolution=240).rank(embed_sources())) == ["480"]
+
+
+def test_choose_returns_absolute_url_of_best_source():
+    source, url, size = SourcePolicy().choose(embed_sources(), lambda src: "https:" + src)
+
+    assert source["res"] == "1080"
+    assert url.startswith("https://web.archive.org/") and url.endswith("1080.mp4")
+    assert size is None
+
+
+def test_probed_sizes_decide_and_unreachable_sources_are_skipped():
+    sizes = {"1080": None, "720": 5_000_000, "480": 6_000_000}
+
+    def probe(url: str) -> int | None:
+        return sizes[url.rsplit("/", 1)[-1].split(".")[0]]
+
+    largest = SourcePolicy(probe_size=True, probe=probe)
+    smallest = SourcePolicy(PREFER_SMALLEST, probe_size=True, probe=probe)
+
+    assert largest.choose(embed_sources(), str)[0]["res"] == "480"
+    assert smallest.choose(embed_sources(), str)[2] == 5_000_000
+    assert SourcePolicy(probe_size=True, probe=lambda url: None).choose(
+        embed_sources(), str
+    ) is None
+
+
+@pytest.mark.parametrize(
+    "res, expected", [("720", 720), ("1080p", 1080), ("", 0), (None, 0)]
+)
+def test_resolution_of(res, expected):
+    assert resolution_of({"res": res}) == expected
+
+
+def test_unknown_preference_is_rejected():
+    with pytest.raises(ValueError):
+        SourcePolicy("fastest")
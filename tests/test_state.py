@@ -0,0 +1,33 @@
+from playstvrecovery import state
+from playstvrecovery.playstv import UserProfile, Video
+from playstvrecovery.state import JobState
+
+
+def test_job_state_resumes_profile(tmp_path):
+    user_profile = UserProfile("someone")
+    user_profile.__user_id__ = "42"
+    user_profile.archive_url = "https://web.archive.org/web/1/https://plays.tv/u/someone"
+    user_profile.videos = [Video(str(i), f"clip {i}", "") for i in range(3)]
+    user_profile.videos[0].valid = True
+    user_profile.videos[1].valid = True
+
+    job_state = JobState(str(tmp_path))
+    assert job_state.load_profile("someone") is None
+    job_state.save_profile(user_profile, state.STAGE_RESOLVED)
+
+    user_profile.videos[0].download_succeeded = True
+    user_profile.videos[0].downloaded_bytes = 1234
+    job_state.save_video("someone", user_profile.videos[0])
+    job_state.close()
+
+    job_state = JobState(str(tmp_path))
+    restored = job_state.load_profile("someone")
+
+    assert job_state.reached("someone", state.STAGE_DISCOVERED)
+    assert not job_state.reached("someone", state.STAGE_DOWNLOADED)
+    assert restored.__user_id__ == "42"
+    assert [x.id for x in restored.videos] == ["0", "1", "2"]
+    assert [x.valid for x in restored.videos] == [True, True, False]
+    assert restored.videos[0].download_succeeded
+    assert restored.videos[0].downloaded_bytes == 1234
+    assert restored.videos[1].download_succeeded is None
@@ -0,0 +1,107 @@
+import hashlib
+import os
+
+from playstvrecovery import playstv, store
+from playstvrecovery.playstv import Video
+from playstvrecovery.store import ContentStore, source_key
+
+payload = os.urandom(10_000)
+digest = hashlib.sha256(payload).hexdigest()
+
+
+def serve(monkeypatch) -> list[str]:
+    downloads = []
+
+    def fake_download(url, file_path, on_digest=None, **kwargs):
+        downloads.append(url)
+        with open(file_path, "wb") as file:
+            file.write(payload)
+        if on_digest is not None:
+            on_digest(digest)
+        return len(payload)
+
+    monkeypatch.setattr(store, "download_file", fake_download)
+    return downloads
+
+
+def test_second_user_gets_a_link_to_the_stored_file(monkeypatch, tmp_path):
+    downloads = serve(monkeypatch)
+    content_store = ContentStore(str(tmp_path / store.STORE_DIR_NAME))
+    (tmp_path / "alice").mkdir()
+    (tmp_path / "bob").mkdir()
+    url = "https://web.archive.org/web/20191210id_/https://cdn/abc/720.mp4"
+    other_capture = "https://web.archive.org/web/20191211id_/https://cdn/abc/720.mp4"
+
+    first = content_store.fetch(url, str(tmp_path / "alice" / "clip [abc].mp4"))
+    second = content_store.fetch(
+        other_capture, str(tmp_path / "bob" / "clip [abc].mp4")
+    )
+
+    assert first == second == len(payload)
+    assert downloads == [url]
+    assert content_store.__url_locks__ == {}
+    blob = os.stat(content_store.blob_path(digest))
+    assert blob.st_nlink == 3
+    assert os.stat(tmp_path / "bob" / "clip [abc].mp4").st_ino == blob.st_ino
+    assert (tmp_path / "bob" / "clip [abc].mp4").read_bytes() == payload
+
+
+def test_same_content_from_another_url_is_stored_once(monkeypatch, tmp_path):
+    downloads = serve(monkeypatch)
+    content_store = ContentStore(str(tmp_path / "store"))
+
+    content_store.fetch("https://cdn/a.mp4", str(tmp_path / "a.mp4"))
+    content_store.fetch("https://cdn/b.mp4", str(tmp_path / "b.mp4"))
+
+    assert downloads == ["https://cdn/a.mp4", "https://cdn/b.mp4"]
+    assert os.stat(tmp_path / "a.mp4").st_ino == os.stat(tmp_path / "b.mp4").st_ino
+    assert content_store.lookup("https://cdn/b.mp4") == digest
+
+
+def test_index_survives_a_restart_and_ignores_lost_files(monkeypatch, tmp_path):
+    serve(monkeypatch)
+    content_store = ContentStore(str(tmp_path / "store"))
+    content_store.fetch("https://cdn/a.mp4", str(tmp_path / "a.mp4"))
+    content_store.close()
+
+    reopened = ContentStore(str(tmp_path / "store"))
+    assert reopened.lookup("https://cdn/a.mp4") == digest
+    os.remove(reopened.blob_path(digest))
+    assert reopened.lookup("https://cdn/a.mp4") is None
+
+
+def test_store_turns_off_without_hard_links(monkeypatch, tmp_path):
+    downloads = serve(monkeypatch)
+    warnings = []
+    monkeypatch.setattr(
+        playstv, "structured_warning", lambda *args: warnings.append(args)
+    )
+    content_store = ContentStore(str(tmp_path / "store"))
+
+    def no_link(source_path, link_path):
+        raise OSError("hard links not supported")
+
+    monkeypatch.setattr(os, "link", no_link)
+    content_store.fetch("https://cdn/a.mp4", str(tmp_path / "a.mp4"))
+    content_store.fetch("https://cdn/a.mp4", str(tmp_path / "b.mp4"))
+
+    # The downloads stay where they were asked for, the store keeps no copy
+    assert (tmp_path / "a.mp4").read_bytes() == payload
+    assert (tmp_path / "b.mp4").read_bytes() == payload
+    assert not os.path.exists(content_store.blob_path(digest))
+    assert content_store.lookup("https://cdn/a.mp4") is None
+    assert downloads == ["https://cdn/a.mp4", "https://cdn/a.mp4"]
+    assert not content_store.hard_links
+    assert len(warnings) == 1
+
+
+def test_source_key_drops_the_capture_timestamp():
+    assert source_key("https://web.archive.org/web/2019id_/https://cdn/a.mp4") == (
+        "https://cdn/a.mp4"
+    )
+    assert source_key("https://cdn/a.mp4") == "https://cdn/a.mp4"
+
+
+def test_file_names_keep_clips_with_the_same_title_apart():
+    assert Video("abc", "GG: 1v5?", "").file_name == "GG_ 1v5_ [abc].mp4"
+    assert Video("abc", "a/b", "").file_name != Video("def", "a/b", "").file_name
@@ -0,0 +1,158 @@
+import json
+from threading import Event, Thread
+
+from playstvrecovery import wayback
+from playstvrecovery.wayback import SnapshotIndex
+
+
+class FakeResponse:
+    def __init__(self, rows: list) -> None:
+        self.text = json.dumps(rows)
+
+    def json(self) -> list:
+        return json.loads(self.text)
+
+    def raise_for_status(self) -> None:
+        pass
+
+
+def test_snapshot_index_follows_resume_key(monkeypatch):
+    pages = [
+        [
+            ["original", "timestamp"],
+            ["https://plays.tv/embeds/abc", "20191209120000"],
+            ["https://plays.tv/embeds/abc", "20191210170500"],
+            [],
+            ["resume-1"],
+        ],
+        [
+            ["original", "timestamp"],
+            ["https://plays.tv/embeds/def?autoplay=1", "20191211000000"],
+        ],
+    ]
+    requested_params = []
+
+    def fake_get(url, params=None, **kwargs):
+        requested_params.append(dict(params))
+        return FakeResponse(pages[len(requested_params) - 1])
+
+    monkeypatch.setattr(wayback.session, "get", fake_get)
+    index = SnapshotIndex()
+
+    assert index.load() == 2
+    assert index.timestamp_for("abc") == "20191210170500"
+    assert index.timestamp_for("def") == "20191211000000"
+    assert index.timestamp_for("missing") is None
+    assert requested_params[1]["resumeKey"] == "resume-1"
+    assert index.complete
+
+
+def test_snapshot_index_cut_off_by_max_pages_is_not_complete(monkeypatch):
+    page = [
+        ["original", "timestamp"],
+        ["https://plays.tv/embeds/abc", "20191210170500"],
+        [],
+        ["resume-1"],
+    ]
+    monkeypatch.setattr(
+        wayback.session, "get", lambda url, **kwargs: FakeResponse(page)
+    )
+    index = SnapshotIndex(max_pages=1)
+
+    assert index.load() == 1
+    assert index.loaded
+    assert not index.complete
+
+
+def test_archive_url_builder_and_raw_mode():
+    replay_url = "https://web.archive.org/web/20191210043532/https://plays.tv/u/someone"
+
+    assert wayback.parse_archive_url(replay_url) == (
+        "20191210043532",
+        "https://plays.tv/u/someone",
+    )
+    assert wayback.fetch_url(replay_url) == replay_url
+
+    wayback.set_raw_mode(True)
+    try:
+        assert wayback.fetch_url(replay_url) == (
+            "https://web.archive.org/web/20191210043532id_/https://plays.tv/u/someone"
+        )
+        assert wayback.build_archive_url("https://plays.tv/x", "1", raw=False) == (
+            "https://web.archive.org/web/1/https://plays.tv/x"
+        )
+    finally:
+        wayback.set_raw_mode(False)
+
+
+def test_source_url_points_into_archive():
+    page_url = "https://web.archive.org/web/20191210043532/https://plays.tv/embeds/abc"
+    replayed = "//web.archive.org/web/20191210043532/https://cdn.example/abc/720.mp4"
+
+    assert wayback.source_url(replayed, page_url) == f"https:{replayed}"
+    assert wayback.source_url("//cdn.example/abc/720.mp4", page_url) == (
+        "https://web.archive.org/web/20191210043532id_/https://cdn.example/abc/720.mp4"
+    )
+
+
+def test_set_base_url_moves_every_endpoint():
+    wayback.set_base_url("http://127.0.0.1:8080/")
+    try:
+        assert wayback.build_archive_url("https://plays.tv/x", "1", raw=False) == (
+            "http://127.0.0.1:8080/web/1/https://plays.tv/x"
+        )
+        assert wayback.CDX_ENDPOINT == "http://127.0.0.1:8080/cdx/search/cdx"
+        assert wayback.AVAILABILITY_ENDPOINT == (
+            "http://127.0.0.1:8080/wayback/available"
+        )
+        assert wayback.parse_archive_url(
+            "http://127.0.0.1:8080/web/1id_/https://plays.tv/x"
+        ) == ("1", "https://plays.tv/x")
+    finally:
+        wayback.set_base_url(
+            "https://web.archive.org", "https://archive.org/wayback/available"
+        )
+
+
+def test_timestamp_finder_lists_one_users_captures_around_target(monkeypatch):
+    requested_params = []
+
+    def fake_get(url, params=None, **kwargs):
+        requested_params.append(dict(params))
+        return FakeResponse([["original", "timestamp"], ["x", "20191204000000"]])
+
+    monkeypatch.setattr(wayback.session, "get", fake_get)
+    finder = wayback.TimestampFinder("plays.tv/ws/module")
+
+    assert finder.candidates("20191205120000", user_id="42") == ["20191204000000"]
+    finder.candidates("20191205120000", user_id="42")
+
+    (params,) = requested_params
+    assert params["from"] == "20191202120000"
+    assert params["to"] == "20191208120000"
+    assert params["filter"] == [
+        "statuscode:200",
+        "original:.*[?&]target_user_id=42(&.*)?",
+    ]
+
+
+def test_timestamp_finder_lists_users_without_waiting_for_each_other():
+    slow_listing = Event()
+
+    def list_captures(target: str, user_id: str | None) -> list[str]:
+        if user_id == "slow":
+            slow_listing.wait(5)
+        return [f"2019120{len(user_id or '')}000000"]
+
+    finder = wayback.TimestampFinder("plays.tv/ws/module", list_captures=list_captures)
+    slow = Thread(target=finder.candidates, args=("20191205120000", None, "slow"))
+    slow.start()
+    try:
+        assert finder.candidates("20191205120000", user_id="42") == ["20191202000000"]
+    finally:
+        slow_listing.set()
+        slow.join()
+
+    finder.remember("20191202000000", "42")
+    assert finder.first("20191205120000", "42") == "20191202000000"
+    assert finder.first("20191205120000", "43") == "20191205120000"
@@ -0,0 +1,68 @@
+import hashlib
+from io import BytesIO
+import os
+
+from playstvrecovery.writer import PartFile, reads_into
+
+payload = os.urandom(100_000)
+
+
+class FakeResponse:
+    def __init__(self, body: bytes, headers: dict | None = None) -> None:
+        self.raw = BytesIO(body)
+        self.headers = headers or {}
+
+    def iter_content(self, chunk_size: int):
+        while chunk := self.raw.read(chunk_size):
+            yield chunk
+
+
+def test_stream_copies_raw_body_at_offsets(tmp_path):
+    part_path = str(tmp_path / "clip.mp4.part")
+    file_path = str(tmp_path / "clip.mp4")
+    written = []
+
+    with PartFile(part_path, size=len(payload), buffer_size=64 * 1024) as part_file:
+        assert os.path.getsize(part_path) == len(payload)
+        part_file.stream(FakeResponse(payload[60_000:]), 60_000)
+        copied = part_file.stream(
+            FakeResponse(payload), 0, limit=60_000, on_write=written.append
+        )
+        part_file.commit(file_path)
+
+    assert copied == 60_000
+    assert sum(written) == 60_000
+    assert not os.path.exists(part_path)
+    with open(file_path, "rb") as file:
+        assert file.read() == payload
+
+
+def test_allocate_keeps_existing_bytes(tmp_path):
+    part_path = str(tmp_path / "clip.mp4.part")
+    with open(part_path, "wb") as file:
+        file.write(payload[:1000])
+
+    with PartFile(part_path, size=len(payload)):
+        pass
+
+    with open(part_path, "rb") as file:
+        assert file.read(1000) == payload[:1000]
+    assert os.path.getsize(part_path) == len(payload)
+
+
+def test_encoded_bodies_are_decoded_through_iter_content():
+    assert reads_into(FakeResponse(b""))
+    assert not reads_into(FakeResponse(b"", {"Content-Encoding": "gzip"}))
+
+
+def test_digest_covers_ranges_written_out_of_order(tmp_path):
+    part_path = str(tmp_path / "clip.mp4.part")
+
+    with PartFile(
+        part_path, size=len(payload), buffer_size=64 * 1024, algorithm="sha256"
+    ) as part_file:
+        part_file.stream(FakeResponse(payload[60_000:]), 60_000)
+        part_file.stream(FakeResponse(payload), 0, limit=60_000)
+        digest = part_file.commit(str(tmp_path / "clip.mp4"))
+
+    assert digest == hashlib.sha256(payload).hexdigest()